@@ -0,0 +1,132 @@
+'''
+Created on 19.10.2026
+
+Provides a generator of synthetic data for the benchmarks of the database API
+'''
+
+import random
+import sqlite3
+
+TOPICS = ['sports', 'music', 'physics', 'maths', 'biology', 'travel']
+FIRST_DEADLINE = 1519172121
+DEADLINE_STEP = 3600
+
+
+class DataGenerator(object):
+    '''
+    Fills a Goalz database with synthetic users, goals and resources.
+
+    Goals of every user are organised in chains of ``depth`` goals, where
+    each goal is the parent of the next one. Every goal gets
+    ``resources_per_goal`` resources.
+
+    :param int users: number of users.
+    :param int goals_per_user: number of goals of every user.
+    :param int depth: depth of the goal trees (1 means no sub-goals).
+    :param int resources_per_goal: number of resources of every goal.
+    :param int seed: seed of the random generator, so data is reproducible.
+    '''
+
+    def __init__(self, users=1000, goals_per_user=10, depth=3,
+                 resources_per_goal=2, seed=0):
+        super(DataGenerator, self).__init__()
+        self.users = users
+        self.goals_per_user = goals_per_user
+        self.depth = max(depth, 1)
+        self.resources_per_goal = resources_per_goal
+        self.seed = seed
+
+    @property
+    def goals(self):
+        '''
+        :return: total number of goals generated (int)
+        '''
+        return self.users * self.goals_per_user
+
+    @property
+    def resources(self):
+        '''
+        :return: total number of resources generated (int)
+        '''
+        return self.goals * self.resources_per_goal
+
+    def populate(self, db_path):
+        '''
+        Insert the synthetic data into the database, which must have been
+        created with :py:meth:`Engine.create_tables` and be empty.
+
+        :param str db_path: path of the database file.
+        '''
+
+        rng = random.Random(self.seed)
+        con = sqlite3.connect(db_path)
+        try:
+            with con:
+                con.execute('PRAGMA foreign_keys = ON')
+                con.executemany(
+                    'INSERT INTO users (user_id, nickname, registration_date, \
+                     password) VALUES(?,?,?,?)',
+                    ((user_id, self.nickname(user_id),
+                      FIRST_DEADLINE - rng.randint(0, 10 ** 8), 'password')
+                     for user_id in range(1, self.users + 1)))
+                con.executemany(
+                    'INSERT INTO user_profile (user_id, firstname, lastname, \
+                     email, website, rating, age, gender) \
+                     VALUES(?,?,?,?,?,?,?,?)',
+                    ((user_id, 'First%d' % user_id, 'Last%d' % user_id,
+                      'user%d@goalz.com' % user_id, None, rng.random(),
+                      rng.randint(16, 80), rng.choice('MF'))
+                     for user_id in range(1, self.users + 1)))
+                con.executemany(
+                    'INSERT INTO goals (goal_id, parent_id, user_id, title, \
+                     topic, description, deadline, status) \
+                     VALUES(?,?,?,?,?,?,?,?)', self._goal_rows(rng))
+                con.executemany(
+                    'INSERT INTO resources (goal_id, user_id, title, link, \
+                     topic, description, required_time, rating) \
+                     VALUES(?,?,?,?,?,?,?,?)', self._resource_rows(rng))
+        finally:
+            con.close()
+
+    def nickname(self, user_id):
+        '''
+        :return: the nickname of the generated user with the given id (str)
+        '''
+        return 'user%d' % user_id
+
+    def user_of_goal(self, goal_id):
+        '''
+        :return: the id of the generated user owning the given goal (int)
+        '''
+        return (goal_id - 1) // self.goals_per_user + 1
+
+    def root_goals(self):
+        '''
+        :return: list with the ids of the goals without parent
+        '''
+        return [goal_id for goal_id in range(1, self.goals + 1)
+                if self._level(goal_id) == 0]
+
+    # HELPERS
+    def _level(self, goal_id):
+        '''
+        :return: depth of the goal in its tree, 0 for the root.
+        '''
+        return ((goal_id - 1) % self.goals_per_user) % self.depth
+
+    def _goal_rows(self, rng):
+        for goal_id in range(1, self.goals + 1):
+            parent_id = goal_id - 1 if self._level(goal_id) > 0 else None
+            yield (goal_id, parent_id, self.user_of_goal(goal_id),
+                   'Goal %d' % goal_id, rng.choice(TOPICS),
+                   'Description of goal %d' % goal_id,
+                   FIRST_DEADLINE + rng.randint(0, 10 ** 4) * DEADLINE_STEP,
+                   rng.choice((0, 0, 0.5, 1)))
+
+    def _resource_rows(self, rng):
+        for index in range(self.resources):
+            goal_id = index // self.resources_per_goal + 1
+            yield (goal_id, rng.randint(1, self.users), 'Resource %d' % index,
+                   'https://goalz.com/resources/%d' % index, rng.choice(TOPICS),
+                   'Description of resource %d' % index, rng.randint(1, 120),
+                   rng.random())
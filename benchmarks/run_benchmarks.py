@@ -0,0 +1,230 @@
+'''
+Created on 19.10.2026
+
+This scripts runs the benchmark scenarios of the database API and reports
+the latency percentiles and the throughput of every scenario as JSON.
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json
+    python -m benchmarks.run_benchmarks --in-memory --compare bench.json
+    python -m benchmarks.run_benchmarks --soft-delete --compare bench.json
+
+With --compare, the results are compared against a stored baseline and the
+script exits with status 1 if a scenario regressed by more than --threshold.
+
+WARNING: the script creates and removes the database files given with
+         the option --db (db/goalz_benchmark.db by default)
+'''
+
+import argparse
+import json
+import shutil
+import sys
+import threading
+import time
+
+from src.db.engine import Engine
+from benchmarks.data_generator import DataGenerator
+from benchmarks.scenarios import SCENARIOS, BenchmarkContext, new_random
+
+
+def percentile(values, fraction):
+    '''
+    :return: the value below which the given fraction of the sorted values is.
+    '''
+
+    if not values:
+        return 0.0
+    index = min(int(round(fraction * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+class BenchmarkRunner(object):
+    '''
+    Runs the scenarios on a copy of a database filled with synthetic data.
+
+    :param generator: the :py:class:`DataGenerator` used to fill the database.
+    :param str db_path: path of the database file used by the scenarios.
+    :param int iterations: number of operations of every scenario.
+    :param int threads: number of threads running the operations, each one
+        with its own Connection.
+    :param dict engine_options: Default None. Keyword arguments used to create
+        the :py:class:`Engine`.
+    '''
+
+    def __init__(self, generator, db_path, iterations=1000, threads=1,
+                 engine_options=None):
+        super(BenchmarkRunner, self).__init__()
+        self.generator = generator
+        self.db_path = db_path
+        self.base_path = db_path + '.base'
+        self.iterations = iterations
+        self.threads = threads
+        self.engine_options = engine_options or {}
+
+    def prepare(self):
+        '''
+        Create the database with the synthetic data.
+        '''
+
+        base = Engine(self.base_path)
+        base.remove_database()
+        base.create_tables()
+        self.generator.populate(self.base_path)
+
+    def cleanup(self):
+        '''
+        Remove the database files.
+        '''
+
+        Engine(self.base_path).remove_database()
+        Engine(self.db_path).remove_database()
+
+    def run(self, scenarios):
+        '''
+        Run the scenarios, each one on a fresh copy of the database.
+
+        :return: dictionary with the results of every scenario.
+        '''
+
+        results = {}
+        for scenario in scenarios:
+            Engine(self.db_path).remove_database()
+            shutil.copyfile(self.base_path, self.db_path)
+            results[scenario.name] = self.run_scenario(scenario)
+        return results
+
+    def run_scenario(self, scenario):
+        '''
+        :return: dictionary with the number of operations, the operations per
+            second and the p50, p95 and p99 latencies in milliseconds.
+        '''
+
+        engine = Engine(self.db_path, **self.engine_options)
+        context = BenchmarkContext(self.generator)
+        total = scenario.iterations(self.iterations, self.generator)
+        latencies = [[] for _ in range(self.threads)]
+        errors = []
+
+        def worker(thread):
+            rng = new_random(self.generator.seed, thread)
+            connection = engine.connect()
+            timings = latencies[thread]
+            try:
+                for _ in range(thread, total, self.threads):
+                    start = time.perf_counter()
+                    scenario.operation(connection, context, rng)
+                    timings.append(time.perf_counter() - start)
+            except Exception as excp:
+                errors.append(excp)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(thread,))
+                   for thread in range(self.threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        close = getattr(engine, 'close', None)
+        if close is not None:
+            close()
+        if errors:
+            raise errors[0]
+        values = sorted(value for timings in latencies for value in timings)
+        return {'operations': len(values),
+                'ops_per_sec': len(values) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000}
+
+
+def compare(results, baseline, threshold):
+    '''
+    Compare the results against a baseline.
+
+    :return: list of messages describing the regressions.
+    '''
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result['ops_per_sec'] < old['ops_per_sec'] * (1 - threshold):
+            regressions.append('%s: %.0f ops/s (baseline %.0f ops/s)' %
+                               (name, result['ops_per_sec'], old['ops_per_sec']))
+        if result['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append('%s: p95 %.3f ms (baseline %.3f ms)' %
+                               (name, result['p95_ms'], old['p95_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the database API')
+    parser.add_argument('--db', default='db/goalz_benchmark.db')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--goals-per-user', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--resources-per-goal', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--scenarios', nargs='*',
+                        help='names of the scenarios to run (all by default)')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='serve the connections from memory')
+    parser.add_argument('--max-unsaved-seconds', type=float,
+                        help='persistence period of the in-memory mode')
+    parser.add_argument('--soft-delete', action='store_true',
+                        help='tombstone the deleted rows')
+    parser.add_argument('--output', help='file where the results are stored')
+    parser.add_argument('--compare', help='baseline results file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change considered a regression')
+    args = parser.parse_args(argv)
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.scenarios or scenario.name in args.scenarios]
+    generator = DataGenerator(args.users, args.goals_per_user, args.depth,
+                              args.resources_per_goal, args.seed)
+    engine_options = {}
+    if args.in_memory:
+        engine_options = {'in_memory': True,
+                          'max_unsaved_seconds': args.max_unsaved_seconds}
+    if args.soft_delete:
+        engine_options['soft_delete'] = True
+    runner = BenchmarkRunner(generator, args.db, args.iterations, args.threads,
+                             engine_options)
+    runner.prepare()
+    try:
+        results = runner.run(scenarios)
+    finally:
+        runner.cleanup()
+
+    report = {'parameters': {'users': args.users,
+                             'goals_per_user': args.goals_per_user,
+                             'depth': args.depth,
+                             'resources_per_goal': args.resources_per_goal,
+                             'iterations': args.iterations,
+                             'threads': args.threads,
+                             'in_memory': args.in_memory,
+                             'soft_delete': args.soft_delete},
+              'results': results}
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print('REGRESSION %s' % message, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
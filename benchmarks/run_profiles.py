@@ -0,0 +1,85 @@
+'''
+Created on 19.10.2026
+
+This scripts runs the benchmark scenarios of the database API once with the
+default configuration of SQLite and once per performance profile of the
+Engine, and reports the throughput of every scenario per profile.
+
+    python -m benchmarks.run_profiles --users 5000 --output profiles.json
+
+Before running the scenarios of a profile, the database is rebuilt with the
+page size of the profile.
+
+WARNING: the script creates and removes the database files given with
+         the option --db (db/goalz_benchmark.db by default)
+'''
+
+import argparse
+import json
+import sys
+
+from src.db import constants
+from src.db.engine import Engine
+from benchmarks.data_generator import DataGenerator
+from benchmarks.run_benchmarks import BenchmarkRunner
+from benchmarks.scenarios import SCENARIOS
+
+DEFAULT = 'default'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the performance profiles of the Engine')
+    parser.add_argument('--db', default='db/goalz_benchmark.db')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--goals-per-user', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--resources-per-goal', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--scenarios', nargs='*',
+                        help='names of the scenarios to run (all by default)')
+    parser.add_argument('--profiles', nargs='*',
+                        help='names of the profiles to run (all by default)')
+    parser.add_argument('--output', help='file where the results are stored')
+    args = parser.parse_args(argv)
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.scenarios or scenario.name in args.scenarios]
+    profiles = args.profiles or sorted(constants.PERFORMANCE_PROFILES)
+    generator = DataGenerator(args.users, args.goals_per_user, args.depth,
+                              args.resources_per_goal, args.seed)
+    runner = BenchmarkRunner(generator, args.db, args.iterations, args.threads)
+    runner.prepare()
+    results = {}
+    try:
+        results[DEFAULT] = runner.run(scenarios)
+        for profile in profiles:
+            Engine(runner.base_path).set_performance_profile(profile,
+                                                             rebuild=True)
+            runner.engine_options = {'performance_profile': profile}
+            results[profile] = runner.run(scenarios)
+    finally:
+        runner.cleanup()
+
+    names = [DEFAULT] + profiles
+    print('%-24s' % 'ops/s' + ''.join('%13s' % name for name in names))
+    for scenario in scenarios:
+        print('%-24s' % scenario.name +
+              ''.join('%13.0f' % results[name][scenario.name]['ops_per_sec']
+                      for name in names))
+    if args.output:
+        report = {'parameters': {'users': args.users,
+                                 'goals_per_user': args.goals_per_user,
+                                 'depth': args.depth,
+                                 'resources_per_goal': args.resources_per_goal,
+                                 'iterations': args.iterations,
+                                 'threads': args.threads},
+                  'results': results}
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
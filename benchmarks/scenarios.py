@@ -0,0 +1,231 @@
+'''
+Created on 19.10.2026
+
+Provides the benchmark scenarios of the database API
+
+Every scenario executes a single operation through a Connection. The operation
+receives the Connection, the :py:class:`BenchmarkContext` and a random
+generator.
+'''
+
+import itertools
+import random
+
+from benchmarks.data_generator import FIRST_DEADLINE, DEADLINE_STEP
+
+
+class BenchmarkContext(object):
+    '''
+    Data shared by the operations of a scenario.
+
+    :param generator: the :py:class:`DataGenerator` used to fill the database.
+    '''
+
+    def __init__(self, generator):
+        super(BenchmarkContext, self).__init__()
+        self.generator = generator
+        self._counters = {}
+        self._root_goals = None
+
+    def next(self, name, start=1):
+        '''
+        :return: the next value of a counter shared by all the threads. Used to
+            pick rows which can only be used once, such as deleted rows.
+        '''
+
+        counter = self._counters.setdefault(name, itertools.count(start))
+        return next(counter)
+
+    def root_goal(self):
+        '''
+        :return: a different root goal at every call.
+        '''
+
+        if self._root_goals is None:
+            self._root_goals = self.generator.root_goals()
+        return self._root_goals[self.next('root_goal', 0)]
+
+    def user_id(self, rng):
+        return rng.randint(1, self.generator.users)
+
+    def goal_id(self, rng):
+        return rng.randint(1, self.generator.goals)
+
+    def resource_id(self, rng):
+        return rng.randint(1, self.generator.resources)
+
+
+class Scenario(object):
+    '''
+    Named benchmark operation.
+
+    :param str name: name of the scenario.
+    :param operation: function executing one operation.
+    :param int limit: Default None. Maximum number of operations, for scenarios
+        consuming rows of the database.
+    '''
+
+    def __init__(self, name, operation, limit=None):
+        super(Scenario, self).__init__()
+        self.name = name
+        self.operation = operation
+        self.limit = limit
+
+    def iterations(self, requested, generator):
+        '''
+        :return: the number of operations to run.
+        '''
+
+        if self.limit is None:
+            return requested
+        return min(requested, self.limit(generator))
+
+
+# READ OPERATIONS
+def get_user(con, ctx, rng):
+    con.get_user(ctx.user_id(rng))
+
+def get_user_if_changed(con, ctx, rng):
+    con.get_user_if_changed(ctx.user_id(rng), 1)
+
+def get_user_by_nickname(con, ctx, rng):
+    con.get_user(nickname=ctx.generator.nickname(ctx.user_id(rng)))
+
+def get_user_public(con, ctx, rng):
+    con.get_user_public(ctx.user_id(rng))
+
+def get_users(con, ctx, rng):
+    con.get_users()
+
+def get_users_page(con, ctx, rng):
+    # The second page, the cursors being returned by the previous page
+    sort_by = rng.choice(('nickname', 'registration_date', 'rating'))
+    con.get_users(20, sort_by, after=con.get_users(20, sort_by).cursor)
+
+def get_user_id(con, ctx, rng):
+    con.get_user_id(ctx.generator.nickname(ctx.user_id(rng)))
+
+def get_goal(con, ctx, rng):
+    con.get_goal(ctx.goal_id(rng))
+
+def get_goal_if_changed(con, ctx, rng):
+    # The generated goals are at their first version until they are modified
+    con.get_goal_if_changed(ctx.goal_id(rng), 1)
+
+def get_goals_of_user(con, ctx, rng):
+    con.get_goals(user_id=ctx.user_id(rng))
+
+def get_goals_window(con, ctx, rng):
+    after = rng.randint(FIRST_DEADLINE, FIRST_DEADLINE + 10 ** 4 * DEADLINE_STEP)
+    con.get_goals(after=after, before=after + 24 * DEADLINE_STEP,
+                  number_of_goals=50)
+
+def get_due_goals(con, ctx, rng):
+    start = rng.randint(FIRST_DEADLINE, FIRST_DEADLINE + 10 ** 4 * DEADLINE_STEP)
+    for _ in con.get_due_goals(start, start + 24 * DEADLINE_STEP):
+        pass
+
+def get_resource(con, ctx, rng):
+    con.get_resource(ctx.resource_id(rng))
+
+def get_resources_of_goal(con, ctx, rng):
+    con.get_resources(goal_id=ctx.goal_id(rng))
+
+def get_resources_of_user(con, ctx, rng):
+    con.get_resources(user_id=ctx.user_id(rng), number_of_resource=20)
+
+# WRITE OPERATIONS
+def create_user(con, ctx, rng):
+    nickname = 'new_user%d' % ctx.next('create_user')
+    con.create_user(nickname, {'firstname': 'New', 'lastname': 'User',
+                               'email': nickname + '@goalz.com',
+                               'password': 'password', 'age': 30})
+
+def create_goal(con, ctx, rng):
+    con.create_goal(ctx.user_id(rng), 'New goal', 'sports', 'Description',
+                    ctx.goal_id(rng), FIRST_DEADLINE)
+
+def create_resource(con, ctx, rng):
+    con.create_resource(ctx.goal_id(rng), ctx.user_id(rng), 'New resource',
+                        'https://goalz.com', 'sports', 'Description', 10)
+
+def modify_user(con, ctx, rng):
+    con.modify_user(ctx.user_id(rng), {'password': 'password',
+                                       'firstname': 'Modified',
+                                       'lastname': 'User',
+                                       'email': 'modified@goalz.com',
+                                       'age': 31, 'gender': 'F',
+                                       'website': None})
+
+def modify_goal(con, ctx, rng):
+    con.modify_goal(ctx.goal_id(rng), status=rng.choice((0, 0.5, 1)))
+
+def modify_resource(con, ctx, rng):
+    con.modify_resource(ctx.resource_id(rng), rng.random())
+
+def delete_resource(con, ctx, rng):
+    con.delete_resource(ctx.next('delete_resource'))
+
+def delete_goal(con, ctx, rng):
+    con.delete_goal(ctx.root_goal())
+
+def delete_user(con, ctx, rng):
+    con.delete_user(ctx.next('delete_user'))
+
+# MIXED OPERATIONS
+READS = [get_user, get_user_public, get_goal, get_goals_of_user, get_resource,
+         get_resources_of_goal]
+WRITES = [create_goal, create_resource, modify_goal, modify_resource]
+
+def mixed(read_ratio):
+    '''
+    :return: an operation executing a random read with probability
+        ``read_ratio`` and a random write otherwise.
+    '''
+
+    def operation(con, ctx, rng):
+        if rng.random() < read_ratio:
+            rng.choice(READS)(con, ctx, rng)
+        else:
+            rng.choice(WRITES)(con, ctx, rng)
+    return operation
+
+
+SCENARIOS = [
+    Scenario('get_user', get_user),
+    Scenario('get_user_if_changed', get_user_if_changed),
+    Scenario('get_user_by_nickname', get_user_by_nickname),
+    Scenario('get_user_public', get_user_public),
+    Scenario('get_users', get_users, limit=lambda gen: 50),
+    Scenario('get_users_page', get_users_page),
+    Scenario('get_user_id', get_user_id),
+    Scenario('get_goal', get_goal),
+    Scenario('get_goal_if_changed', get_goal_if_changed),
+    Scenario('get_goals_of_user', get_goals_of_user),
+    Scenario('get_goals_window', get_goals_window),
+    Scenario('get_due_goals', get_due_goals),
+    Scenario('get_resource', get_resource),
+    Scenario('get_resources_of_goal', get_resources_of_goal),
+    Scenario('get_resources_of_user', get_resources_of_user),
+    Scenario('create_user', create_user),
+    Scenario('create_goal', create_goal),
+    Scenario('create_resource', create_resource),
+    Scenario('modify_user', modify_user),
+    Scenario('modify_goal', modify_goal),
+    Scenario('modify_resource', modify_resource),
+    Scenario('delete_resource', delete_resource,
+             limit=lambda gen: gen.resources),
+    Scenario('delete_goal', delete_goal,
+             limit=lambda gen: len(gen.root_goals())),
+    Scenario('delete_user', delete_user, limit=lambda gen: gen.users),
+    Scenario('mixed_90_10', mixed(0.9)),
+    Scenario('mixed_50_50', mixed(0.5)),
+]
+
+
+def new_random(seed, thread):
+    '''
+    :return: random generator of a benchmark thread.
+    '''
+
+    return random.Random(seed * 1000 + thread)
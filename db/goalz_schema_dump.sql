@@ -1,6 +1,8 @@
 /*
-  This file contain the db schema
+  This file contain the db schema (version 0)
 
+  Do not modify this file to change the schema. Add a new migration to
+  "src/db/migrations.py" instead, so existing databases can be upgraded.
   If this file is modified make sure the changes are propagated also
   to "db/goalz_data_dump.sql" and "src/db/constants.py"
  */
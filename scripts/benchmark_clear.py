@@ -0,0 +1,73 @@
+'''
+Created on 19.10.2026
+
+This scripts compares the time needed by the different strategies of
+Engine.clear() on a large database, using the command:
+
+    python -m scripts.benchmark_clear --users 2000
+
+WARNING: the script creates and removes the database file given with
+         the option --db (db/goalz_benchmark.db by default)
+'''
+
+import argparse
+import os
+import sqlite3
+import time
+
+from src.db.engine import Engine
+
+STRATEGIES = [
+    ('delete', {}),
+    ('fast', {'fast': True}),
+    ('fast + vacuum', {'fast': True, 'vacuum': True}),
+    ('recreate', {'recreate': True}),
+]
+
+def populate(engine, users, goals_per_user, resources_per_goal):
+    '''
+    Fill the database with synthetic users, goals and resources.
+    '''
+    con = sqlite3.connect(engine.db_path)
+    with con:
+        con.executemany('INSERT INTO users VALUES(?,?,?,?)',
+                        ((i, 'user%d' % i, 1362015937, 'password')
+                         for i in range(1, users + 1)))
+        con.executemany('INSERT INTO user_profile (user_id, firstname, rating) \
+                         VALUES(?,?,?)',
+                        ((i, 'name%d' % i, 0.5) for i in range(1, users + 1)))
+        goals = users * goals_per_user
+        con.executemany('INSERT INTO goals (goal_id, user_id, title, deadline, \
+                         status) VALUES(?,?,?,?,?)',
+                        ((i, (i - 1) // goals_per_user + 1, 'goal%d' % i,
+                          1519172121 + i, 0) for i in range(1, goals + 1)))
+        con.executemany('INSERT INTO resources (goal_id, user_id, title, rating) \
+                         VALUES(?,?,?,?)',
+                        (((i - 1) // resources_per_goal + 1,
+                          ((i - 1) // resources_per_goal) // goals_per_user + 1,
+                          'resource%d' % i, 0.5)
+                         for i in range(1, goals * resources_per_goal + 1)))
+    con.close()
+
+def main(db_path, users, goals_per_user, resources_per_goal):
+    engine = Engine(db_path)
+    for name, options in STRATEGIES:
+        engine.remove_database()
+        engine.create_tables()
+        populate(engine, users, goals_per_user, resources_per_goal)
+        size = os.path.getsize(db_path)
+        start = time.perf_counter()
+        engine.clear(**options)
+        elapsed = time.perf_counter() - start
+        print('%-15s %8.3f s   file size %10d -> %10d bytes' %
+              (name, elapsed, size, os.path.getsize(db_path)))
+    engine.remove_database()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Engine.clear()')
+    parser.add_argument('--db', default='db/goalz_benchmark.db')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--goals-per-user', type=int, default=5)
+    parser.add_argument('--resources-per-goal', type=int, default=3)
+    args = parser.parse_args()
+    main(args.db, args.users, args.goals_per_user, args.resources_per_goal)
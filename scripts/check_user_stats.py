@@ -0,0 +1,40 @@
+'''
+Created on 19.10.2026
+
+This scripts checks that the statistics maintained in the table user_stats
+match the goals and resources of every user, using the command:
+
+    python -m scripts.check_user_stats --db db/goalz.db
+
+With --rebuild, the whole table is recomputed when inconsistencies are found.
+The script exits with status 1 if the statistics are inconsistent and were
+not rebuilt.
+'''
+
+import argparse
+import sys
+
+from src.db import constants
+from src.db.engine import Engine
+
+def main(db_path, rebuild):
+    engine = Engine(db_path, migrate=True)
+    user_ids = engine.check_user_stats()
+    if not user_ids:
+        print('The statistics of the users are consistent')
+        return 0
+    print('Inconsistent statistics for %d users: %s' %
+          (len(user_ids), ', '.join(str(user_id) for user_id in user_ids)))
+    if not rebuild:
+        return 1
+    engine.rebuild_user_stats()
+    print('Statistics rebuilt')
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the table user_stats')
+    parser.add_argument('--db', default=constants.DEFAULT_DB_PATH)
+    parser.add_argument('--rebuild', action='store_true',
+                        help='recompute the statistics if they are wrong')
+    args = parser.parse_args()
+    sys.exit(main(args.db, args.rebuild))
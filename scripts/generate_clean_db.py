@@ -9,12 +9,13 @@ WARNING: executing this scripts will remove all the current entries
 '''
 
 from src.db.engine import Engine
+from src.db.loader import DumpLoader
 
 def main():
     engine = Engine()
     engine.remove_database()
     engine.create_tables()
-    engine.populate_tables()
+    engine.populate_tables(progress=DumpLoader.print_progress)
 
 if __name__ == '__main__':
     print('Reseting the database ...')
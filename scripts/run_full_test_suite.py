@@ -3,26 +3,70 @@ Created on 24.02.2018
 
 This scripts run the entire test suite for the system
 
-Reference: Code taken and adapted from 
+Test modules can be run in parallel processes with the option --parallel.
+Every process uses its own database file, so the modules do not interfere
+with each other:
+
+    python -m scripts.run_full_test_suite --parallel 4
+
+Reference: Code taken and adapted from
            https://stackoverflow.com/questions/1732438/how-do-i-run-all-python-unit-tests-in-a-directory
            accessed in 24.02.2018
 '''
 
+import argparse
+import os
+import subprocess
+import sys
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.db import constants
 
 testmodules = [
     'test.database_api_tests_resources',
     'test.database_api_tests_goal',
     'test.database_api_tests_user',
-    'test.database_api_tests_tables'
+    'test.database_api_tests_tables',
+    'test.database_api_tests_migrations',
+    'test.database_api_tests_changes'
     ]
 
-def main():
+def run_module(test):
+    '''
+    Run a test module in a new process with an isolated database file.
+
+    :param str test: name of the test module
+    :return: a tuple (return code, output of the process)
+    '''
+    env = dict(os.environ)
+    db_path = constants.DEFAULT_TEST_DB_PATH.replace(
+        '.db', '_%s.db' % test.rsplit('.', 1)[-1])
+    env[constants.TEST_DB_PATH_ENV] = db_path
+    process = subprocess.run([sys.executable, '-m', 'unittest', test],
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             env=env, universal_newlines=True)
+    return process.returncode, process.stdout
+
+def main(parallel=1):
+    if parallel > 1:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            results = list(executor.map(run_module, testmodules))
+        failed = False
+        for test, (returncode, output) in zip(testmodules, results):
+            print('=== %s ===' % test)
+            print(output)
+            failed = failed or returncode != 0
+        return not failed
     suite = unittest.TestSuite()
     for test in testmodules:
         suite.addTest(unittest.defaultTestLoader.loadTestsFromName(test))
-    unittest.TextTestRunner().run(suite)
+    return unittest.TextTestRunner().run(suite).wasSuccessful()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the full test suite')
+    parser.add_argument('--parallel', type=int, default=1,
+                        help='number of test modules run at the same time')
+    args = parser.parse_args()
     print('Start running test suite')
-    main()
\ No newline at end of file
+    sys.exit(0 if main(args.parallel) else 1)
@@ -0,0 +1,205 @@
+'''
+Created on 19.10.2026
+
+Provides the bulk deletes of the db layer
+
+Deleting a user or a goal lets ``ON DELETE CASCADE`` remove the dependent
+rows one by one in a single transaction, which holds the write lock until the
+whole tree is gone. :py:class:`BatchedDelete` removes the same rows explicitly,
+leaves first, in chunks of ids each one deleted in its own short transaction,
+so other writers can run between the chunks.
+
+The size of the chunks adapts to the time taken by the previous ones, so every
+transaction lasts about :py:data:`constants.BULK_DELETE_MAX_SECONDS`.
+
+While a bulk delete runs, other connections may see a partially deleted tree:
+its deepest goals and their resources are removed first.
+
+:py:meth:`BatchedDelete.purge` removes the same way the rows tombstoned by the
+soft delete mode, see :py:mod:`src.db.softdelete`.
+'''
+
+import json
+from time import perf_counter
+
+from src.db import constants
+
+
+class BatchedDelete(object):
+    '''
+    Deletes users and goal trees in chunks.
+
+    :param con: the sqlite3 connection, with foreign keys support enabled.
+    :param progress: Default None. Function called after every chunk with a
+        copy of :py:attr:`stats`.
+    :param int batch_size: Default
+        :py:data:`constants.BULK_DELETE_BATCH_SIZE`. Number of ids of the
+        first chunk.
+    :param float max_seconds: Default
+        :py:data:`constants.BULK_DELETE_MAX_SECONDS`. Target duration of the
+        transactions.
+
+    The attribute :py:attr:`stats` is a dictionary with the number of
+    ``users``, ``goals`` and ``resources`` deleted, the resources of the users
+    ``unlinked`` (whose user_id is set to NULL), the number of ``batches`` and
+    the ``seconds`` spent in them.
+    '''
+
+    def __init__(self, con, progress=None,
+                 batch_size=constants.BULK_DELETE_BATCH_SIZE,
+                 max_seconds=constants.BULK_DELETE_MAX_SECONDS):
+        super(BatchedDelete, self).__init__()
+        self.con = con
+        self.progress = progress
+        self.batch_size = batch_size
+        self.max_seconds = max_seconds
+        self.stats = {'users': 0, 'goals': 0, 'resources': 0, 'unlinked': 0,
+                      'batches': 0, 'seconds': 0.0}
+
+    def delete_goal_tree(self, goal_id):
+        '''
+        Delete a goal, its sub-goals and the resources of all of them.
+
+        :param int goal_id: id of the root of the tree.
+        :return: the number of goals deleted (int).
+        '''
+
+        cur = self.con.cursor()
+        cur.execute(constants.SQL_SELECT_GOAL_TREE, (goal_id,))
+        goal_ids = [row[0] for row in cur.fetchall()]
+        self._delete_goals(goal_ids)
+        return len(goal_ids)
+
+    def delete_users(self, user_ids):
+        '''
+        Delete users, their profiles, the trees rooted at their goals and the
+        resources of those goals. The other resources posted by the users are
+        kept, without user, as ``ON DELETE SET NULL`` would do.
+
+        :param list user_ids: ids of the users.
+        :return: the number of users deleted (int).
+        '''
+
+        user_ids = list(user_ids)
+        deleted = self.stats['users']
+        cur = self.con.cursor()
+        cur.execute(constants.SQL_SELECT_USERS_GOAL_TREES,
+                    (json.dumps(user_ids),))
+        self._delete_goals([row[0] for row in cur.fetchall()])
+        cur.execute(constants.SQL_SELECT_RESOURCES_OF_USERS,
+                    (json.dumps(user_ids),))
+        resource_ids = [row[0] for row in cur.fetchall()]
+        self._run(resource_ids,
+                  ((constants.SQL_UNLINK_RESOURCES, 'unlinked'),))
+        self._run(user_ids, ((constants.SQL_DELETE_USERS_BY_ID, 'users'),))
+        return self.stats['users'] - deleted
+
+    def tombstone_users(self, user_ids, deleted_at):
+        '''
+        Tombstone users, for the soft delete mode, see
+        :py:mod:`src.db.softdelete`. Their goals and resources are hidden
+        with them until they are purged.
+
+        :param list user_ids: ids of the users.
+        :param int deleted_at: UNIX timestamp of the deletion.
+        :return: the number of users tombstoned (int).
+        '''
+
+        deleted = self.stats['users']
+        # The goals and resources hidden with the users are recorded as
+        # deleted in the table changes first
+        self._run(list(user_ids),
+                  ((constants.SQL_RECORD_HIDDEN_BY_USERS, None),
+                   (constants.SQL_SOFT_DELETE_USERS_BY_ID, 'users')),
+                  parameters=(deleted_at,))
+        return self.stats['users'] - deleted
+
+    def purge(self, max_roots=constants.PURGE_MAX_ROOTS):
+        '''
+        Delete the rows tombstoned by the soft delete mode, oldest first: at
+        most ``max_roots`` users, as :py:meth:`delete_users` does, then at
+        most ``max_roots`` goals with their trees, then at most ``max_roots``
+        resources.
+
+        :param int max_roots: maximum number of tombstones of each table.
+        :return: the number of tombstones purged (int).
+        '''
+
+        cur = self.con.cursor()
+        cur.execute(constants.SQL_SELECT_DELETED_USERS, (max_roots,))
+        user_ids = [row[0] for row in cur.fetchall()]
+        self.delete_users(user_ids)
+        cur.execute(constants.SQL_SELECT_DELETED_GOALS, (max_roots,))
+        goal_ids = [row[0] for row in cur.fetchall()]
+        cur.execute(constants.SQL_SELECT_GOAL_TREES, (json.dumps(goal_ids),))
+        self._delete_goals([row[0] for row in cur.fetchall()])
+        cur.execute(constants.SQL_SELECT_DELETED_RESOURCES, (max_roots,))
+        resource_ids = [row[0] for row in cur.fetchall()]
+        self._run(resource_ids, ((constants.SQL_DELETE_RESOURCES_BY_ID,
+                                  'resources'),))
+        return len(user_ids) + len(goal_ids) + len(resource_ids)
+
+    # HELPERS
+    def _delete_goals(self, goal_ids):
+        '''
+        Delete goals, given leaves first, and their resources.
+        '''
+
+        # Rows are deleted in the order of their ids, so a sub-goal in the
+        # same chunk as its parent may be removed by the cascade instead: the
+        # rows modified by the statement do not count it
+        self._run(goal_ids, ((constants.SQL_DELETE_RESOURCES_OF_GOALS,
+                              'resources'),
+                             (constants.SQL_DELETE_GOALS_BY_ID, None)),
+                  'goals')
+
+    def _run(self, ids, statements, counted=None, parameters=()):
+        '''
+        Execute the statements for consecutive chunks of ids, each chunk in its
+        own transaction.
+
+        :param list ids: the ids, passed to the statements as a JSON array.
+        :param statements: pairs (statement, key of :py:attr:`stats` counting
+            the rows modified, or None).
+        :param str counted: Default None. Key of :py:attr:`stats` counting the
+            ids of the chunks.
+        :param tuple parameters: Default empty. Parameters of the statements
+            bound before the ids.
+        '''
+
+        start = 0
+        while start < len(ids):
+            chunk = ids[start:start + self.batch_size]
+            start += len(chunk)
+            chunk_parameters = parameters + (json.dumps(chunk),)
+            begin = perf_counter()
+            cur = self.con.cursor()
+            try:
+                for statement, key in statements:
+                    cur.execute(statement, chunk_parameters)
+                    if key is not None:
+                        self.stats[key] += max(cur.rowcount, 0)
+                self.con.commit()
+            except Exception:
+                self.con.rollback()
+                raise
+            elapsed = perf_counter() - begin
+            if counted is not None:
+                self.stats[counted] += len(chunk)
+            self.stats['batches'] += 1
+            self.stats['seconds'] += elapsed
+            self._adapt(elapsed)
+            if self.progress is not None:
+                self.progress(dict(self.stats))
+
+    def _adapt(self, elapsed):
+        '''
+        Change the size of the next chunks so their transactions last about
+        :py:attr:`max_seconds`.
+        '''
+
+        if elapsed > self.max_seconds:
+            self.batch_size = max(self.batch_size // 2, 1)
+        elif elapsed < self.max_seconds / 2:
+            self.batch_size = min(self.batch_size * 2,
+                                  constants.BULK_DELETE_MAX_BATCH_SIZE)
@@ -0,0 +1,92 @@
+'''
+Created on 19.10.2026
+
+Provides the caches shared by the connections of an Engine
+
+The caches are only correct while the Engine and its connections are the
+only writers of the database: rows modified by other processes are not
+invalidated.
+'''
+
+import threading
+from collections import OrderedDict
+
+
+class NicknameCache(object):
+    '''
+    Bounded mapping from the nickname of a user to its user_id. The least
+    recently used nicknames are evicted first.
+
+    Only existing users are cached, so creating a user never leaves a stale
+    entry behind. Deleting a user must call :py:meth:`discard_user`.
+
+    :param int size: maximum number of nicknames cached.
+    '''
+
+    def __init__(self, size):
+        super(NicknameCache, self).__init__()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._user_ids = OrderedDict()
+        self._nicknames = {}
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def get(self, nickname):
+        '''
+        :return: the cached user_id of the nickname or None.
+        '''
+
+        with self._lock:
+            user_id = self._user_ids.get(nickname)
+            if user_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._user_ids.move_to_end(nickname)
+            return user_id
+
+    def put(self, nickname, user_id):
+        '''
+        Cache the user_id of an existing user.
+        '''
+
+        with self._lock:
+            self._user_ids[nickname] = user_id
+            self._user_ids.move_to_end(nickname)
+            self._nicknames[user_id] = nickname
+            if len(self._user_ids) > self.size:
+                _, evicted = self._user_ids.popitem(last=False)
+                self._nicknames.pop(evicted, None)
+
+    def discard(self, nickname):
+        '''
+        Remove the entry of a nickname, if any.
+        '''
+
+        with self._lock:
+            user_id = self._user_ids.pop(nickname, None)
+            if user_id is not None:
+                self._nicknames.pop(user_id, None)
+
+    def discard_user(self, user_id):
+        '''
+        Remove the entry of a user_id, if any.
+        '''
+
+        with self._lock:
+            nickname = self._nicknames.pop(user_id, None)
+            if nickname is not None:
+                self._user_ids.pop(nickname, None)
+
+    def clear(self):
+        '''
+        Remove all the entries. The hit and miss counters are kept.
+        '''
+
+        with self._lock:
+            self._user_ids.clear()
+            self._nicknames.clear()
@@ -0,0 +1,100 @@
+'''
+Created on 19.10.2026
+
+Provides method to read and compact the "changes" table
+
+Every insert, update and delete of a user (or its profile), a goal or a
+resource is recorded by a trigger in the table ``changes``, in the same
+transaction as the write, with a sequence number. SQLite has a single writer,
+so the changes are committed in the order of their sequence numbers: a
+consumer which remembers the last sequence number it read never misses a
+change.
+'''
+import sqlite3
+
+from src.db import constants
+from src.db.profiling import profiled
+
+
+class ChangeRepo(object):
+    '''
+    Methods to read the "changes" table in the Goalz database
+
+    The sqlite3 connection instance is received as a constructor parameter and
+    is accessible to all the methods of this class through the
+    :py:attr:`self.con` attribute.
+
+    Methods of this class **MUST** not be accessed directly. All the calls to
+    the database should be made through the API provided by :py:class:`Connection`
+
+    :param con: Connection to an SqlLite database
+    :type con: sqlite3.Connection
+    '''
+
+    def __init__(self, con):
+        super(ChangeRepo, self).__init__()
+        self.con = con
+
+    def read_changes(self, since_seq, limit):
+        '''
+        Extract the changes recorded after a sequence number, oldest first.
+
+        :param int since_seq: sequence number of the last change already
+            read, 0 to read from the beginning.
+        :param int limit: maximum number of changes returned.
+        :return: list of dictionaries with the format provided in
+            :py:meth:`_create_change_object`. Empty if there are no newer
+            changes.
+        :raises ValueError: if ``since_seq`` or ``limit`` are not valid.
+        '''
+
+        if not isinstance(since_seq, int) or since_seq < 0:
+            raise ValueError("Invalid `since_seq` sequence number")
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError("Invalid `limit`")
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cur.execute(constants.SQL_SELECT_CHANGES, (since_seq, limit))
+        return [self._create_change_object(row) for row in cur.fetchall()]
+
+    def compact_changes(self, up_to_seq):
+        '''
+        Remove the changes up to a sequence number, except the last one of
+        every row. A consumer reading from before ``up_to_seq`` still gets
+        the last operation of every row changed, but not the intermediate
+        ones.
+
+        :param int up_to_seq: sequence number of the last change compacted.
+        :return: the number of changes removed (int).
+        :raises ValueError: if ``up_to_seq`` is not valid.
+        '''
+
+        if not isinstance(up_to_seq, int) or up_to_seq < 0:
+            raise ValueError("Invalid `up_to_seq` sequence number")
+        cur = self.con.cursor()
+        cur.execute(constants.SQL_COMPACT_CHANGES, {'seq': up_to_seq})
+        self.con.commit()
+        return max(cur.rowcount, 0)
+
+    @profiled('build')
+    def _create_change_object(self, row):
+        '''
+        It takes a :py:class:`sqlite3.Row` and transform it into a dictionary.
+
+        :param row: The row obtained from the database.
+        :type row: sqlite3.Row
+        :return: a dictionary containing the following keys:
+
+            * ``seq``: sequence number of the change (int)
+            * ``table``: ``users``, ``goals`` or ``resources`` (string)
+            * ``id``: id of the row changed in the table (int)
+            * ``operation``: ``insert``, ``update``, ``delete`` or
+              ``truncate`` (string). Tombstoning a row in soft delete mode is
+              a ``delete``. A ``truncate``, with ``id`` 0, deletes all the
+              rows of the table, see :py:meth:`Engine.clear`.
+            * ``changed_at``: UNIX timestamp of the change (int)
+        '''
+
+        return {'seq': row['seq'], 'table': row['table_name'],
+                'id': row['row_id'], 'operation': row['operation'],
+                'changed_at': row['changed_at']}
@@ -6,13 +6,142 @@ Provides the database API to access the goal tracker's persistent data.
 Reference: Code taken and modified from PWP2018 exercise
 '''
 
+import functools
 import sqlite3
+from time import perf_counter
 
 from src.db import constants
+from src.db.change_repo import ChangeRepo
 from src.db.resource_repo import ResourceRepo
 from src.db.goal_repo import GoalRepo
 from src.db.user_repo import UserRepo
 
+def _observers(connection):
+    '''
+    :return: the metrics and the profiler of the Engine of a
+        :py:class:`Connection`, each one None when it is disabled or when the
+        connection is already observing a call. Only the outermost call is
+        recorded, so the methods called by other methods are part of them.
+    '''
+
+    if connection._observing:
+        return None, None
+    metrics = connection._metrics
+    if metrics is not None and not metrics.enabled:
+        metrics = None
+    profiler = connection._profiler
+    if profiler is not None and not profiler.enabled:
+        profiler = None
+    return metrics, profiler
+
+def _observed(method):
+    '''
+    Decorator recording the latency and the errors of a :py:class:`Connection`
+    method in the metrics of the Engine, and profiling it, when they are
+    enabled.
+    '''
+
+    name = method.__name__
+    labels = (name,)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics, profiler = _observers(self)
+        if metrics is None and profiler is None:
+            return method(self, *args, **kwargs)
+        if profiler is not None:
+            profiler.begin(name, self.con)
+        self._observing = True
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            if metrics is not None:
+                metrics.errors.inc(labels)
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            self._observing = False
+            if metrics is not None:
+                metrics.calls.observe(labels, elapsed)
+            if profiler is not None:
+                profiler.end(elapsed, self.con)
+    return wrapper
+
+def _observed_generator(method):
+    '''
+    Variant of :py:func:`_observed` for the :py:class:`Connection` methods
+    returning a generator. The time spent creating the generator and producing
+    every item is recorded as a single call, once the generator is exhausted,
+    fails or is closed. The time spent by the caller between two items is not
+    recorded.
+    '''
+
+    name = method.__name__
+    labels = (name,)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics, profiler = _observers(self)
+        if metrics is None and profiler is None:
+            return method(self, *args, **kwargs)
+        if profiler is not None:
+            profiler.begin(name, self.con)
+        self._observing = True
+        start = perf_counter()
+        try:
+            generator = method(self, *args, **kwargs)
+        except Exception:
+            elapsed = perf_counter() - start
+            self._observing = False
+            if metrics is not None:
+                metrics.errors.inc(labels)
+                metrics.calls.observe(labels, elapsed)
+            if profiler is not None:
+                profiler.end(elapsed, self.con)
+            raise
+        elapsed = perf_counter() - start
+        self._observing = False
+        if profiler is not None:
+            profiler.end(elapsed, self.con)
+        return _observe_iteration(self, generator, name, labels, metrics,
+                                  profiler, elapsed)
+    return wrapper
+
+def _observe_iteration(connection, generator, name, labels, metrics, profiler,
+                       elapsed):
+    '''
+    Generator of :py:func:`_observed_generator`, adding the time spent in every
+    step of ``generator`` to the call.
+    '''
+
+    try:
+        while True:
+            if profiler is not None:
+                profiler.begin(name, connection.con)
+            connection._observing = True
+            start = perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            except Exception:
+                if metrics is not None:
+                    metrics.errors.inc(labels)
+                raise
+            finally:
+                step = perf_counter() - start
+                elapsed += step
+                connection._observing = False
+                if profiler is not None:
+                    # The call was already counted when it was created
+                    profiler.end(step, connection.con, calls=0)
+            yield item
+    finally:
+        generator.close()
+        if metrics is not None:
+            metrics.calls.observe(labels, elapsed)
+
 class Connection(object):
     '''
     API to access the Goalz database.
@@ -29,16 +158,35 @@ class Connection(object):
 
     :param db_path: Location of the database file.
     :type db_path: str
+    :param engine: Default None. The :py:class:`Engine` creating the
+        connection, whose configuration and statistics are used.
+    :type engine: Engine
     '''
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, engine=None):
         super(Connection, self).__init__()
-        self.con = sqlite3.connect(db_path)
+        if engine is not None:
+            self.con = engine._connect()
+            self._metrics = engine.metrics
+            self._profiler = engine.profiler
+            engine._connection_opened()
+        else:
+            self.con = sqlite3.connect(db_path)
+            self._metrics = None
+            self._profiler = None
+        self.engine = engine
         self._isclosed = False
-        self.goal_repo = GoalRepo(self.con)
-        self.resource_repo = ResourceRepo(self.con)
-        self.user_repo = UserRepo(self.con)
-
+        # True while a call is recorded in the metrics or the profile
+        self._observing = False
+        soft_delete = engine is not None and engine.soft_delete
+        self.goal_repo = GoalRepo(self.con, soft_delete)
+        self.resource_repo = ResourceRepo(self.con, soft_delete)
+        self.user_repo = UserRepo(self.con, engine.nickname_cache
+                                  if engine is not None else None,
+                                  soft_delete)
+        self.change_repo = ChangeRepo(self.con)
+
+    @_observed
     def isclosed(self):
         '''
         :return: ``True`` if connection has already being closed.
@@ -46,6 +194,7 @@ class Connection(object):
 
         return self._isclosed
 
+    @_observed
     def close(self):
         '''
         Closes the database connection, committing all changes.
@@ -55,7 +204,10 @@ class Connection(object):
             self.con.commit()
             self.con.close()
             self._isclosed = True
+            if self.engine is not None:
+                self.engine._connection_closed()
 
+    @_observed
     def check_foreign_keys_status(self):
         '''
         Check if the foreign keys has been activated.
@@ -78,6 +230,7 @@ class Connection(object):
 
         return is_activated
 
+    @_observed
     def set_foreign_keys_support(self):
         '''
         Activate the support for foreign keys.
@@ -88,12 +241,17 @@ class Connection(object):
         keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
         try:
             cur = self.con.cursor()
-            cur.execute(keys_on)
+            # Setting the pragma expires the prepared statements of the
+            # connection, so it is only set when the support is off
+            cur.execute('PRAGMA foreign_keys')
+            if cur.fetchone()[0] != 1:
+                cur.execute(keys_on)
             return True
         except sqlite3.Error as excp:
             print("Error %s:" % excp.args[0])
             return False
 
+    @_observed
     def unset_foreign_keys_support(self):
         '''
         Deactivate the support for foreign keys.
@@ -111,6 +269,7 @@ class Connection(object):
             return False
 
     # USER METHODS
+    @_observed
     def get_user(self, user_id=None, nickname=None):
         '''
         Extracts all the information of a user by user_id or nickname.
@@ -124,35 +283,76 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.user_repo.get_user(user_id, nickname)
 
-    def get_user_public(self, user_id=None, nickname=None):
+    @_observed
+    def get_user_if_changed(self, user_id, known_version=None):
+        '''
+        Extracts all the information of a user, unless the caller already
+        knows its current version. Every write of the user or of its profile
+        increments the version of the user.
+
+        :param int user_id: The unique id of the user.
+        :param int known_version: Default None. Version of the user returned
+            by a previous call.
+        :return: None if the user does not exist, else a tuple (version,
+            user). user is None if the version is ``known_version``: the
+            user is not modified, and is neither fetched nor built. Otherwise
+            it is a dictionary with the format of :py:meth:`get_user`.
+        '''
+        self.set_foreign_keys_support()
+        return self.user_repo.get_user_if_changed(user_id, known_version)
+
+    @_observed
+    def get_user_public(self, user_id=None, nickname=None, with_stats=False):
         '''
         Extracts public information of a user by the user_id or nickname
         
         :param integer user_id: The unique ID of the user, default None.
         :param string nickname: The nickname of the user to search for, default None.
+        :param bool with_stats: Default False. Add the statistics of the user
+            under the key ``stats``, with the format returned by
+            :py:meth:`get_user_summary`. They are maintained by triggers, so
+            reading them does not scan the goals and resources of the user,
+            except in soft delete mode while some rows are tombstoned.
         :return: user data dictionary with the format provided in the method:
             :py:meth:`_create_user_list_object`. None is returned if the database
             has no users with given nickname.
         '''
         self.set_foreign_keys_support()
-        return self.user_repo.get_user_public(user_id, nickname)
-
-    def get_users(self):
-        '''
-        Extracts all users in the database.
-
-        :return: list of Users of the database. Each user is a dictionary
-            with the format provided in the method:
+        return self.user_repo.get_user_public(user_id, nickname, with_stats)
+
+    @_observed
+    def get_users(self, number_of_users=None, sort_by=None, descending=False,
+                  after=None):
+        '''
+        Extracts the users in the database, one page at a time.
+
+        :param int number_of_users: Default None. Maximum number of users
+            returned. If None, there is no limit.
+        :param str sort_by: Default None. ``'nickname'``,
+            ``'registration_date'`` or ``'rating'``. If None, users are
+            sorted by user_id.
+        :param bool descending: Default False. Sort in descending order.
+        :param str after: Default None. The opaque ``cursor`` of the previous
+            page, read with the same ``sort_by``. Only the users sorted after
+            its last user are returned.
+        :return: list of Users of the database, with the attribute
+            ``cursor`` of the page (None if it is empty). Each user is a
+            dictionary with the format provided in the method:
             :py:meth:`_create_user_list_object`.
-            None is returned if the database has no users.
+        :raises ValueError: if ``sort_by`` is not a valid sort key or
+            ``after`` is not a cursor of this sort key.
         '''
         self.set_foreign_keys_support()
-        return self.user_repo.get_users()
+        return self.user_repo.get_users(number_of_users, sort_by, descending,
+                                        after)
 
+    @_observed
     def delete_user(self, user_id):
         '''
         Remove all information of the user with the user_id passed in as
-        argument.
+        argument. If the Engine uses the soft delete mode, the user is only
+        tombstoned and hidden, with its goals and their resources, until it
+        is purged.
 
         :param integer user_id: The unique ID of the user to remove.
         :return: True if the user is deleted, False otherwise.
@@ -161,13 +361,35 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.user_repo.delete_user(user_id)
 
+    @_observed
+    def delete_users(self, user_ids, progress=None):
+        '''
+        Remove all information of the users with the user_ids passed in as
+        argument, in short transactions, so other writers are not blocked
+        until the end. The goals of the users, their sub-goals and the
+        resources of those goals are deleted explicitly, leaves first, instead
+        of by the cascade of :py:meth:`delete_user`. If the Engine uses the
+        soft delete mode, the users are only tombstoned, as
+        :py:meth:`delete_user` does.
+
+        :param list user_ids: The unique IDs of the users to remove.
+        :param progress: Default None. Function called after every transaction
+            with the statistics of :py:class:`src.db.batching.BatchedDelete`.
+        :return: the number of users deleted.
+
+        '''
+        self.set_foreign_keys_support()
+        return self.user_repo.delete_users(user_ids, progress)
+
+    @_observed
     def modify_user(self, user_id, r_profile):
         '''
         Modify the information of a user.
 
         :param int user_id: The unique ID of the user to modify
         :param dict r_profile: a dictionary with the restricted information + website(public)
-                to be modified. The dictionary has the following structure:
+                to be modified. Only the keys present in the dictionary are
+                modified. The dictionary has the following structure:
 
                 .. code-block:: javascript
 
@@ -185,11 +407,13 @@ class Connection(object):
                 * ``website``: new user's personal web URL (string).
 
         :return: the user_id of the modified user or None if the
-            ``user_id`` passed is not in the database.
+            ``user_id`` passed is not in the database, or is deleted in soft
+            delete mode.
         '''
         self.set_foreign_keys_support()
         return self.user_repo.modify_user(user_id, r_profile)
 
+    @_observed
     def create_user(self, nickname, new_user):
         '''
         Create a new user in the database.
@@ -220,6 +444,27 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.user_repo.create_user(nickname, new_user)
 
+    @_observed
+    def get_user_summary(self, user_id):
+        '''
+        Aggregate the goals and the resources of a user: goal counts by
+        status, number of resources, average rating of the resources and
+        total required time. Computed by the database, without fetching the
+        goals and the resources.
+
+        In order to maintain a clear separation of responsibilities this method
+        delegates the execution to the corresponding method from
+        :py:class:`UserRepo' and returns the result
+
+        :param int user_id: The unique ID of the user.
+        :return: a dictionary with the format provided in
+            :py:meth:`UserRepo.get_user_summary` or None if the user does not
+            exist.
+        '''
+        self.set_foreign_keys_support()
+        return self.user_repo.get_user_summary(user_id)
+
+    @_observed
     def get_user_id(self, nickname):
         '''
         Get the user_id of the user with the given
@@ -232,6 +477,7 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.user_repo.get_user_id(nickname)
 
+    @_observed
     def contains_user(self, nickname):
         '''
         Check whether the nickname is exist in the database.
@@ -244,6 +490,7 @@ class Connection(object):
 
     # GOAL METHODS
     # delegate methods from the goal_repo class
+    @_observed
     def get_goal(self, goal_id):
         '''
         Extracts a goal from the database.
@@ -257,6 +504,24 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.goal_repo.get_goal(goal_id)
 
+    @_observed
+    def get_goal_if_changed(self, goal_id, known_version=None):
+        '''
+        Extracts a goal from the database, unless the caller already knows its
+        current version. Every write of the goal increments its version.
+
+        :param int goal_id: The id of the goal.
+        :param int known_version: Default None. Version of the goal returned
+            by a previous call.
+        :return: None if the goal does not exist, else a tuple (version,
+            goal). goal is None if the version is ``known_version``: the goal
+            is not modified, and is neither fetched nor built. Otherwise it
+            is a dictionary with the format of :py:meth:`get_goal`.
+        '''
+        self.set_foreign_keys_support()
+        return self.goal_repo.get_goal_if_changed(goal_id, known_version)
+
+    @_observed
     def get_goals(self, user_id=None, number_of_goals=None,
                      before=None, after=None):
         '''
@@ -291,38 +556,70 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.goal_repo.get_goals(user_id, number_of_goals, before, after)
 
+    @_observed
     def delete_goal(self, goal_id):
         '''
-        Delete the goal with id given as parameter.
+        Delete the goal with id given as parameter. If the Engine uses the
+        soft delete mode, the goal is only tombstoned and hidden, with its
+        sub-goals and their resources, until it is purged.
 
         :param int goal_id: id of the goal to remove.
-        :return: True if the goal has been deleted, False otherwise
+        :return: True if the goal has been deleted, False otherwise (or if it
+            is already hidden, in soft delete mode)
 
         '''
         self.set_foreign_keys_support()
         return self.goal_repo.delete_goal(goal_id)
 
+    @_observed
+    def delete_goal_tree(self, goal_id, progress=None):
+        '''
+        Delete the goal with id given as parameter, its sub-goals and their
+        resources in short transactions, leaves first, so other writers are
+        not blocked until the whole tree is removed.
+
+        :param int goal_id: id of the root goal to remove.
+        :param progress: Default None. Function called after every transaction
+            with the statistics of :py:class:`src.db.batching.BatchedDelete`.
+        :return: the number of goals deleted, 0 if the goal does not exist.
+
+        '''
+        self.set_foreign_keys_support()
+        return self.goal_repo.delete_goal_tree(goal_id, progress)
+
+    @_observed
     def modify_goal(self, goal_id, title=None, topic=None, description=None,
-                deadline=None, status=None):
+                deadline=None, status=None, expected_version=None):
         '''
         Modify the title, the topic, the description, the status, and the
         deadline of the goal with id ``goal_id``. An individual field can be
         modified by setting the rest as None.
 
+        With ``expected_version``, the goal is only modified if its version is
+        still the one returned by :py:meth:`get_goal_if_changed`: the
+        version is compared in the statement modifying the goal, so no lock
+        is held between the read and the modification. A successful
+        modification creates the version ``expected_version + 1``.
+
         :param int goal_id: the id of the goal to remove.
         :param str title: default None. The goal's title
         :param str topic: default None. The goal's topic
         :param str description: default None. The goal's description
         :param int deadline: default None. The goal's deadline
         :param int status: default None. The goal's status
+        :param int expected_version: default None. The version of the goal
+            read by the caller.
         :return: the id of the edited goal or None if the goal was
-              not found.
+              not found, or is hidden in soft delete mode.
+              :py:data:`constants.CONFLICT` if the goal has been
+              modified since the caller read ``expected_version``.
 
         '''
         self.set_foreign_keys_support()
         return self.goal_repo.modify_goal(goal_id, title, topic, description,
-                    deadline, status)
+                    deadline, status, expected_version)
 
+    @_observed
     def create_goal(self, user_id, title, topic, description, parent_id=None,
                     deadline=None, status=0):
         '''
@@ -344,6 +641,62 @@ class Connection(object):
         return self.goal_repo.create_goal(user_id, parent_id, title, topic,
                     description, deadline, status)
 
+    @_observed
+    def count_goals(self, user_id=None, before=None, after=None):
+        '''
+        Count the goals filtered by the same conditions as
+        :py:meth:`get_goals`, without fetching them.
+
+        In order to maintain a clear separation of responsibilities this method
+        delegates the execution to the corresponding method from
+        :py:class:`GoalRepo' and returns the result
+
+        :param int user_id: Default None. Count the goals of the user with the
+            given user_id. If None, the goals of every user are counted.
+        :param int before: Default None. Goals with a deadline >= ``before``
+            (UNIX timestamp) are not counted.
+        :param int after: Default None. Goals with a deadline <= ``after``
+            (UNIX timestamp) are not counted.
+        :return: the number of goals (int).
+        :raises ValueError: if ``before`` or ``after`` are not valid UNIX
+            timestamps
+        '''
+        self.set_foreign_keys_support()
+        return self.goal_repo.count_goals(user_id, before, after)
+
+    @_observed_generator
+    def get_due_goals(self, window_start=None, window_end=None, status_in=None,
+                      batch_size=constants.DUE_GOALS_BATCH_SIZE):
+        '''
+        Stream the goals whose deadline is in the time window
+        [``window_start``, ``window_end``), sorted by deadline. Used by the
+        reminder jobs, for instance to find the goals not done due in the next
+        24 hours or the overdue ones.
+
+        In order to maintain a clear separation of responsibilities this method
+        delegates the execution to the corresponding method from
+        :py:class:`GoalRepo' and returns the result
+
+        :param int window_start: Default None. Start of the window (UNIX
+            timestamp). If None, the window has no start.
+        :param int window_end: Default None. End of the window, excluded
+            (UNIX timestamp). If None, the window has no end.
+        :param status_in: Default None. Statuses of the goals returned. If
+            None, the goals not done (status < 1) are returned.
+        :type status_in: tuple of float
+        :param int batch_size: Default
+            :py:data:`constants.DUE_GOALS_BATCH_SIZE`. Number of goals read
+            from the database at once.
+        :return: generator of goals. Each goal is a dictionary with the
+            format provided in :py:meth:`GoalRepo._create_goal_object`.
+        :raises ValueError: if ``window_start`` or ``window_end`` are not
+            valid UNIX timestamps.
+        '''
+        self.set_foreign_keys_support()
+        return self.goal_repo.get_due_goals(window_start, window_end,
+                                            status_in, batch_size)
+
+    @_observed
     def contains_goal(self, goal_id):
         '''
         Checks if a goal is in the database.
@@ -356,6 +709,7 @@ class Connection(object):
 
 
     # RESOURCE METHODS
+    @_observed
     def get_resource(self, resource_id):
         '''
         Extracts a resource from the database.
@@ -382,6 +736,27 @@ class Connection(object):
         self.set_foreign_keys_support()
         return self.resource_repo.get_resource(resource_id)
 
+    @_observed
+    def get_resource_if_changed(self, resource_id, known_version=None):
+        '''
+        Extracts a resource from the database, unless the caller already knows
+        its current version. Every write of the resource increments its
+        version, including the unlinking of the resources of a deleted user.
+
+        :param int resource_id: Id of the resource to be retrieved
+        :param int known_version: Default None. Version of the resource
+            returned by a previous call.
+        :return: None if the resource does not exist, else a tuple (version,
+            resource). resource is None if the version is ``known_version``:
+            the resource is not modified, and is neither fetched nor built.
+            Otherwise it is a dictionary with the format of
+            :py:meth:`get_resource`.
+        '''
+        self.set_foreign_keys_support()
+        return self.resource_repo.get_resource_if_changed(resource_id,
+                                                          known_version)
+
+    @_observed
     def get_resources(self, goal_id=None, user_id=None,
                       number_of_resource=None, max_length=None):
         '''
@@ -420,22 +795,49 @@ class Connection(object):
         return self.resource_repo.get_resources(goal_id, user_id,
                                                 number_of_resource, max_length)
 
+    @_observed
+    def count_resources(self, goal_id=None, user_id=None, max_length=None):
+        '''
+        Count the resources filtered by the same conditions as
+        :py:meth:`get_resources`, without fetching them.
+
+        In order to maintain a clear separation of responsibilities this method
+        delegates the execution to the corresponding method from
+        :py:class:`ResourceRepo' and returns the result
+
+        :param int goal_id: Default None. Count the resources of the goal with
+            the given goal_id. If None, resources of all the goals are counted.
+        :param int user_id: Default None. Count the resources of the user with
+            the given user_id. If None, resources of all the users are counted.
+        :param int max_length: Default None. Resources with a required time
+            greater than max_length are not counted.
+        :return: the number of resources (int) or None if a parameter is not
+            valid.
+        '''
+        self.set_foreign_keys_support()
+        return self.resource_repo.count_resources(goal_id, user_id, max_length)
+
+    @_observed
     def delete_resource(self, resource_id):
         '''
         Delete the resource with id given as parameter.
 
         In order to maintain a clear separation of responsibilities this method
         delegates the execution to the corresponding method from
-        :py:class:`ResourceRepo' and returns the result
+        :py:class:`ResourceRepo' and returns the result. If the Engine uses
+        the soft delete mode, the resource is only tombstoned and hidden until
+        it is purged.
 
         :param int resource_id: Id of the resource to remove.
-        :return: True if the resource has been deleted, False otherwise
+        :return: True if the resource has been deleted, False otherwise (or if it
+            is already hidden, in soft delete mode)
         '''
 
         self.set_foreign_keys_support()
         return self.resource_repo.delete_resource(resource_id)
 
-    def modify_resource(self, resource_id, rating):
+    @_observed
+    def modify_resource(self, resource_id, rating, expected_version=None):
         '''
         Modify the rating of the resource with id ``resource_id``
 
@@ -443,17 +845,27 @@ class Connection(object):
         delegates the execution to the corresponding method from
         :py:class:`ResourceRepo' and returns the result
 
+        With ``expected_version``, the resource is only modified if its
+        version is still the one returned by
+        :py:meth:`get_resource_if_changed`, as :py:meth:`modify_goal` does.
+
         :param int resource_id: The id of the resource to modify.
         :param rating: The resource's rating
         :type rating: float
+        :param int expected_version: Default None. The version of the
+            resource read by the caller.
         :return: The id of the modified resource or None. None is returned
-                 if the resource was not found or if the rating parameter is
-                 not a float value.
+                 if the resource was not found (or is hidden in soft delete
+                 mode) or if the rating parameter is not a float value.
+                 :py:data:`constants.CONFLICT` is returned if the resource has
+                 been modified since the caller read ``expected_version``.
         '''
 
         self.set_foreign_keys_support()
-        return self.resource_repo.modify_resource(resource_id, rating)
+        return self.resource_repo.modify_resource(resource_id, rating,
+                                                  expected_version)
 
+    @_observed
     def create_resource(self, goal_id, user_id, title, link,
                         topic, description=None, required_time=None):
         '''
@@ -482,6 +894,7 @@ class Connection(object):
         return self.resource_repo.create_resource(goal_id, user_id, title, link,
                                                   topic, description, required_time)
 
+    @_observed
     def contains_resource(self, resource_id):
         '''
         Checks if a resource is in the database.
@@ -490,4 +903,38 @@ class Connection(object):
         :return: True if the resource is in the database. False otherwise.
         '''
 
-        return self.get_resource(resource_id) is not None
+        return self.resource_repo.get_resource(resource_id) is not None
+
+    # CHANGES METHODS
+    @_observed
+    def read_changes(self, since_seq=0, limit=constants.CHANGES_BATCH_SIZE):
+        '''
+        Extract the users, goals and resources inserted, updated or deleted
+        after the change with sequence number ``since_seq``, so a consumer
+        can keep a copy of the data in sync by reading the changes only.
+        Passing the ``seq`` of the last change returned reads the next ones.
+
+        :param int since_seq: Default 0. Sequence number of the last change
+            already read.
+        :param int limit: Default :py:data:`constants.CHANGES_BATCH_SIZE`.
+            Maximum number of changes returned.
+        :return: list of dictionaries with the format provided in
+            :py:meth:`ChangeRepo._create_change_object`, oldest first.
+        :raises ValueError: if ``since_seq`` or ``limit`` are not valid.
+        '''
+        self.set_foreign_keys_support()
+        return self.change_repo.read_changes(since_seq, limit)
+
+    @_observed
+    def compact_changes(self, up_to_seq):
+        '''
+        Remove the changes with a sequence number up to ``up_to_seq``, except
+        the last one of every row, so the table of changes does not grow
+        with the number of writes.
+
+        :param int up_to_seq: sequence number of the last change compacted.
+        :return: the number of changes removed (int).
+        :raises ValueError: if ``up_to_seq`` is not valid.
+        '''
+        self.set_foreign_keys_support()
+        return self.change_repo.compact_changes(up_to_seq)
@@ -9,9 +9,109 @@ DEFAULT_DB_PATH = 'db/goalz.db'
 DEFAULT_SCHEMA = "db/goalz_schema_dump.sql"
 DEFAULT_DATA_DUMP = "db/goalz_data_dump.sql"
 
+# Database file used by the tests. It can be overridden through the
+# environment variable below, so test modules can run in parallel processes.
+DEFAULT_TEST_DB_PATH = 'db/goalz_test.db'
+TEST_DB_PATH_ENV = 'GOALZ_TEST_DB'
+
+# Number of statements executed in each transaction when loading a dump file
+LOADER_BATCH_SIZE = 10000
+
+# Tables of the database, ordered so that every table is listed after the
+# tables it references
+TABLES = ('users', 'user_profile', 'goals', 'resources')
+# Tables whose changes are recorded in the table changes
+CHANGE_TABLES = ('users', 'goals', 'resources')
+# Number of rows read or written at once when importing or exporting tables
+TRANSFER_CHUNK_SIZE = 1000
+# Number of rowids backfilled in each transaction by the schema migrations
+MIGRATION_BATCH_SIZE = 1000
+# Upper bounds, in seconds, of the buckets of the latency histograms
+METRICS_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Number of goals fetched by every query of get_due_goals
+DUE_GOALS_BATCH_SIZE = 500
+# SQLite virtual machine instructions between calls of the profiler handler
+PROFILER_PROGRESS_STEPS = 1000
+# Pages copied by every step of the persistence of an in-memory database
+PERSIST_BACKUP_PAGES = 1024
+# Maximum free pages returned to the filesystem by a maintenance tick
+MAINTENANCE_VACUUM_PAGES = 256
+# Rows of each index examined by the ANALYZE of a maintenance tick
+MAINTENANCE_ANALYSIS_LIMIT = 1000
+# Seconds after which the maintenance runs ANALYZE again
+MAINTENANCE_ANALYZE_PERIOD = 3600
+# Initial and maximum number of rows deleted by a transaction of the bulk
+# deletes, and seconds a transaction should last (see BatchedDelete)
+BULK_DELETE_BATCH_SIZE = 500
+BULK_DELETE_MAX_BATCH_SIZE = 10000
+BULK_DELETE_MAX_SECONDS = 0.05
+# Maximum tombstoned users, goals and resources purged by a maintenance tick
+PURGE_MAX_ROOTS = 100
+# Default number of changes returned by read_changes
+CHANGES_BATCH_SIZE = 1000
+# Result of a modification whose expected version is not the current version
+# of the row, modified meanwhile by another writer
+CONFLICT = 'conflict'
+# Performance profiles of the Engine: pragmas applied to every connection.
+# The page_size is only applied to new databases, or by a rebuild (VACUUM).
+# Negative cache sizes are in KiB, mmap sizes in bytes.
+PERFORMANCE_PROFILES = {
+    # Large scans read the pages through the memory map instead of the pager
+    'read_heavy': {'page_size': 8192, 'mmap_size': 268435456,
+                   'cache_size': -65536, 'temp_store': 'MEMORY'},
+    # Writes go through the pager anyway, so the memory goes to its cache
+    'write_heavy': {'page_size': 4096, 'mmap_size': 0,
+                    'cache_size': -65536, 'temp_store': 'MEMORY'},
+    'low_memory': {'page_size': 4096, 'mmap_size': 0, 'cache_size': -512,
+                   'temp_store': 'FILE'},
+    # Index builds and large transactions keep their pages and sorts in memory
+    'bulk_load': {'page_size': 16384, 'mmap_size': 0, 'cache_size': -262144,
+                  'temp_store': 'MEMORY'},
+}
+# Pragmas of the performance profiles applied to every connection
+PERFORMANCE_PRAGMAS = ('mmap_size', 'cache_size', 'temp_store')
+
 # SQL statements used in the db laye`r
 SQL_TURN_FOREIGN_KEY_ON = "PRAGMA foreign_keys = ON"
 SQL_TURN_FOREIGN_KEY_OFF = "PRAGMA foreign_keys = OFF"
+SQL_DEFER_FOREIGN_KEYS = "PRAGMA defer_foreign_keys = ON"
+SQL_VACUUM = "VACUUM"
+SQL_AUTO_VACUUM_INCREMENTAL = "PRAGMA auto_vacuum = INCREMENTAL"
+SQL_INCREMENTAL_VACUUM = "PRAGMA incremental_vacuum(%d)"
+SQL_OPTIMIZE = "PRAGMA optimize"
+SQL_ANALYZE = "ANALYZE"
+SQL_WAL_CHECKPOINT = "PRAGMA wal_checkpoint(PASSIVE)"
+SQL_DATA_VERSION = "PRAGMA data_version"
+SQL_SELECT_STAT1_TABLE = "SELECT name FROM sqlite_master \
+                          WHERE type = 'table' AND name = 'sqlite_stat1'"
+SQL_SELECT_SEQUENCE_TABLE = "SELECT name FROM sqlite_master \
+                             WHERE type = 'table' AND name = 'sqlite_sequence'"
+# The sequence numbers of the changes are kept, so the consumers reading them
+# never miss a change made after a clear
+SQL_DELETE_SEQUENCE_DATA = "DELETE FROM sqlite_sequence WHERE name <> 'changes'"
+SQL_SELECT_USER_STATS_TABLE = "SELECT name FROM sqlite_master \
+                               WHERE type = 'table' AND name = 'user_stats'"
+SQL_SELECT_USERS_TABLE = "SELECT name FROM sqlite_master \
+                          WHERE type = 'table' AND name = 'users'"
+SQL_SELECT_CHANGES_TABLE = "SELECT name FROM sqlite_master \
+                            WHERE type = 'table' AND name = 'changes'"
+SQL_SELECT_TRIGGERS = "SELECT name, sql FROM sqlite_master \
+                       WHERE type = 'trigger'"
+
+# MIGRATIONS statements
+SQL_CREATE_MIGRATION_PROGRESS_TABLE = 'CREATE TABLE IF NOT EXISTS \
+                                       migration_progress( \
+                                       version INTEGER PRIMARY KEY, \
+                                       last_key INTEGER, \
+                                       max_key INTEGER)'
+SQL_SELECT_MIGRATION_PROGRESS = 'SELECT last_key, max_key FROM migration_progress \
+                                 WHERE version = ?'
+SQL_INSERT_MIGRATION_PROGRESS = 'INSERT INTO migration_progress \
+                                 (version, last_key, max_key) VALUES(?,?,?)'
+SQL_UPDATE_MIGRATION_PROGRESS = 'UPDATE migration_progress SET last_key = ? \
+                                 WHERE version = ?'
+SQL_DELETE_MIGRATION_PROGRESS = 'DELETE FROM migration_progress WHERE version = ?'
 
 # USERS statements
 SQL_SELECT_USER_BY_ID = 'SELECT user_id from users WHERE user_id = ?'
@@ -19,17 +119,281 @@ SQL_SELECT_USER_BY_NICKNAME = 'SELECT user_id from users WHERE nickname = ?'
 SQL_SELET_USER_AND_PROFILE_BY_ID = 'SELECT users.*, user_profile.* FROM users, user_profile \
                                     WHERE users.user_id = ? \
                                     AND user_profile.user_id = users.user_id'
+SQL_SELECT_USER_AND_PROFILE_BY_NICKNAME = 'SELECT users.*, user_profile.* \
+                                    FROM users, user_profile \
+                                    WHERE users.nickname = ? \
+                                    AND user_profile.user_id = users.user_id'
 SQL_SELECT_USER_AND_PROFILE = 'SELECT users.*, user_profile.* FROM users, user_profile \
                                WHERE users.user_id = user_profile.user_id'
+# Public columns of the users listed by get_users
+# Completed with the expression of the sort key, see USERS_SORT_KEYS
+SQL_SELECT_USERS_PUBLIC = 'SELECT users.nickname, users.registration_date, \
+                           user_profile.rating, user_profile.website, \
+                           user_profile.user_id, %s AS sort_key \
+                           FROM users, user_profile \
+                           WHERE user_profile.user_id = users.user_id'
+# Sort keys of get_users: the ordered expression, the column breaking the
+# ties (both backed by an index) and whether the expression can be NULL. The
+# values of the expression are stored in the keyset cursors. NULL values are
+# sorted first, and ordered as 0 for the registration date and the rating.
+USERS_SORT_KEYS = {
+    None: ('user_profile.user_id', None, False),
+    'nickname': ('users.nickname', 'users.user_id', True),
+    'registration_date': ('IFNULL(users.registration_date, 0)',
+                          'users.user_id', False),
+    'rating': ('IFNULL(user_profile.rating, 0)', 'user_profile.user_id',
+               False),
+}
+# Aggregates of the goals and resources of a user. No row is returned if the
+# user does not exist
+SQL_SELECT_USER_SUMMARY = 'SELECT goals.*, resources.* FROM \
+    (SELECT COUNT(*) AS goals, \
+            COUNT(CASE WHEN IFNULL(status, 0) <= 0 THEN 1 END) AS not_started, \
+            COUNT(CASE WHEN status > 0 AND status < 1 THEN 1 END) \
+                AS in_progress, \
+            COUNT(CASE WHEN status >= 1 THEN 1 END) AS done \
+     FROM goals WHERE user_id = :user_id) AS goals, \
+    (SELECT COUNT(*) AS resources, AVG(rating) AS average_rating, \
+            IFNULL(SUM(required_time), 0) AS required_time \
+     FROM resources WHERE user_id = :user_id) AS resources \
+    WHERE EXISTS (SELECT 1 FROM users WHERE user_id = :user_id)'
+# USER STATS statements. The table user_stats is maintained by the triggers
+# created by the schema migration 4
+SQL_CREATE_USER_STATS_TABLE = 'CREATE TABLE IF NOT EXISTS user_stats( \
+    user_id INTEGER PRIMARY KEY, \
+    goals_not_started INTEGER NOT NULL DEFAULT 0, \
+    goals_in_progress INTEGER NOT NULL DEFAULT 0, \
+    goals_done INTEGER NOT NULL DEFAULT 0, \
+    resources INTEGER NOT NULL DEFAULT 0, \
+    rating_sum REAL NOT NULL DEFAULT 0, \
+    rating_count INTEGER NOT NULL DEFAULT 0, \
+    required_time INTEGER NOT NULL DEFAULT 0)'
+# Statistics of every user computed from the goals and resources tables. The
+# subqueries use the indexes on goals.user_id and resources.user_id
+SQL_SELECT_EXPECTED_USER_STATS = 'SELECT users.user_id, \
+    (SELECT COUNT(*) FROM goals WHERE goals.user_id = users.user_id \
+        AND IFNULL(status, 0) <= 0) AS goals_not_started, \
+    (SELECT COUNT(*) FROM goals WHERE goals.user_id = users.user_id \
+        AND status > 0 AND status < 1) AS goals_in_progress, \
+    (SELECT COUNT(*) FROM goals WHERE goals.user_id = users.user_id \
+        AND status >= 1) AS goals_done, \
+    (SELECT COUNT(*) FROM resources \
+        WHERE resources.user_id = users.user_id) AS resources, \
+    (SELECT TOTAL(rating) FROM resources \
+        WHERE resources.user_id = users.user_id) AS rating_sum, \
+    (SELECT COUNT(rating) FROM resources \
+        WHERE resources.user_id = users.user_id) AS rating_count, \
+    (SELECT IFNULL(SUM(required_time), 0) FROM resources \
+        WHERE resources.user_id = users.user_id) AS required_time \
+    FROM users'
+SQL_INSERT_EXPECTED_USER_STATS = 'INSERT OR REPLACE INTO user_stats \
+    (user_id, goals_not_started, goals_in_progress, goals_done, resources, \
+     rating_sum, rating_count, required_time) ' + SQL_SELECT_EXPECTED_USER_STATS
+# Backfill of the statistics of a range of users (see BackfillMigration)
+SQL_BACKFILL_USER_STATS = SQL_INSERT_EXPECTED_USER_STATS + \
+    ' WHERE users.user_id > :start AND users.user_id <= :end'
+SQL_DELETE_USER_STATS_DATA = 'DELETE FROM user_stats'
+SQL_SELECT_USER_STATS = 'SELECT * FROM user_stats WHERE user_id = ?'
+# Users whose statistics are missing or differ from the expected ones, and
+# statistics of users which do not exist
+SQL_SELECT_INCONSISTENT_USER_STATS = 'SELECT expected.user_id \
+    FROM (' + SQL_SELECT_EXPECTED_USER_STATS + ') AS expected \
+    LEFT JOIN user_stats ON user_stats.user_id = expected.user_id \
+    WHERE user_stats.user_id IS NULL \
+    OR user_stats.goals_not_started != expected.goals_not_started \
+    OR user_stats.goals_in_progress != expected.goals_in_progress \
+    OR user_stats.goals_done != expected.goals_done \
+    OR user_stats.resources != expected.resources \
+    OR ABS(user_stats.rating_sum - expected.rating_sum) > 1e-6 \
+    OR user_stats.rating_count != expected.rating_count \
+    OR user_stats.required_time != expected.required_time \
+    UNION SELECT user_id FROM user_stats \
+    WHERE user_id NOT IN (SELECT user_id FROM users) \
+    ORDER BY 1'
 SQL_DELETE_USER = 'DELETE FROM users WHERE user_id = ?'
+# BULK DELETE statements. The ids are given as a JSON array
+# Goals of the trees rooted at the goals of the users, leaves first
+SQL_SELECT_USERS_GOAL_TREES = 'WITH RECURSIVE tree(goal_id, depth) AS ( \
+    SELECT goal_id, 0 FROM goals \
+        WHERE user_id IN (SELECT value FROM json_each(?)) \
+    UNION ALL SELECT goals.goal_id, tree.depth + 1 FROM goals, tree \
+        WHERE goals.parent_id = tree.goal_id) \
+    SELECT goal_id FROM tree GROUP BY goal_id ORDER BY MAX(depth) DESC'
+# Goals of the tree rooted at a goal, leaves first
+SQL_SELECT_GOAL_TREE = 'WITH RECURSIVE tree(goal_id, depth) AS ( \
+    SELECT goal_id, 0 FROM goals WHERE goal_id = ? \
+    UNION ALL SELECT goals.goal_id, tree.depth + 1 FROM goals, tree \
+        WHERE goals.parent_id = tree.goal_id) \
+    SELECT goal_id FROM tree ORDER BY depth DESC'
+# Goals of the trees rooted at the goals, leaves first
+SQL_SELECT_GOAL_TREES = 'WITH RECURSIVE tree(goal_id, depth) AS ( \
+    SELECT goal_id, 0 FROM goals \
+        WHERE goal_id IN (SELECT value FROM json_each(?)) \
+    UNION ALL SELECT goals.goal_id, tree.depth + 1 FROM goals, tree \
+        WHERE goals.parent_id = tree.goal_id) \
+    SELECT goal_id FROM tree GROUP BY goal_id ORDER BY MAX(depth) DESC'
+SQL_DELETE_RESOURCES_OF_GOALS = 'DELETE FROM resources \
+    WHERE goal_id IN (SELECT value FROM json_each(?))'
+SQL_DELETE_GOALS_BY_ID = 'DELETE FROM goals \
+    WHERE goal_id IN (SELECT value FROM json_each(?))'
+SQL_DELETE_RESOURCES_BY_ID = 'DELETE FROM resources \
+    WHERE resource_id IN (SELECT value FROM json_each(?))'
+SQL_SELECT_RESOURCES_OF_USERS = 'SELECT resource_id FROM resources \
+    WHERE user_id IN (SELECT value FROM json_each(?))'
+# Same action as the ON DELETE SET NULL of resources.user_id
+SQL_UNLINK_RESOURCES = 'UPDATE resources \
+    SET user_id = NULL, version = version + 1 \
+    WHERE resource_id IN (SELECT value FROM json_each(?))'
+SQL_DELETE_USERS_BY_ID = 'DELETE FROM users \
+    WHERE user_id IN (SELECT value FROM json_each(?))'
+# SOFT DELETE. Deleted rows get a deleted_at timestamp (tombstone) and are
+# hidden by the live_* views until they are purged
+SQL_SOFT_DELETE_USER = 'UPDATE users \
+    SET deleted_at = ?, version = version + 1 \
+    WHERE user_id = ? AND deleted_at IS NULL'
+SQL_SOFT_DELETE_USERS_BY_ID = 'UPDATE users \
+    SET deleted_at = ?, version = version + 1 \
+    WHERE user_id IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL'
+SQL_SOFT_DELETE_GOAL = 'UPDATE goals \
+    SET deleted_at = ?, version = version + 1 \
+    WHERE goal_id = ? AND deleted_at IS NULL'
+SQL_SOFT_DELETE_RESOURCE = 'UPDATE resources \
+    SET deleted_at = ?, version = version + 1 \
+    WHERE resource_id = ? AND deleted_at IS NULL'
+# True if no goal nor user is tombstoned. Not correlated, so it is evaluated
+# once per statement, from the partial indexes of the tombstones
+SQL_NO_TOMBSTONES = '(NOT EXISTS (SELECT 1 FROM goals \
+    WHERE deleted_at IS NOT NULL) AND NOT EXISTS (SELECT 1 FROM users \
+    WHERE deleted_at IS NOT NULL))'
+# Whether any row is tombstoned, read from the partial indexes of the
+# tombstones
+SQL_SELECT_ANY_TOMBSTONE = 'SELECT EXISTS (SELECT 1 FROM users \
+    WHERE deleted_at IS NOT NULL) OR EXISTS (SELECT 1 FROM goals \
+    WHERE deleted_at IS NOT NULL) OR EXISTS (SELECT 1 FROM resources \
+    WHERE deleted_at IS NOT NULL)'
+SQL_CREATE_LIVE_USERS_VIEW = 'CREATE VIEW IF NOT EXISTS live_users AS \
+    SELECT * FROM users WHERE deleted_at IS NULL'
+# A goal is hidden if it, one of its ancestors or the user of one of them is
+# tombstoned
+SQL_CREATE_LIVE_GOALS_VIEW = 'CREATE VIEW IF NOT EXISTS live_goals AS \
+    SELECT goal.* FROM goals AS goal WHERE goal.deleted_at IS NULL \
+    AND (' + SQL_NO_TOMBSTONES + ' OR NOT EXISTS ( \
+        WITH RECURSIVE up(goal_id) AS ( \
+            SELECT goal.goal_id \
+            UNION ALL SELECT parent.parent_id FROM goals AS parent, up \
+                WHERE parent.goal_id = up.goal_id \
+                AND parent.parent_id IS NOT NULL) \
+        SELECT 1 FROM up, goals AS ancestor \
+        WHERE ancestor.goal_id = up.goal_id \
+        AND (ancestor.deleted_at IS NOT NULL OR EXISTS ( \
+            SELECT 1 FROM users WHERE users.user_id = ancestor.user_id \
+            AND users.deleted_at IS NOT NULL))))'
+# A resource is hidden if it or its goal is
+SQL_CREATE_LIVE_RESOURCES_VIEW = 'CREATE VIEW IF NOT EXISTS live_resources \
+    AS SELECT resource.* FROM resources AS resource \
+    WHERE resource.deleted_at IS NULL \
+    AND (' + SQL_NO_TOMBSTONES + ' OR resource.goal_id IS NULL \
+         OR EXISTS (SELECT 1 FROM live_goals \
+                    WHERE live_goals.goal_id = resource.goal_id))'
+# Appended to the WHERE clauses of the modifications in soft delete mode, so
+# the rows hidden from the reads are not modified either
+SQL_LIVE_USER_FILTER = ' AND deleted_at IS NULL'
+SQL_LIVE_PROFILE_FILTER = ' AND EXISTS (SELECT 1 FROM live_users \
+    WHERE live_users.user_id = user_profile.user_id)'
+SQL_LIVE_GOAL_FILTER = ' AND EXISTS (SELECT 1 FROM live_goals \
+    WHERE live_goals.goal_id = goals.goal_id)'
+SQL_LIVE_RESOURCE_FILTER = ' AND EXISTS (SELECT 1 FROM live_resources \
+    WHERE live_resources.resource_id = resources.resource_id)'
+# Oldest tombstones first, read from the partial indexes of the tombstones
+SQL_SELECT_DELETED_USERS = 'SELECT user_id FROM users \
+    WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT ?'
+SQL_SELECT_DELETED_GOALS = 'SELECT goal_id FROM goals \
+    WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT ?'
+SQL_SELECT_DELETED_RESOURCES = 'SELECT resource_id FROM resources \
+    WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT ?'
+# CHANGES statements. The table changes is filled by the triggers created by
+# the schema migration 6. AUTOINCREMENT never reuses a sequence number, even
+# after the last changes are compacted
+SQL_CREATE_CHANGES_TABLE = 'CREATE TABLE IF NOT EXISTS changes( \
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, \
+    table_name TEXT NOT NULL, \
+    row_id INTEGER NOT NULL, \
+    operation TEXT NOT NULL, \
+    changed_at INTEGER)'
+# Statement of the triggers, completed with str.format
+SQL_RECORD_CHANGE = "INSERT INTO changes (table_name, row_id, operation, \
+    changed_at) VALUES ('{table}', {row_id}, {operation}, \
+    CAST(strftime('%s', 'now') AS INTEGER));"
+# Condition of the triggers, completed with str.format: the deletion of a row
+# is only recorded once, even if the row is later purged or updated by a cascade
+SQL_UNREPORTED_DELETE = "(SELECT operation FROM changes \
+    WHERE table_name = '{table}' AND row_id = {row_id} \
+    ORDER BY seq DESC LIMIT 1) IS NOT 'delete'"
+# Record the deletion of the goals and resources hidden by a tombstone, run
+# before the tombstone update. The rows already hidden are not recorded again
+_SQL_RECORD_HIDDEN = "INSERT INTO changes (table_name, row_id, operation, \
+    changed_at) WITH RECURSIVE tree(goal_id) AS ( \
+        SELECT goal_id FROM goals WHERE {roots} \
+        UNION SELECT goals.goal_id FROM goals, tree \
+            WHERE goals.parent_id = tree.goal_id) \
+    SELECT 'resources', resource_id, 'delete', \
+        CAST(strftime('%s', 'now') AS INTEGER) \
+    FROM live_resources WHERE goal_id IN tree \
+    UNION ALL SELECT 'goals', goal_id, 'delete', \
+        CAST(strftime('%s', 'now') AS INTEGER) \
+    FROM live_goals WHERE goal_id IN tree{goals}"
+# The root goal itself is recorded by the trigger of its tombstone
+SQL_RECORD_HIDDEN_BY_GOAL = _SQL_RECORD_HIDDEN.format(
+    roots='goal_id = ?1', goals=' AND goal_id <> ?1')
+SQL_RECORD_HIDDEN_BY_USER = _SQL_RECORD_HIDDEN.format(
+    roots='user_id = ?', goals='')
+# Bound with the parameters of SQL_SOFT_DELETE_USERS_BY_ID
+SQL_RECORD_HIDDEN_BY_USERS = _SQL_RECORD_HIDDEN.format(
+    roots='user_id IN (SELECT value FROM json_each(?2))', goals='')
+SQL_SELECT_CHANGES = 'SELECT seq, table_name, row_id, operation, changed_at \
+    FROM changes WHERE seq > ? ORDER BY seq LIMIT ?'
+# Keep only the last change of every row among the changes up to a sequence
+# number
+SQL_COMPACT_CHANGES = 'DELETE FROM changes WHERE seq <= :seq \
+    AND seq NOT IN (SELECT MAX(seq) FROM changes WHERE seq <= :seq \
+                    GROUP BY table_name, row_id)'
+SQL_DELETE_CHANGES_DATA = 'DELETE FROM changes'
+# Last sequence number of the changes, kept when the tables are cleared or the
+# database is recreated, so the consumers never miss nor repeat a change
+SQL_SELECT_CHANGES_SEQUENCE = "SELECT seq FROM sqlite_sequence \
+    WHERE name = 'changes'"
+SQL_UPDATE_CHANGES_SEQUENCE = "UPDATE sqlite_sequence SET seq = ? \
+    WHERE name = 'changes'"
+# The changes restored with the database are renumbered after the last
+# sequence number: first moved out of the way, then shifted
+SQL_NEGATE_CHANGES_SEQ = 'UPDATE changes SET seq = -seq'
+SQL_SHIFT_CHANGES_SEQ = 'UPDATE changes SET seq = ? - seq WHERE seq < 0'
+# Recorded for every table whose rows are deleted at once, with id 0
+SQL_RECORD_TRUNCATION = "INSERT INTO changes (seq, table_name, row_id, \
+    operation, changed_at) VALUES (?, ?, 0, 'truncate', \
+    CAST(strftime('%s', 'now') AS INTEGER))"
+# VERSIONS statements. Every write of a user (or its profile), a goal or a
+# resource increments its version, created by the schema migration 7. The
+# versions are read with a primary key lookup
+SQL_SELECT_USER_VERSION = 'SELECT version FROM users WHERE user_id = ?'
+SQL_SELECT_GOAL_VERSION = 'SELECT version FROM goals WHERE goal_id = ?'
+SQL_SELECT_RESOURCE_VERSION = 'SELECT version FROM resources \
+    WHERE resource_id = ?'
+# Appended to the WHERE clause of a modification: the row is only modified if
+# it is still at the version read by the caller (compare-and-swap)
+SQL_VERSION_FILTER = ' AND version = ?'
 SQL_DELETE_USERS_DATA = "DELETE FROM users"
 SQL_DELETE_USERS_PROFILE_DATA = "DELETE FROM user_profile"
-SQL_UPDATE_USER_PASSWORD = 'UPDATE users SET password = ?\
-                            WHERE user_id = ?'
-SQL_UPDATE_USER_PROFILE = 'UPDATE user_profile SET firstname = ?,lastname = ?, \
-                            email = ?,age = ?, \
-                            gender = ?,website = ? \
-                            WHERE user_id = ?'
+# Run after the update of the profile, if any, so a modification of the user
+# increments its version once. A password set to NULL is kept
+SQL_UPDATE_USER = 'UPDATE users \
+                   SET password = IFNULL(?, password), version = version + 1 \
+                   WHERE user_id = ?'
+# Columns of user_profile which can be modified, see SQL_UPDATE_USER_PROFILE
+USER_PROFILE_COLUMNS = ('firstname', 'lastname', 'email', 'age', 'gender',
+                        'website')
+# Completed with the assignments of the modified columns only
+SQL_UPDATE_USER_PROFILE = 'UPDATE user_profile SET %s WHERE user_id = ?'
 SQL_INSERT_USER = 'INSERT INTO users(nickname,password,registration_date)\
                    VALUES(?,?,?)'
 SQL_INSERT_USER_PROFILE = 'INSERT INTO user_profile (user_id,firstname,lastname, \
@@ -39,13 +403,34 @@ SQL_DELETE_USERS_DATA = "DELETE FROM users"
 SQL_DELETE_USERS_PROFILE_DATA = "DELETE FROM user_profile"
 
 # GOALS statements
+# Columns of the goal objects, the tombstone is not part of them
+GOAL_COLUMNS = ('goal_id', 'parent_id', 'user_id', 'title', 'topic',
+                'description', 'deadline', 'status')
 SQL_DELETE_GOALS_DATA = "DELETE FROM goals"
 SQL_SELECT_GOAL_BY_ID = "SELECT * FROM goals WHERE goal_id = ?"
 SQL_DELETE_GOAL_BY_ID = "DELETE FROM goals WHERE goal_id = ?"
-SQL_UPDATE_GOAL = "UPDATE goals SET title = ?, topic = ?, description = ?, \
-                deadline = ?, status = ? WHERE goal_id = ?"
+# Columns of goals which can be modified, see SQL_UPDATE_GOAL
+GOAL_MODIFIABLE_COLUMNS = ('title', 'topic', 'description', 'deadline',
+                           'status')
+# Completed with the assignments of the modified columns only
+SQL_UPDATE_GOAL = "UPDATE goals SET %s, version = version + 1 \
+                WHERE goal_id = ?"
+# The goal is only inserted if its user and its parent goal (when given)
+# exist, so a single statement replaces the existence checks
 SQL_INSERT_GOAL = 'INSERT INTO goals (parent_id, title, topic, description, \
-                deadline, status, user_id) VALUES(?,?,?,?,?,?,?)'
+                deadline, status, user_id) \
+                SELECT :parent_id, :title, :topic, :description, :deadline, \
+                :status, :user_id \
+                WHERE EXISTS (SELECT 1 FROM users WHERE user_id = :user_id) \
+                AND (:parent_id IS NULL OR \
+                EXISTS (SELECT 1 FROM goals WHERE goal_id = :parent_id))'
+SQL_COUNT_GOALS = 'SELECT COUNT(*) FROM goals'
+# Goals not done yet with a deadline, completed with the filters of
+# get_due_goals. The condition on status matches the partial index
+# goals_open_deadline
+SQL_SELECT_DUE_GOALS = 'SELECT * FROM goals WHERE deadline IS NOT NULL'
+SQL_OPEN_GOALS_FILTER = 'status < 1'
+SQL_DUE_GOALS_ORDER = ' ORDER BY deadline, goal_id LIMIT ?'
 # SQL STATEMENTS FOR GET GOALS FILTERS AND UPDATE GOAL ARE IMPLEMENTED
 # INSIDE GOAL_REPO FOR READABILITY AND EASE OF USE
 
@@ -53,14 +438,22 @@ SQL_INSERT_GOAL = 'INSERT INTO goals (parent_id, title, topic, description, \
 SQL_DELETE_RESOURCES_DATA = "DELETE FROM resources"
 SQL_SELECT_RESOURCE_BY_ID = 'SELECT * FROM resources WHERE resource_id = ?'
 SQL_SELECT_RESOURCES = 'SELECT * FROM resources'
+SQL_COUNT_RESOURCES = 'SELECT COUNT(*) FROM resources'
 SQL_SELECT_RESOURCE_GOAL_ID_FILTER = 'goal_id = ?'
 SQL_SELECT_RESOURCE_USER_ID_FILTER = 'user_id = ?'
 SQL_SELECT_RESOURCE_LENGTH_FILTER = 'required_time < ?'
 SQL_DELETE_RESOURCE = 'DELETE FROM resources WHERE resource_id = ?'
-SQL_UPDATE_RESOURCE = 'UPDATE resources SET rating = ? WHERE resource_id = ?'
-SQL_INSERT_RESOURCE = 'INSERT INTO resources (goal_id, user_id, title,' \
-                      'link, topic, description, required_time, rating) \
-                       VALUES(?,?,?,?,?,?,?,?)'
+SQL_UPDATE_RESOURCE = 'UPDATE resources SET rating = ?, version = version + 1 \
+                       WHERE resource_id = ?'
+# The resource is only inserted if its goal and its user exist
+SQL_INSERT_RESOURCE = 'INSERT INTO resources (goal_id, user_id, title, \
+                       link, topic, description, required_time, rating) \
+                       SELECT :goal_id, :user_id, :title, :link, :topic, \
+                       :description, :required_time, :rating \
+                       WHERE EXISTS (SELECT 1 FROM goals \
+                                     WHERE goal_id = :goal_id) \
+                       AND EXISTS (SELECT 1 FROM users \
+                                   WHERE user_id = :user_id)'
 
 SQL_SELECT_USER_BY_ID = 'SELECT * from users WHERE user_id = ?'
 
@@ -8,8 +8,20 @@ Reference: Code taken and modified from PWP2018 exercise
 
 import os
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from src.db import constants
+from src.db.batching import BatchedDelete
+from src.db.cache import NicknameCache
 from src.db.connection import Connection
+from src.db.instrumentation import QueryStats, InstrumentedConnection
+from src.db.loader import DumpLoader
+from src.db.maintenance import Maintenance
+from src.db.memory import MemoryStore
+from src.db.metrics import EngineMetrics
+from src.db.migrations import Migrator
+from src.db.profiling import CallProfiler
+from src.db.transfer import TableTransfer
 
 
 class Engine(object):
@@ -28,9 +40,52 @@ class Engine(object):
     :param db_path: The path of the database file (always with respect to the calling
         script. If not specified, the Engine will use the file located at *db/src.db*
     :type db_path: str
+    :param bool migrate: Default True. Apply the pending schema migrations to
+        an existing database when the Engine is created. Database files
+        without tables are left as they are. See :py:meth:`migrate`.
+    :param bool instrument: Default False. Record the timing of every SQL
+        statement. See :py:meth:`stats`.
+    :param float slow_query_threshold: Default None. Statements taking more
+        seconds than this value are logged with their query plan while the
+        instrumentation is enabled.
+    :param bool metrics: Default False. Record the operational metrics
+        available in :py:attr:`metrics`. Can be changed at runtime with
+        ``engine.metrics.enabled``.
+    :param bool profile: Default False. Split the time of every
+        :py:class:`Connection` method into phases, see
+        :py:meth:`profile_stats`.
+    :param int nickname_cache_size: Default 0. Number of nicknames whose
+        user_id is cached by the connections, so lookups by nickname skip the
+        database. 0 disables the cache, which should only be enabled if no
+        other process writes the users table.
+    :param bool in_memory: Default False. Load the database file in memory
+        and serve every connection from there. The file is only written by
+        :py:meth:`persist` and :py:meth:`close`, see
+        :py:class:`src.db.memory.MemoryStore`.
+    :param float max_unsaved_seconds: Default None. In memory mode, persist
+        the modified database to the file with this period, in seconds, from
+        a background thread.
+    :param float maintenance_interval: Default None. Seconds between two
+        runs of the maintenance tasks (``ANALYZE``, ``PRAGMA optimize``,
+        incremental vacuum and WAL checkpoint) on a background thread. They
+        only run if the database was not written since the previous run. If
+        None, they only run when :py:meth:`maintain` is called.
+    :param str performance_profile: Default None. Name of one of the
+        :py:data:`constants.PERFORMANCE_PROFILES` configuring the memory map,
+        the page cache, the temporary storage and the page size of the
+        database. See :py:meth:`set_performance_profile`.
+    :param bool soft_delete: Default False. Deleting a user, a goal or a
+        resource only tombstones it, and the reads hide the tombstoned rows
+        and their dependents. They are physically deleted by
+        :py:meth:`purge`, which the maintenance runs when the database is
+        idle. See :py:mod:`src.db.softdelete`.
     '''
 
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, migrate=True, instrument=False,
+                 slow_query_threshold=None, metrics=False, profile=False,
+                 nickname_cache_size=0, in_memory=False,
+                 max_unsaved_seconds=None, performance_profile=None,
+                 maintenance_interval=None, soft_delete=False):
         '''
         '''
 
@@ -39,6 +94,36 @@ class Engine(object):
             self.db_path = db_path
         else:
             self.db_path = constants.DEFAULT_DB_PATH
+        # In-memory copy of a populated database used by reset_database
+        self._template = None
+        # Statistics shared by all the connections created by this Engine
+        self.query_stats = QueryStats(instrument, slow_query_threshold)
+        # Cache shared by the connections, see NicknameCache
+        self.nickname_cache = NicknameCache(nickname_cache_size) \
+            if nickname_cache_size else None
+        # Metrics in the Prometheus text format, see render_metrics
+        self.metrics = EngineMetrics(self, metrics)
+        self.open_connections = 0
+        # Profile of the calls per phase, see profile_stats
+        self.profiler = CallProfiler(profile)
+        # Deletes only tombstone the rows, see purge
+        self.soft_delete = soft_delete
+        self._connections_lock = threading.Lock()
+        # Pragmas executed by every new connection, see performance_profile
+        self.performance_profile = None
+        self._pragmas = ()
+        self._page_size = None
+        self.set_performance_profile(performance_profile)
+        # Database held in memory, see in_memory
+        self.memory = MemoryStore(self.db_path, max_unsaved_seconds) \
+            if in_memory else None
+        # Executor of the background jobs, see submit
+        self._jobs = None
+        self._jobs_lock = threading.Lock()
+        # Background maintenance, see maintain
+        self.maintenance = Maintenance(self, maintenance_interval)
+        if migrate and self._has_tables():
+            self.migrate()
 
     def connect(self):
         '''
@@ -48,81 +133,577 @@ class Engine(object):
         :rtype: Connection
         '''
 
-        return Connection(self.db_path)
+        return Connection(self.db_path, self)
 
     def create_tables(self, schema=None):
         '''
         Create programmatically the tables from a schema file.
 
+        When the default schema is used, the schema migrations are applied
+        afterwards, so the database is created with the latest version.
+
         :param schema: path to the .sql schema file. If this parameter is None, then
             *db/forum_schema_dump.sql* is used.
         '''
 
-        con = sqlite3.connect(self.db_path)
-        if schema is None:
-            schema = constants.DEFAULT_SCHEMA
+        con = self._connect()
         try:
-            with open(schema, encoding="utf-8") as file:
-                sql = file.read()
-                cur = con.cursor()
-                cur.executescript(sql)
+            if self._page_size is not None:
+                # Only effective while the database is empty
+                con.execute('PRAGMA page_size = %d' % self._page_size)
+            self._create_tables(con, schema)
         finally:
             con.close()
 
-    def populate_tables(self, dump=None):
+    def populate_tables(self, dump=None, progress=None):
         '''
         Populate programmatically the tables from a dump file.
 
+        The dump is streamed statement by statement and executed in large
+        transactions by :py:class:`DumpLoader`, so big dumps are never held
+        in memory.
+
         :param dump:  path to the .sql dump file. If this parameter is None, then
             *db/forum_data_dump.sql* is used.
+        :param progress: Default None. Function called periodically with the
+            loading statistics described in :py:meth:`DumpLoader.load`.
+        :return: the loading statistics described in :py:meth:`DumpLoader.load`.
         '''
 
-        con = sqlite3.connect(self.db_path)
+        self._clear_caches()
+        con = self._connect()
+        try:
+            return self._populate_tables(con, dump, progress)
+        finally:
+            con.close()
 
-        # Activate foreign keys support
-        keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
-        cur = con.cursor()
-        cur.execute(keys_on)
+    def create_template(self, schema=None, dump=None):
+        '''
+        Build, once, a populated copy of the database in memory. The copy is
+        used by :py:meth:`reset_database` to restore the database file without
+        parsing the .sql files again.
 
-        # Populate database from dump
-        if dump is None:
-            dump = constants.DEFAULT_DATA_DUMP
+        Calling this method again replaces the existing template.
+
+        :param schema: path to the .sql schema file. If this parameter is None,
+            then *db/goalz_schema_dump.sql* is used.
+        :param dump: path to the .sql dump file. If this parameter is None,
+            then *db/goalz_data_dump.sql* is used.
+        '''
+
+        self.drop_template()
+        template = sqlite3.connect(':memory:')
+        try:
+            self._create_tables(template, schema)
+            self._populate_tables(template, dump)
+        except Exception:
+            template.close()
+            raise
+        self._template = template
+
+    def reset_database(self):
+        '''
+        Restore the database file to the content of the template using the
+        sqlite3 backup API. The template is created with the default schema
+        and dump files if :py:meth:`create_template` was not called before.
+
+        The sequence numbers of the changes continue after the last one of
+        the database, see :py:meth:`clear`.
+
+        Every open :py:class:`Connection` to the database should be closed
+        before calling this method.
+        '''
+
+        if self._template is None:
+            self.create_template()
+        self._clear_caches()
+        con = self._connect()
+        try:
+            last_seq = self._last_change_seq(con)
+            self._template.backup(con)
+            if last_seq is not None:
+                self._continue_changes(con, last_seq)
+        finally:
+            con.close()
+
+    def drop_template(self):
+        '''
+        Release the in-memory template created by :py:meth:`create_template`.
+        '''
+
+        if self._template is not None:
+            self._template.close()
+            self._template = None
+
+    def migrate(self, progress=None, pause=0):
+        '''
+        Upgrade the database schema applying the pending migrations defined in
+        :py:data:`src.db.migrations.MIGRATIONS`. The version of the schema is
+        stored in ``PRAGMA user_version``.
+
+        Large backfills run in small batches, each one in its own transaction,
+        so other connections can keep writing while the migration runs, and an
+        interrupted migration is resumed by the next call.
+
+        :param progress: Default None. Function called after every backfill
+            batch. See :py:class:`Migrator`.
+        :param float pause: Default 0. Seconds to wait between backfill batches.
+        :return: the list of versions applied.
+        '''
+
+        con = self._connect()
+        try:
+            return Migrator(con, progress=progress, pause=pause).migrate()
+        finally:
+            con.close()
+
+    def schema_version(self):
+        '''
+        :return: the version of the database schema (int).
+        '''
+
+        con = self._connect()
+        try:
+            return Migrator(con).current_version()
+        finally:
+            con.close()
+
+    # USER STATISTICS
+    def check_user_stats(self):
+        '''
+        Compare the statistics maintained in the table ``user_stats`` with the
+        ones computed from the goals and resources tables.
+
+        :return: the sorted list of user_id whose statistics are missing,
+            wrong, or belong to a user which does not exist.
+        '''
+
+        con = self._connect()
+        try:
+            cur = con.cursor()
+            cur.execute(constants.SQL_SELECT_INCONSISTENT_USER_STATS)
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            con.close()
+
+    def rebuild_user_stats(self):
+        '''
+        Recompute the whole table ``user_stats`` from the goals and resources
+        tables in a single transaction. Only needed if the tables were
+        modified with the triggers disabled or the statistics were corrupted.
+        '''
+
+        con = self._connect()
         try:
-            with open(dump, encoding="utf-8") as file:
-                sql = file.read()
+            with con:
                 cur = con.cursor()
-                cur.executescript(sql)
+                cur.execute(constants.SQL_DELETE_USER_STATS_DATA)
+                cur.execute(constants.SQL_INSERT_EXPECTED_USER_STATS)
         finally:
             con.close()
 
+    def stats(self):
+        '''
+        Timing of the SQL statements executed through this Engine and its
+        connections since the instrumentation was enabled. Statements are
+        grouped by shape, meaning that literal values are ignored.
+
+        :return: dictionary with the format provided in
+            :py:meth:`QueryStats.snapshot`. Empty if the instrumentation was
+            never enabled.
+        '''
+
+        return self.query_stats.snapshot()
+
+    def set_instrumentation(self, enabled=True, slow_query_threshold=None):
+        '''
+        Enable or disable at runtime the instrumentation of the SQL statements,
+        for this Engine and all its open connections.
+
+        :param bool enabled: Default True. Record the statements.
+        :param float slow_query_threshold: Default None. Statements taking more
+            seconds than this value are logged with their query plan. If None,
+            no statement is logged.
+        '''
+
+        self.query_stats.slow_query_threshold = slow_query_threshold
+        self.query_stats.enabled = enabled
+
+    def reset_stats(self):
+        '''
+        Remove the timing recorded so far.
+        '''
+
+        self.query_stats.reset()
+
+    def profile_stats(self):
+        '''
+        Wall time of the :py:class:`Connection` methods called while the
+        profiling was enabled, split into phases: PRAGMA statements, execution
+        of the statements, fetching of the rows, construction of the returned
+        objects, commits and the remaining Python code.
+
+        :return: dictionary with the format provided in
+            :py:meth:`CallProfiler.snapshot`.
+        '''
+
+        return self.profiler.snapshot()
+
+    def set_profiling(self, enabled=True):
+        '''
+        Enable or disable at runtime the profiling of the calls, for this
+        Engine and all its open connections.
+
+        :param bool enabled: Default True. Profile the calls.
+        '''
+
+        self.profiler.enabled = enabled
+
+    def reset_profile(self):
+        '''
+        Remove the profile recorded so far.
+        '''
+
+        self.profiler.reset()
+
+    def dump_profile(self, path):
+        '''
+        Write the profile in the folded stacks format, which can be rendered
+        as a flamegraph with flamegraph.pl or speedscope.
+
+        :param str path: path of the file written.
+        '''
+
+        self.profiler.dump(path)
+
+    def render_metrics(self):
+        '''
+        Operational metrics of the Engine and its connections in the Prometheus
+        text exposition format: latency histograms and error counters per
+        :py:class:`Connection` method, commits, open connections, hits and
+        misses of the nickname cache and the sizes of the database and WAL
+        files. The function
+        :py:func:`src.db.metrics.metrics_app` serves them over WSGI.
+
+        :return: the metrics (str).
+        '''
+
+        return self.metrics.render()
+
+    def set_performance_profile(self, name, rebuild=False):
+        '''
+        Configure the connections created from now on with a performance
+        profile:
+
+        * ``read_heavy``: memory-mapped I/O, so large scans read the pages
+          without copying them through the page cache, and a large cache.
+        * ``write_heavy``: a large page cache and in-memory temporary tables.
+        * ``low_memory``: small page cache, temporary tables on disk.
+        * ``bulk_load``: very large page cache and larger pages.
+
+        The page size of the profile is used when the database is created
+        by :py:meth:`create_tables`. Changing the page size of an existing
+        database requires rebuilding it.
+
+        :param str name: name of one of the
+            :py:data:`constants.PERFORMANCE_PROFILES`, or None to keep the
+            defaults of SQLite.
+        :param bool rebuild: Default False. Rebuild the database with ``VACUUM``
+            if its page size differs from the one of the profile. The whole
+            database is rewritten and locked while it runs.
+        :raises ValueError: if ``name`` is not a valid profile.
+        '''
+
+        if name is None:
+            self.performance_profile = None
+            self._pragmas = ()
+            self._page_size = None
+            return
+        profile = constants.PERFORMANCE_PROFILES.get(name)
+        if profile is None:
+            raise ValueError('Unknown performance profile %r' % name)
+        self.performance_profile = name
+        self._page_size = profile['page_size']
+        self._pragmas = tuple('PRAGMA %s = %s' % (pragma, profile[pragma])
+                              for pragma in constants.PERFORMANCE_PRAGMAS)
+        if rebuild:
+            con = self._connect()
+            try:
+                page_size = con.execute('PRAGMA page_size').fetchone()[0]
+                if page_size != self._page_size:
+                    con.execute('PRAGMA page_size = %d' % self._page_size)
+                    con.execute(constants.SQL_VACUUM)
+            finally:
+                con.close()
+
+    def submit(self, method, *args, **kwargs):
+        '''
+        Run a :py:class:`Connection` method on a background thread, with its
+        own connection. Jobs run one after the other, in the order they were
+        submitted.
+
+        :Example:
+
+        >>> future = engine.submit('delete_users', [4, 5], progress=print)
+        >>> future.result()
+        2
+
+        :param str method: name of the Connection method.
+        :return: a :py:class:`concurrent.futures.Future` with the result of
+            the method.
+        '''
+
+        def job():
+            connection = self.connect()
+            try:
+                return getattr(connection, method)(*args, **kwargs)
+            finally:
+                connection.close()
+
+        with self._jobs_lock:
+            if self._jobs is None:
+                self._jobs = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix='goalz-job')
+            return self._jobs.submit(job)
+
+    def maintain(self):
+        '''
+        Run the maintenance tasks now, even if the database is being written:
+
+        * ``PRAGMA optimize``
+        * ``ANALYZE``, if the statistics of the query planner are missing or
+          old, limited by :py:data:`constants.MAINTENANCE_ANALYSIS_LIMIT`
+        * ``PRAGMA incremental_vacuum``, returning at most
+          :py:data:`constants.MAINTENANCE_VACUUM_PAGES` free pages to the
+          filesystem. Databases created by :py:meth:`create_tables` use
+          ``auto_vacuum = INCREMENTAL``.
+        * passive checkpoint of the WAL, if the database uses it
+        * in soft delete mode, before the other tasks, :py:meth:`purge` of at
+          most :py:data:`constants.PURGE_MAX_ROOTS` tombstones of each table
+
+        A task never waits for a lock held by another connection: the
+        remaining tasks are skipped instead.
+
+        :return: the names of the tasks executed (list of str).
+        '''
+
+        return self.maintenance.tick(force=True)
+
+    def purge(self, max_roots=constants.PURGE_MAX_ROOTS, progress=None):
+        '''
+        Physically delete the rows tombstoned by the soft delete mode and the
+        rows depending on them, oldest first, in short transactions. See
+        :py:meth:`BatchedDelete.purge`.
+
+        :param int max_roots: Default
+            :py:data:`constants.PURGE_MAX_ROOTS`. Maximum number of tombstoned
+            users, goals and resources purged.
+        :param progress: Default None. Function called after every transaction
+            with the statistics of :py:class:`BatchedDelete`.
+        :return: the number of tombstones purged (int).
+        '''
+
+        con = self._connect()
+        try:
+            con.execute(constants.SQL_TURN_FOREIGN_KEY_ON)
+            return BatchedDelete(con, progress).purge(max_roots)
+        finally:
+            con.close()
+
+    def persist(self):
+        '''
+        In memory mode, write the database to its file if it was modified
+        since it was last written. Does nothing otherwise.
+
+        :return: True if the file was written.
+        '''
+
+        if self.memory is None:
+            return False
+        return self.memory.persist()
+
+    def close(self):
+        '''
+        Release the resources of the Engine, after waiting for the background
+        jobs. In memory mode, the database is written to its file and the
+        memory is released, so the Engine cannot be used anymore. Every
+        :py:class:`Connection` should be closed before.
+        '''
+
+        with self._jobs_lock:
+            if self._jobs is not None:
+                self._jobs.shutdown()
+                self._jobs = None
+        self.drop_template()
+        self.maintenance.close()
+        if self.memory is not None:
+            self.memory.close()
+
     def remove_database(self):
         '''
-        Removes the database file from the filesystem.
+        Removes the database file from the filesystem, together with its
+        journal files. In memory mode, the database in memory is emptied too.
         '''
 
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        self._clear_caches()
+        self.maintenance.disconnect()
+        if self.memory is not None:
+            self.memory.reset()
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
 
-    def clear(self):
+    def clear(self, fast=False, vacuum=False, recreate=False):
         '''
         Remove all records from the database tables. Keeps the database
         schema (meaning the table structure)
+
+        By default rows are deleted with foreign keys support activated, so the
+        foreign key actions are checked for every row.
+
+        :param bool fast: Default False. Delete the rows in a single transaction
+            with foreign keys support deactivated, so SQLite can truncate the
+            tables instead of deleting rows one by one. The AUTOINCREMENT
+            counters are reset too, except the sequence numbers of the
+            changes.
+        :param bool vacuum: Default False. Run ``VACUUM`` afterwards, so the
+            database file shrinks.
+        :param bool recreate: Default False. Replace the database file with a
+            new one created from the default schema. ``fast`` and ``vacuum``
+            are ignored in that case.
+
+        When the rows are not deleted one by one (``fast`` or ``recreate``),
+        the previous changes are removed and a ``truncate`` change is recorded
+        for every table instead, so the consumers of the changes drop their
+        copies. The sequence numbers of the changes are never reused.
         '''
 
-        con = sqlite3.connect(self.db_path)
+        if recreate:
+            con = self._connect()
+            try:
+                last_seq = self._last_change_seq(con)
+            finally:
+                con.close()
+            self.remove_database()
+            self.create_tables()
+            if last_seq is not None:
+                con = self._connect()
+                try:
+                    self._continue_changes(con, last_seq)
+                finally:
+                    con.close()
+            return
+
+        self._clear_caches()
+        con = self._connect()
+        try:
+            if fast:
+                self._truncate_tables(con)
+            else:
+                #Activate foreing keys support
+                keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
+                cur = con.cursor()
+                cur.execute(keys_on)
 
-        #Activate foreing keys support
-        keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
-        cur = con.cursor()
-        cur.execute(keys_on)
+                # Remove data from database
+                with con:
+                    cur = con.cursor()
+                    cur.execute(constants.SQL_DELETE_RESOURCES_DATA)
+                    cur.execute(constants.SQL_DELETE_GOALS_DATA)
+                    cur.execute(constants.SQL_DELETE_USERS_PROFILE_DATA)
+                    cur.execute(constants.SQL_DELETE_USERS_DATA)
+            if vacuum:
+                con.execute(constants.SQL_VACUUM)
+        finally:
+            con.close()
 
-        # Remove data from database
-        with con:
-            cur = con.cursor()
-            cur.execute(constants.SQL_DELETE_RESOURCES_DATA)
-            cur.execute(constants.SQL_DELETE_GOALS_DATA)
-            cur.execute(constants.SQL_DELETE_USERS_PROFILE_DATA)
-            cur.execute(constants.SQL_DELETE_USERS_DATA)
+    # BULK IMPORT AND EXPORT
+    def export(self, table, path, format='csv', compress=None):
+        '''
+        Write all the rows of a table to a CSV or JSON-lines file.
+
+        :param str table: name of the table to export.
+        :param str path: path of the file to create.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: Default None. Compress the file with gzip. If
+            None, the file is compressed when ``path`` ends with ``.gz``.
+        :return: the number of rows exported.
+        :raises ValueError: if the table or the format are not valid.
+        '''
+
+        con = self._connect()
+        try:
+            return TableTransfer(con).export(table, path, format, compress)
+        finally:
+            con.close()
+
+    def import_(self, table, path, format='csv', compress=None):
+        '''
+        Insert into a table the rows of a CSV or JSON-lines file created by
+        :py:meth:`export`. The tables referenced by ``table`` must be imported
+        first (users, user_profile, goals, resources).
+
+        :param str table: name of the table to import.
+        :param str path: path of the file to read.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: Default None. The file is compressed with gzip.
+            If None, the file is considered compressed when ``path`` ends with
+            ``.gz``.
+        :return: the number of rows imported.
+        :raises ValueError: if the table or the format are not valid or if the
+            file contains unknown columns.
+        :raises sqlite3.Error: if the rows cannot be inserted. Nothing is
+            imported in that case.
+        '''
+
+        self._clear_caches()
+        con = self._connect()
+        try:
+            con.execute(constants.SQL_TURN_FOREIGN_KEY_ON)
+            return TableTransfer(con).import_(table, path, format, compress)
+        finally:
+            con.close()
+
+    def export_tables(self, directory, format='csv', compress=False,
+                      threads=len(constants.TABLES)):
+        '''
+        Export every table to the file *<directory>/<table>.<format>[.gz]*.
+        Tables are exported in parallel threads, each one using its own
+        connection.
+
+        :param str directory: existing directory where files are created.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: compress the files with gzip.
+        :param int threads: maximum number of tables exported at the same time.
+        :return: dictionary with the number of rows exported per table.
+        '''
+
+        def export_table(table):
+            path = self._transfer_path(directory, table, format, compress)
+            return self.export(table, path, format, compress)
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            counts = executor.map(export_table, constants.TABLES)
+            return dict(zip(constants.TABLES, counts))
+
+    def import_tables(self, directory, format='csv', compress=False):
+        '''
+        Import the files created by :py:meth:`export_tables`, following the
+        foreign keys order: users, user_profile, goals and resources.
+        Missing files are skipped.
+
+        :param str directory: directory containing the files.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: the files are compressed with gzip.
+        :return: dictionary with the number of rows imported per table.
+        '''
+
+        counts = {}
+        for table in constants.TABLES:
+            path = self._transfer_path(directory, table, format, compress)
+            if os.path.exists(path):
+                counts[table] = self.import_(table, path, format, compress)
+        return counts
 
     #METHODS TO CREATE THE TABLES PROGRAMMATICALLY WITHOUT USING SQL SCRIPT
     def create_users_table(self):
@@ -170,6 +751,193 @@ class Engine(object):
         return self.execute_statement(constants.SQL_CREATE_RESOURCE_TABLE)
 
     # HELPER METHODS
+    def _connect(self, **options):
+        '''
+        Open a sqlite3 connection to the database, reporting its statements to
+        the statistics of the Engine.
+
+        :param options: keyword arguments of ``sqlite3.connect``.
+        :return: a new sqlite3 connection
+        :rtype: InstrumentedConnection
+        '''
+
+        if self.memory is not None:
+            con = self.memory.connect(factory=InstrumentedConnection,
+                                      **options)
+        else:
+            con = sqlite3.connect(self.db_path,
+                                  factory=InstrumentedConnection, **options)
+        for pragma in self._pragmas:
+            con.execute(pragma)
+        con.query_stats = self.query_stats
+        con.metrics = self.metrics
+        con.profiler = self.profiler
+        return con
+
+    def _clear_caches(self):
+        '''
+        Empty the caches shared by the connections, whose content may be
+        stale after the database is modified outside of a Connection.
+        '''
+
+        if self.nickname_cache is not None:
+            self.nickname_cache.clear()
+
+    def _connection_opened(self):
+        '''
+        Count a :py:class:`Connection` created by the Engine.
+        '''
+
+        with self._connections_lock:
+            self.open_connections += 1
+
+    def _connection_closed(self):
+        '''
+        Count a :py:class:`Connection` closed.
+        '''
+
+        with self._connections_lock:
+            self.open_connections -= 1
+
+    def _create_tables(self, con, schema):
+        '''
+        Run the schema file using the sqlite3 connection given as parameter.
+        '''
+
+        # Only effective before the first table is created
+        con.execute(constants.SQL_AUTO_VACUUM_INCREMENTAL)
+        if schema is None:
+            DumpLoader(con).load(constants.DEFAULT_SCHEMA)
+            Migrator(con).migrate()
+        else:
+            DumpLoader(con).load(schema)
+
+    def _populate_tables(self, con, dump, progress=None):
+        '''
+        Run the dump file using the sqlite3 connection given as parameter.
+        '''
+
+        # Activate foreign keys support
+        keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
+        cur = con.cursor()
+        cur.execute(keys_on)
+
+        # Populate database from dump
+        if dump is None:
+            dump = constants.DEFAULT_DATA_DUMP
+        return DumpLoader(con, progress=progress).load(dump)
+
+    def _truncate_tables(self, con):
+        '''
+        Delete all the rows of every table in a single transaction with foreign
+        keys support deactivated, and reset the AUTOINCREMENT counters.
+
+        SQLite only truncates tables without triggers, so the triggers of the
+        tables are dropped and created again within the same transaction. The
+        truncation of the tables is recorded in the table changes instead.
+        '''
+
+        isolation_level = con.isolation_level
+        con.isolation_level = None
+        cur = con.cursor()
+        try:
+            # Foreign keys support cannot be changed inside a transaction
+            cur.execute(constants.SQL_TURN_FOREIGN_KEY_OFF)
+            cur.execute('BEGIN')
+            cur.execute(constants.SQL_SELECT_TRIGGERS)
+            triggers = cur.fetchall()
+            for name, _ in triggers:
+                cur.execute('DROP TRIGGER %s' % name)
+            for table in reversed(constants.TABLES):
+                cur.execute('DELETE FROM %s' % table)
+            cur.execute(constants.SQL_SELECT_USER_STATS_TABLE)
+            if cur.fetchone() is not None:
+                cur.execute(constants.SQL_DELETE_USER_STATS_DATA)
+            last_seq = self._last_change_seq(con)
+            if last_seq is not None:
+                cur.execute(constants.SQL_DELETE_CHANGES_DATA)
+                self._record_truncations(cur, last_seq)
+            for _, sql in triggers:
+                cur.execute(sql)
+            cur.execute(constants.SQL_SELECT_SEQUENCE_TABLE)
+            if cur.fetchone() is not None:
+                cur.execute(constants.SQL_DELETE_SEQUENCE_DATA)
+            cur.execute('COMMIT')
+        except Exception:
+            if con.in_transaction:
+                cur.execute('ROLLBACK')
+            raise
+        finally:
+            con.isolation_level = isolation_level
+
+    def _has_tables(self):
+        '''
+        :return: True if the database file exists and has the tables of the
+            schema.
+        '''
+
+        if not os.path.exists(self.db_path):
+            return False
+        con = self._connect()
+        try:
+            cur = con.cursor()
+            cur.execute(constants.SQL_SELECT_USERS_TABLE)
+            return cur.fetchone() is not None
+        finally:
+            con.close()
+
+    def _last_change_seq(self, con):
+        '''
+        :return: the last sequence number of the changes of the database, or
+            None if the database has no table changes.
+        '''
+
+        cur = con.cursor()
+        cur.execute(constants.SQL_SELECT_CHANGES_TABLE)
+        if cur.fetchone() is None:
+            return None
+        cur.execute(constants.SQL_SELECT_CHANGES_SEQUENCE)
+        row = cur.fetchone()
+        return row[0] if row is not None else 0
+
+    def _continue_changes(self, con, last_seq):
+        '''
+        Number the changes of a database just restored or created after
+        ``last_seq``, the last sequence number of the database it replaced,
+        following the truncation of every table.
+        '''
+
+        with con:
+            cur = con.cursor()
+            cur.execute(constants.SQL_NEGATE_CHANGES_SEQ)
+            last_seq = self._record_truncations(cur, last_seq)
+            cur.execute(constants.SQL_SHIFT_CHANGES_SEQ, (last_seq,))
+            cur.execute('SELECT MAX(seq) FROM changes')
+            cur.execute(constants.SQL_UPDATE_CHANGES_SEQUENCE,
+                        (cur.fetchone()[0],))
+
+    def _record_truncations(self, cur, last_seq):
+        '''
+        Record the truncation of every table after the change ``last_seq``.
+
+        :return: the sequence number of the last truncation.
+        '''
+
+        for table in constants.CHANGE_TABLES:
+            last_seq += 1
+            cur.execute(constants.SQL_RECORD_TRUNCATION, (last_seq, table))
+        return last_seq
+
+    def _transfer_path(self, directory, table, format, compress):
+        '''
+        :return: the path of the file used to transfer the rows of a table.
+        '''
+
+        name = '%s.%s' % (table, format)
+        if compress:
+            name += '.gz'
+        return os.path.join(directory, name)
+
     def execute_statement(self, statement):
         '''
         Execute an SQL statement with foreign key support on
@@ -178,7 +946,8 @@ class Engine(object):
         '''
 
         keys_on = constants.SQL_TURN_FOREIGN_KEY_ON
-        con = sqlite3.connect(self.db_path)
+        self._clear_caches()
+        con = self._connect()
         with con:
             cur = con.cursor()
             try:
@@ -5,8 +5,13 @@ Provides method to access and manipulate data from the "goal" table
 
 Reference: Code adapted and modified from PWP2018 exercise
 '''
+import functools
 import src.db.constants as constants
 import sqlite3
+import time
+from src.db.batching import BatchedDelete
+from src.db.profiling import profiled
+from src.db.softdelete import live_statement
 
 class GoalRepo(object):
     '''
@@ -21,13 +26,17 @@ class GoalRepo(object):
 
     :param con: Connection to an SqlLite database
     :type con: sqlite3.Connection
+    :param bool soft_delete: Default False. Tombstone the deleted goals and
+        hide them from the reads, see :py:mod:`src.db.softdelete`.
     '''
-    def __init__(self, con):
+    def __init__(self, con, soft_delete=False):
         super(GoalRepo, self).__init__()
         self.con = con
+        self.soft_delete = soft_delete
 
 
     # HELPER METHODS FOR GOALS
+    @profiled('build')
     def _create_goal_object(self, row):
         '''
         It takes a :py:class:`sqlite3.Row` and transform it into a dictionary.
@@ -47,10 +56,11 @@ class GoalRepo(object):
 
         '''
         goals = {}
-        for key in row.keys():
+        for key in constants.GOAL_COLUMNS:
             goals[key] = row[key]
         return goals
 
+    @profiled('build')
     def _create_goal_list_object(self, row):
         '''
         Same as :py:meth:`_create_resource_object`. However, the resulting
@@ -83,7 +93,7 @@ class GoalRepo(object):
 
         '''
         #Create the SQL Query
-        query = constants.SQL_SELECT_GOAL_BY_ID
+        query = self._read(constants.SQL_SELECT_GOAL_BY_ID)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
@@ -98,6 +108,35 @@ class GoalRepo(object):
         #Build the return object
         return self._create_goal_object(row)
 
+    def get_goal_if_changed(self, goal_id, known_version):
+        '''
+        Extracts a goal from the database only if its version is not
+        ``known_version``. The version is read first with a primary key
+        lookup, so an unmodified goal is neither fetched nor built.
+
+        :param int goal_id: The id of the goal.
+        :param int known_version: the version of the goal known by the
+            caller, or None.
+        :return: None if the goal does not exist, else a tuple (version,
+            goal) where goal is None if the version is ``known_version``,
+            or a dictionary with the format provided in
+            :py:meth:`_create_goal_object`.
+        '''
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_SELECT_GOAL_VERSION), (goal_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if row[0] == known_version:
+            return row[0], None
+        cur.execute(self._read(constants.SQL_SELECT_GOAL_BY_ID), (goal_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        #The goal may have been modified since its version was read
+        return row['version'], self._create_goal_object(row)
+
     def get_goals(self, user_id, number_of_goals, before, after):
         '''
         Return a list of all the goals in the database filtered by the
@@ -133,38 +172,19 @@ class GoalRepo(object):
         '''
         #Create the SQL Statement build the string depending on the existence
         #of user_id, numbero_of_goals, before and after arguments.
-        if before is not None and ( not isinstance(before, int) or before < 0):
-            raise ValueError("Invalid `before` timestamps")
-        if after is not None and ( not isinstance(after, int) or after < 0):
-            raise ValueError("Invalid `bfter` timestamps")
-        query = 'SELECT * FROM goals'
-          #user_id restriction
-        if (user_id is not None) or \
-            (before is not None) or \
-            (after  is not None):
-            query += ' WHERE'
-        if user_id is not None:
-            query += " user_id = %s" % str(user_id)
-          #Before restriction
-        if before is not None:
-            if user_id is not None:
-                query += ' AND'
-            query += " deadline < %s" % str(before)
-          #After restriction
-        if after is not None:
-            if user_id is not None or before is not None:
-                query += ' AND'
-            query += " deadline > %s" % str(after)
+        query, pvalue = self._goals_filter(user_id, before, after)
+        query = self._read('SELECT * FROM goals') + query
           #Order of results
         query += ' ORDER BY deadline DESC'
           #Limit the number of resulst return
         if number_of_goals is not None:
-            query += ' LIMIT ' + str(number_of_goals)
+            query += constants.SQL_LIMIT_CLAUSE
+            pvalue.append(number_of_goals)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
         #Execute main SQL Statement
-        cur.execute(query)
+        cur.execute(query, pvalue)
         #Get results
         rows = cur.fetchall()
         if rows is None:
@@ -176,22 +196,176 @@ class GoalRepo(object):
             goals.append(goal)
         return goals
 
+    def count_goals(self, user_id, before, after):
+        '''
+        Count the goals in the database filtered by the conditions provided
+        in the parameters, without fetching them. The parameters are the ones
+        of :py:meth:`get_goals`.
+
+        :return: the number of goals (int).
+        :raises ValueError: if ``before`` or ``after`` are not valid UNIX
+            timestamps
+
+        '''
+        query, pvalue = self._goals_filter(user_id, before, after)
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_COUNT_GOALS) + query, pvalue)
+        return cur.fetchone()[0]
+
+    def get_due_goals(self, window_start, window_end, status_in, batch_size):
+        '''
+        Generate the goals whose deadline is in a time window, sorted by
+        deadline and goal_id.
+
+        Goals are read in batches, each one with its own query starting after
+        the last goal of the previous batch, so no read transaction is kept
+        open while the caller processes the goals. The goals not done are
+        read from the partial index ``goals_open_deadline``, so the cost
+        depends on the number of matching goals only.
+
+        :param int window_start: goals with a deadline < ``window_start``
+            (UNIX timestamp) are skipped. If None, this condition is not
+            applied, which selects the overdue goals.
+        :param int window_end: goals with a deadline >= ``window_end``
+            (UNIX timestamp) are skipped. If None, this condition is not
+            applied.
+        :param status_in: statuses of the goals generated. If None, the goals
+            not done (status < 1) are generated.
+        :type status_in: tuple of float
+        :param int batch_size: number of goals read by every query.
+        :return: generator of dictionaries with the format provided in
+            :py:meth:`_create_goal_object`. Goals without deadline are never
+            generated.
+        :raises ValueError: if ``window_start`` or ``window_end`` are not
+            valid UNIX timestamps.
+
+        '''
+        for timestamp in (window_start, window_end):
+            if timestamp is not None and (not isinstance(timestamp, int) or
+                                          timestamp < 0):
+                raise ValueError("Invalid window timestamp")
+        #Create the SQL Statement
+        query = self._read(constants.SQL_SELECT_DUE_GOALS)
+        pvalue = []
+        if status_in is None or all(status < 1 for status in status_in):
+            query += constants.SLQ_AND_CLAUSE + constants.SQL_OPEN_GOALS_FILTER
+        if status_in is not None:
+            query += constants.SLQ_AND_CLAUSE + 'status IN (%s)' % \
+                ','.join('?' * len(status_in))
+            pvalue.extend(status_in)
+        if window_start is not None:
+            query += constants.SLQ_AND_CLAUSE + 'deadline >= ?'
+            pvalue.append(window_start)
+        if window_end is not None:
+            query += constants.SLQ_AND_CLAUSE + 'deadline < ?'
+            pvalue.append(window_end)
+        #Queries of the following batches start after the last goal
+        next_query = query + constants.SLQ_AND_CLAUSE + \
+            'deadline >= ? AND (deadline > ? OR goal_id > ?)'
+        query += constants.SQL_DUE_GOALS_ORDER
+        next_query += constants.SQL_DUE_GOALS_ORDER
+        return self._generate_due_goals(query, next_query, pvalue, batch_size)
+
+    def _read(self, statement):
+        '''
+        :return: the statement, reading the live_* views in soft delete mode.
+        '''
+        if self.soft_delete:
+            return live_statement(statement)
+        return statement
+
+    def _write(self, statement):
+        '''
+        :return: the statement, only modifying the goals visible to the reads
+            in soft delete mode.
+        '''
+        if self.soft_delete:
+            return statement + constants.SQL_LIVE_GOAL_FILTER
+        return statement
+
+    def _goals_filter(self, user_id, before, after):
+        '''
+        Build the WHERE clause shared by :py:meth:`get_goals` and
+        :py:meth:`count_goals`. The values are bound as parameters, so the
+        statements are prepared once per combination of filters.
+
+        :return: tuple with the clause (str, empty if there are no filters)
+            and the list of its parameters.
+        :raises ValueError: if ``before`` or ``after`` are not valid UNIX
+            timestamps
+        '''
+        if before is not None and ( not isinstance(before, int) or before < 0):
+            raise ValueError("Invalid `before` timestamps")
+        if after is not None and ( not isinstance(after, int) or after < 0):
+            raise ValueError("Invalid `bfter` timestamps")
+        query = ''
+        pvalue = []
+          #user_id restriction
+        if (user_id is not None) or \
+            (before is not None) or \
+            (after  is not None):
+            query += ' WHERE'
+        if user_id is not None:
+            query += " user_id = ?"
+            pvalue.append(user_id)
+          #Before restriction
+        if before is not None:
+            if user_id is not None:
+                query += ' AND'
+            query += " deadline < ?"
+            pvalue.append(before)
+          #After restriction
+        if after is not None:
+            if user_id is not None or before is not None:
+                query += ' AND'
+            query += " deadline > ?"
+            pvalue.append(after)
+        return query, pvalue
+
+    def _generate_due_goals(self, query, next_query, pvalue, batch_size):
+        '''
+        Generator of :py:meth:`get_due_goals`, running a query per batch.
+        '''
+        params = pvalue + [batch_size]
+        while True:
+            self.con.row_factory = sqlite3.Row
+            cur = self.con.cursor()
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            for row in rows:
+                yield self._create_goal_object(row)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]
+            query = next_query
+            params = pvalue + [last['deadline'], last['deadline'],
+                               last['goal_id'], batch_size]
+
     def delete_goal(self, goal_id):
         '''
-        Delete the goal with id given as parameter.
+        Delete the goal with id given as parameter. In soft delete mode, the
+        goal is only tombstoned, which hides its sub-goals and resources too.
 
         :param int goal_id: id of the goal to remove.
-        :return: True if the goal has been deleted, False otherwise
+        :return: True if the goal has been deleted, False otherwise (or if it
+            is already hidden, in soft delete mode)
 
         '''
         #Create the SQL Statements
           #SQL Statement for deleting the goal entry
-        query = constants.SQL_DELETE_GOAL_BY_ID
+        if self.soft_delete:
+            query = self._write(constants.SQL_SOFT_DELETE_GOAL)
+            pvalue = (int(time.time()), goal_id)
+        else:
+            query = constants.SQL_DELETE_GOAL_BY_ID
+            pvalue = (goal_id,)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
+        if self.soft_delete:
+            #The sub-goals and resources hidden with the goal are deleted too
+            cur.execute(constants.SQL_RECORD_HIDDEN_BY_GOAL, (goal_id,))
         #Execute the statement to delete
-        pvalue = (goal_id,)
         cur.execute(query, pvalue)
         self.con.commit()
         #Check that it has been deleted
@@ -199,8 +373,22 @@ class GoalRepo(object):
             return False
         return True
 
+    def delete_goal_tree(self, goal_id, progress=None):
+        '''
+        Delete the goal with id given as parameter, its sub-goals and their
+        resources, leaves first, in short transactions. See
+        :py:class:`BatchedDelete`.
+
+        :param int goal_id: id of the root goal to remove.
+        :param progress: Default None. Function called after every transaction
+            with the statistics of :py:class:`BatchedDelete`.
+        :return: the number of goals deleted, 0 if the goal does not exist.
+
+        '''
+        return BatchedDelete(self.con, progress).delete_goal_tree(goal_id)
+
     def modify_goal(self, goal_id, title, topic, description, deadline,
-                    status):
+                    status, expected_version=None):
         '''
         Modify the title, the topic, the description, the status, and the
         deadline of the goal with id ``goal_id``. An individual field can be
@@ -212,54 +400,45 @@ class GoalRepo(object):
         :param str description: the goal's description
         :param int deadline: the goal's deadline
         :param int status: the goal's status
+        :param int expected_version: Default None. Modify the goal only if
+            its version is still this one.
         :return: the id of the edited goal or None if the goal was
-              not found.
+              not found (or is deleted, in soft delete mode).
+              :py:data:`constants.CONFLICT` if the version of the
+              goal is not ``expected_version``.
 
         '''
         #Create the SQL Statements
-          #SQL Statement for modifying a goal entry
-        # for readability
-        _title = title is not None
-        _topic = topic is not None
-        _description = description is not None
-        _deadline = deadline is not None
-        _status = status is not None
-
-        if _title or _topic or _description or _deadline or _status:
-            query = "UPDATE goals SET "
-        else:
+          #SQL Statement for modifying a goal entry. Only the provided fields
+          #are modified, and all the values are bound as parameters
+        values = {'title': title, 'topic': topic, 'description': description,
+                  'deadline': deadline, 'status': status}
+        columns = tuple(column for column in constants.GOAL_MODIFIABLE_COLUMNS
+                        if values[column] is not None)
+        if not columns:
             return None
-
-        if _title:
-            query+= "title = '%s'" % title
-        if _topic:
-            if _title:
-                query+=", "
-            query+= "topic = '%s'" % topic
-        if _description:
-            if _topic or _title:
-                query+=", "
-            query+= "description = '%s'" % description
-        if _deadline:
-            if _topic or _title or _description:
-                query+=", "
-            query+= "deadline = %s" % str(deadline)
-        if _status:
-            if _topic or _title or _description or _deadline:
-                query+=", "
-            query+= "status = %s" % str(status)
-
-        query+= " WHERE goal_id = %s" % str(goal_id)
+        query = self._write(_update_goal_statement(columns))
+        pvalue = [values[column] for column in columns] + [goal_id]
+        if expected_version is not None:
+            query+= constants.SQL_VERSION_FILTER
+            pvalue.append(expected_version)
 
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
         #Execute the statement to modify
-        cur.execute(query)
+        cur.execute(query, pvalue)
         self.con.commit()
         #Check that it has been modified
         if cur.rowcount < 1:
-            return None
+            if expected_version is None:
+                return None
+            #Not modified: the goal does not exist or has another version
+            cur.execute(self._read(constants.SQL_SELECT_GOAL_VERSION),
+                        (goal_id,))
+            if cur.fetchone() is None:
+                return None
+            return constants.CONFLICT
         return goal_id
 
     def create_goal(self, user_id, parent_id, title, topic, description,
@@ -279,40 +458,35 @@ class GoalRepo(object):
             were not found.
 
         '''
-        if parent_id is not None:
-            # Check if referred parent goal exists
-            query = constants.SQL_SELECT_GOAL_BY_ID
-            param_value = (parent_id,)
-            cur = self.con.cursor()
-            cur.execute(query, param_value)
-            row = cur.fetchone()
-            if row is None:
-                return None
-
-        # Check if referred user exists
-        query = constants.SQL_SELECT_USER_BY_ID
-        param_value = (user_id,)
-        cur = self.con.cursor()
-        cur.execute(query, param_value)
-        row = cur.fetchone()
-        if row is None:
-            return None
-
         #Create the SQL statment
-          #SQL Statement for inserting the data
-        stmnt = constants.SQL_INSERT_GOAL
-          #Variables for the statement.
-          #user_id is obtained from first statement.
+          #SQL Statement for inserting the data. It also checks that the
+          #user and the parent goal exist.
+        stmnt = self._read(constants.SQL_INSERT_GOAL)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
         #Generate the values for SQL statement
-        pvalue =  (parent_id, title, topic, description, deadline, status,
-                    user_id)
+        pvalue = {'parent_id': parent_id, 'title': title, 'topic': topic,
+                  'description': description, 'deadline': deadline,
+                  'status': status, 'user_id': user_id}
         #Execute the statement
         cur.execute(stmnt, pvalue)
         self.con.commit()
+        #Nothing is inserted if the user or the parent goal were not found
+        if cur.rowcount < 1:
+            return None
         #Extract the id of the added goal
         lid = cur.lastrowid
         #Return the id in
         return lid if lid is not None else None
+
+
+@functools.lru_cache(maxsize=2 ** len(constants.GOAL_MODIFIABLE_COLUMNS))
+def _update_goal_statement(columns):
+    '''
+    :param tuple columns: the modified columns, in the order of
+        :py:data:`constants.GOAL_MODIFIABLE_COLUMNS`.
+    :return: the statement updating the given columns of a goal.
+    '''
+    return constants.SQL_UPDATE_GOAL % ', '.join(
+        '%s = ?' % column for column in columns)
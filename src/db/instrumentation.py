@@ -0,0 +1,248 @@
+'''
+Created on 19.10.2026
+
+Provides the instrumentation of the SQL statements executed by the db layer
+
+Connections created by the Engine use :py:class:`InstrumentedConnection`,
+whose cursors time every statement and report it to a shared
+:py:class:`QueryStats` instance and, while profiling, to the
+:py:class:`CallProfiler` of the Engine. When both are disabled the cursors
+only check two flags before delegating to sqlite3.
+'''
+
+import functools
+import logging
+import re
+import sqlite3
+import threading
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(sql):
+    '''
+    Normalise a statement so that statements which only differ in their
+    literal values or whitespace are aggregated together.
+
+    :param str sql: the SQL statement.
+    :return: the statement with literals replaced by ``?`` (str).
+    '''
+
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats(object):
+    '''
+    Aggregated timing of the SQL statements, grouped by statement shape.
+
+    :param bool enabled: Default False. Record the statements.
+    :param float slow_query_threshold: Default None. Statements taking more
+        seconds than this value are logged, together with their query plan.
+        If None, no statement is logged.
+    '''
+
+    def __init__(self, enabled=False, slow_query_threshold=None):
+        super(QueryStats, self).__init__()
+        self.enabled = enabled
+        self.slow_query_threshold = slow_query_threshold
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def record(self, shape, elapsed, rows, execution_elapsed, new_execution):
+        '''
+        Add the measurements of a statement.
+
+        :param str shape: the shape of the statement.
+        :param float elapsed: seconds spent in this call.
+        :param int rows: number of rows returned or modified in this call.
+        :param float execution_elapsed: seconds spent so far by this execution
+            of the statement, including the fetch calls.
+        :param bool new_execution: the call is the execution of the statement
+            and not a fetch of its results.
+        '''
+
+        with self._lock:
+            entry = self._statements.get(shape)
+            if entry is None:
+                entry = self._statements[shape] = [0, 0.0, 0.0, 0]
+            if new_execution:
+                entry[0] += 1
+            entry[1] += elapsed
+            if execution_elapsed > entry[2]:
+                entry[2] = execution_elapsed
+            entry[3] += rows
+
+    def snapshot(self):
+        '''
+        :return: dictionary with an entry per statement shape, each one being a
+            dictionary with the following keys:
+
+            * ``count``: number of executions (int)
+            * ``total``: total seconds spent executing and fetching (float)
+            * ``mean``: mean seconds per execution (float)
+            * ``max``: seconds spent by the slowest execution (float)
+            * ``rows``: number of rows returned or modified (int)
+        '''
+
+        with self._lock:
+            return {shape: {'count': count, 'total': total,
+                            'mean': total / count if count else 0.0,
+                            'max': maximum, 'rows': rows}
+                    for shape, (count, total, maximum, rows)
+                    in self._statements.items()}
+
+    def reset(self):
+        '''
+        Remove all the measurements.
+        '''
+
+        with self._lock:
+            self._statements = {}
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    '''
+    Cursor reporting the time spent in ``execute`` and ``fetch*`` calls to the
+    :py:class:`QueryStats` and to the :py:class:`CallProfiler` of its
+    connection.
+    '''
+
+    _execution = None
+    _profiler = None
+
+    def execute(self, sql, parameters=()):
+        connection = self.connection
+        stats = connection.query_stats
+        profiler = connection.profiler
+        if profiler is not None and not profiler.enabled:
+            profiler = None
+        self._profiler = profiler
+        if stats is None or not stats.enabled:
+            self._execution = None
+            if profiler is None:
+                return super(InstrumentedCursor, self).execute(sql, parameters)
+        else:
+            # [shape, sql, parameters, seconds spent, logged as slow]
+            self._execution = [statement_shape(sql), sql, parameters, 0.0,
+                               False]
+        start = perf_counter()
+        try:
+            return super(InstrumentedCursor, self).execute(sql, parameters)
+        finally:
+            elapsed = perf_counter() - start
+            if self._execution is not None:
+                rows = self.rowcount if self.rowcount > 0 else 0
+                self._account(stats, elapsed, rows, True)
+            if profiler is not None:
+                profiler.add('pragma' if sql.lstrip()[:6].upper() == 'PRAGMA'
+                             else 'execute', elapsed)
+
+    def fetchone(self):
+        if self._execution is None and self._profiler is None:
+            return super(InstrumentedCursor, self).fetchone()
+        start = perf_counter()
+        row = super(InstrumentedCursor, self).fetchone()
+        self._fetched(perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        if self._execution is None and self._profiler is None:
+            return super(InstrumentedCursor, self).fetchmany(size)
+        start = perf_counter()
+        rows = super(InstrumentedCursor, self).fetchmany(size)
+        self._fetched(perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self._execution is None and self._profiler is None:
+            return super(InstrumentedCursor, self).fetchall()
+        start = perf_counter()
+        rows = super(InstrumentedCursor, self).fetchall()
+        self._fetched(perf_counter() - start, len(rows))
+        return rows
+
+    # HELPERS
+    def _fetched(self, elapsed, rows):
+        '''
+        Report the time spent fetching rows.
+        '''
+
+        if self._execution is not None:
+            self._account(self.connection.query_stats, elapsed, rows, False)
+        if self._profiler is not None:
+            self._profiler.add('fetch', elapsed)
+
+    def _account(self, stats, elapsed, rows, new_execution):
+        '''
+        Report a measurement and log the statement if it is slow.
+        '''
+
+        execution = self._execution
+        execution[3] += elapsed
+        stats.record(execution[0], elapsed, rows, execution[3], new_execution)
+        threshold = stats.slow_query_threshold
+        if threshold is not None and not execution[4] and \
+                execution[3] >= threshold:
+            execution[4] = True
+            self._log_slow_query(execution)
+
+    def _log_slow_query(self, execution):
+        '''
+        Log a slow statement together with its query plan.
+        '''
+
+        shape, sql, parameters, elapsed, _ = execution
+        plan = ''
+        if shape.split(' ', 1)[0].upper() in _EXPLAINABLE:
+            try:
+                cur = sqlite3.Cursor(self.connection)
+                cur.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+                plan = '\n'.join(str(row[3]) for row in cur.fetchall())
+            except sqlite3.Error as excp:
+                plan = 'Error %s' % excp.args[0]
+        logger.warning('Slow query (%.3f ms): %s\n%s', elapsed * 1000, shape,
+                       plan)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''
+    sqlite3 connection whose cursors are instances of
+    :py:class:`InstrumentedCursor`.
+
+    The attribute :py:attr:`query_stats` holds the :py:class:`QueryStats`
+    receiving the measurements, or None. The attribute :py:attr:`metrics`
+    holds the :py:class:`EngineMetrics` counting the commits, or None. The
+    attribute :py:attr:`profiler` holds the :py:class:`CallProfiler` timing
+    the statements and the commits, or None.
+    '''
+
+    query_stats = None
+    metrics = None
+    profiler = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super(InstrumentedConnection, self).cursor(factory)
+
+    def commit(self):
+        metrics = self.metrics
+        if metrics is not None and metrics.enabled:
+            metrics.commits.inc()
+        profiler = self.profiler
+        if profiler is None or not profiler.enabled:
+            return super(InstrumentedConnection, self).commit()
+        start = perf_counter()
+        try:
+            return super(InstrumentedConnection, self).commit()
+        finally:
+            profiler.add('commit', perf_counter() - start)
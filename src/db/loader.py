@@ -0,0 +1,216 @@
+'''
+Created on 19.10.2026
+
+Provides a streaming loader for .sql dump files
+
+The dump is read line by line and split into statements, so the whole file
+is never held in memory. Statements are executed in large transactions with
+relaxed durability settings, and index creation is deferred until all the
+data has been loaded.
+'''
+
+import re
+import sqlite3
+import time
+
+from src.db import constants
+
+# Characters which change the state of the statement tokenizer
+_TOKENS = re.compile(r"""'|"|`|\[|\]|--|/\*|\*/|;""")
+# Leading whitespace and comments of a statement
+_LEADING_NOISE = re.compile(r'^(\s+|--[^\n]*(\n|$)|/\*.*?\*/)*', re.DOTALL)
+_CREATE_INDEX = re.compile(r'^CREATE\s+(UNIQUE\s+)?INDEX\b', re.IGNORECASE)
+_TRANSACTION_KEYWORDS = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK')
+
+
+class DumpLoader(object):
+    '''
+    Loads a .sql dump file into a database statement by statement.
+
+    :Example:
+
+    >>> loader = DumpLoader(con, progress=DumpLoader.print_progress)
+    >>> loader.load('db/goalz_data_dump.sql')
+
+    Transaction statements (``BEGIN``, ``COMMIT``...) contained in the dump
+    are ignored, since the loader manages the transactions itself.
+    ``PRAGMA`` statements are executed outside any transaction.
+
+    :param con: Connection to an SqlLite database
+    :type con: sqlite3.Connection
+    :param int batch_size: number of statements executed in each transaction.
+    :param progress: Default None. Function called after every transaction
+        with a dictionary of statistics. See :py:meth:`load`.
+    '''
+
+    def __init__(self, con, batch_size=constants.LOADER_BATCH_SIZE,
+                 progress=None):
+        super(DumpLoader, self).__init__()
+        self.con = con
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def load(self, path):
+        '''
+        Execute all the statements of the dump file.
+
+        :param str path: path to the .sql dump file.
+        :return: A dictionary with the following keys:
+
+            * ``statements``: number of statements executed (int)
+            * ``rows``: number of rows inserted or modified (int)
+            * ``bytes``: number of bytes read from the dump (int)
+            * ``total_bytes``: size of the dump file in bytes (int)
+            * ``seconds``: time spent loading the dump (float)
+            * ``rows_per_second``: loading speed (float)
+
+        :raises sqlite3.Error: if a statement fails. The current transaction
+            is rolled back.
+        '''
+
+        stats = {'statements': 0, 'rows': 0, 'bytes': 0, 'total_bytes': 0,
+                 'seconds': 0.0, 'rows_per_second': 0.0}
+        isolation_level = self.con.isolation_level
+        self.con.isolation_level = None
+        cur = self.con.cursor()
+        cur.execute('PRAGMA synchronous')
+        synchronous = cur.fetchone()[0]
+        cur.execute('PRAGMA journal_mode')
+        journal_mode = cur.fetchone()[0]
+        cur.execute('PRAGMA synchronous = OFF')
+        cur.execute('PRAGMA journal_mode = MEMORY')
+        start = time.perf_counter()
+        deferred_indexes = []
+        pending = 0
+        try:
+            # Line endings are kept so the bytes read add up to the file size
+            with open(path, encoding="utf-8", newline='') as file:
+                file.seek(0, 2)
+                stats['total_bytes'] = file.tell()
+                file.seek(0)
+                for statement in self.statements(file, stats):
+                    keyword = self._keyword(statement)
+                    if keyword in _TRANSACTION_KEYWORDS:
+                        continue
+                    if _CREATE_INDEX.match(_LEADING_NOISE.sub('', statement)):
+                        deferred_indexes.append(statement)
+                        continue
+                    if keyword == 'PRAGMA':
+                        if self.con.in_transaction:
+                            cur.execute('COMMIT')
+                        cur.execute(statement)
+                        continue
+                    if not self.con.in_transaction:
+                        cur.execute('BEGIN')
+                    cur.execute(statement)
+                    stats['statements'] += 1
+                    if cur.rowcount > 0:
+                        stats['rows'] += cur.rowcount
+                    pending += 1
+                    if pending >= self.batch_size:
+                        cur.execute('COMMIT')
+                        pending = 0
+                        self._report(stats, start)
+            if deferred_indexes:
+                if not self.con.in_transaction:
+                    cur.execute('BEGIN')
+                for statement in deferred_indexes:
+                    cur.execute(statement)
+                    stats['statements'] += 1
+            if self.con.in_transaction:
+                cur.execute('COMMIT')
+        except Exception:
+            if self.con.in_transaction:
+                cur.execute('ROLLBACK')
+            raise
+        finally:
+            cur.execute('PRAGMA journal_mode = %s' % journal_mode)
+            cur.execute('PRAGMA synchronous = %d' % synchronous)
+            self.con.isolation_level = isolation_level
+        self._report(stats, start)
+        return stats
+
+    def statements(self, file, stats=None):
+        '''
+        Split the content of a file into SQL statements.
+
+        Semicolons inside quoted strings, quoted identifiers and comments do not
+        end a statement. Trigger bodies (``BEGIN ... END``) are kept in a single
+        statement.
+
+        :param file: file object opened in text mode.
+        :param dict stats: Default None. If given, its ``bytes`` key is
+            increased with the number of bytes read, in the encoding of the
+            file (UTF-8 if it has none).
+        :return: generator of statements (str)
+        '''
+
+        encoding = getattr(file, 'encoding', None) or 'utf-8'
+        buffer = []
+        quote = None
+        block_comment = False
+        for line in iter(file.readline, ''):
+            if stats is not None:
+                stats['bytes'] += len(line.encode(encoding))
+            start = 0
+            for match in _TOKENS.finditer(line):
+                token = match.group()
+                if block_comment:
+                    if token == '*/':
+                        block_comment = False
+                elif quote is not None:
+                    if token == quote:
+                        quote = None
+                elif token in ("'", '"', '`'):
+                    quote = token
+                elif token == '[':
+                    quote = ']'
+                elif token == '/*':
+                    block_comment = True
+                elif token == '--':
+                    break
+                elif token == ';':
+                    buffer.append(line[start:match.end()])
+                    start = match.end()
+                    candidate = ''.join(buffer)
+                    if sqlite3.complete_statement(candidate):
+                        buffer = []
+                        yield candidate.strip()
+            buffer.append(line[start:])
+        rest = ''.join(buffer)
+        if _LEADING_NOISE.sub('', rest):
+            yield rest.strip()
+
+    @staticmethod
+    def print_progress(stats):
+        '''
+        Progress function printing the statistics in the console.
+
+        :param dict stats: statistics as described in :py:meth:`load`.
+        '''
+
+        total = stats['total_bytes'] or 1
+        print("Loaded %d%% - %d statements, %d rows (%.0f rows/s)" %
+              (100 * stats['bytes'] / total, stats['statements'],
+               stats['rows'], stats['rows_per_second']))
+
+    # HELPERS
+    def _keyword(self, statement):
+        '''
+        :return: the first keyword of the statement in upper case.
+        '''
+
+        statement = _LEADING_NOISE.sub('', statement)
+        match = re.match(r'[A-Za-z]+', statement)
+        return match.group().upper() if match else ''
+
+    def _report(self, stats, start):
+        '''
+        Update the timing statistics and call the progress function.
+        '''
+
+        stats['seconds'] = time.perf_counter() - start
+        if stats['seconds'] > 0:
+            stats['rows_per_second'] = stats['rows'] / stats['seconds']
+        if self.progress is not None:
+            self.progress(dict(stats))
@@ -0,0 +1,182 @@
+'''
+Created on 19.10.2026
+
+Provides the background maintenance of the database
+
+A :py:class:`Maintenance` runs, at every tick and only if no other connection
+wrote to the database since the previous tick, a bounded amount of work:
+
+* ``optimize``: ``PRAGMA optimize``
+* ``analyze``: ``ANALYZE`` limited by ``PRAGMA analysis_limit``, when the
+  planner statistics are missing or older than
+  :py:data:`constants.MAINTENANCE_ANALYZE_PERIOD` seconds
+* ``vacuum``: ``PRAGMA incremental_vacuum`` of at most
+  :py:data:`constants.MAINTENANCE_VACUUM_PAGES` free pages, when the database
+  uses ``auto_vacuum = INCREMENTAL``
+* ``checkpoint``: passive checkpoint of the WAL, when the database uses it
+
+In soft delete mode, the tick starts with ``purge``: the physical deletion of
+at most :py:data:`constants.PURGE_MAX_ROOTS` tombstones of each table, in
+short transactions, see :py:meth:`BatchedDelete.purge`.
+
+The maintenance connection never waits for a lock: if a foreground request
+holds it, the rest of the tick is skipped.
+
+:Example:
+
+>>> engine = Engine(maintenance_interval=60)
+>>> engine.maintain()
+['optimize', 'analyze', 'vacuum']
+'''
+
+import logging
+import sqlite3
+import threading
+from time import monotonic
+
+from src.db import constants
+from src.db.batching import BatchedDelete
+
+logger = logging.getLogger(__name__)
+
+
+class Maintenance(object):
+    '''
+    Maintenance tasks of the database of an Engine.
+
+    :param engine: the :py:class:`Engine`.
+    :param float interval: Default None. Seconds between two ticks of the
+        background thread. If None, ticks are only run by :py:meth:`tick`.
+    '''
+
+    def __init__(self, engine, interval=None):
+        super(Maintenance, self).__init__()
+        self.engine = engine
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._con = None
+        self._data_version = None
+        self._analyzed = None
+        self._stop = threading.Event()
+        self._thread = None
+        if interval is not None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='goalz-maintenance',
+                                            daemon=True)
+            self._thread.start()
+
+    def tick(self, force=False):
+        '''
+        Run the maintenance tasks needed by the database.
+
+        :param bool force: Default False. Run the tasks even if other
+            connections wrote to the database since the previous tick.
+        :return: the names of the tasks executed (list of str).
+        '''
+
+        with self._lock:
+            con = self._connection()
+            version = con.execute(constants.SQL_DATA_VERSION).fetchone()[0]
+            idle = version == self._data_version or self._data_version is None
+            self._data_version = version
+            if not idle and not force:
+                return []
+            done = []
+            try:
+                self._purge(con, done)
+                self._optimize(con, done)
+                self._analyze(con, done)
+                self._vacuum(con, done)
+                self._checkpoint(con, done)
+            except sqlite3.OperationalError as excp:
+                # A foreground request holds a lock: try again at next tick
+                logger.debug('Maintenance interrupted: %s', excp)
+            # The writes of the tasks do not change the data version of this
+            # connection, so the next tick is not considered busy
+            return done
+
+    def disconnect(self):
+        '''
+        Close the maintenance connection, for instance because the database
+        file is removed. The next tick opens a new one.
+        '''
+
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self._data_version = None
+
+    def close(self):
+        '''
+        Stop the background thread and close the maintenance connection.
+        '''
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.disconnect()
+
+    # TASKS
+    def _purge(self, con, done):
+        if not self.engine.soft_delete:
+            return
+        if BatchedDelete(con).purge(constants.PURGE_MAX_ROOTS):
+            done.append('purge')
+
+    def _optimize(self, con, done):
+        con.execute(constants.SQL_OPTIMIZE).fetchall()
+        done.append('optimize')
+
+    def _analyze(self, con, done):
+        analyzed = con.execute(constants.SQL_SELECT_STAT1_TABLE).fetchone()
+        if analyzed is not None and self._analyzed is not None and \
+                monotonic() < self._analyzed + \
+                constants.MAINTENANCE_ANALYZE_PERIOD:
+            return
+        con.execute(constants.SQL_ANALYZE)
+        self._analyzed = monotonic()
+        done.append('analyze')
+
+    def _vacuum(self, con, done):
+        if con.execute('PRAGMA auto_vacuum').fetchone()[0] != 2 or \
+                con.execute('PRAGMA freelist_count').fetchone()[0] == 0:
+            return
+        # execute() would only step the pragma once, freeing a single page
+        con.executescript(constants.SQL_INCREMENTAL_VACUUM %
+                          constants.MAINTENANCE_VACUUM_PAGES)
+        done.append('vacuum')
+
+    def _checkpoint(self, con, done):
+        if con.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            return
+        con.execute(constants.SQL_WAL_CHECKPOINT).fetchall()
+        done.append('checkpoint')
+
+    # HELPERS
+    def _connection(self):
+        '''
+        :return: the connection used by the tasks, opened at first use.
+        '''
+
+        if self._con is None:
+            con = self.engine._connect(timeout=0, check_same_thread=False)
+            con.execute('PRAGMA analysis_limit = %d' %
+                        constants.MAINTENANCE_ANALYSIS_LIMIT)
+            # The cascades remove the profiles of the purged users
+            con.execute(constants.SQL_TURN_FOREIGN_KEY_ON)
+            self._con = con
+        return self._con
+
+    def _run(self):
+        '''
+        Body of the background thread.
+        '''
+
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except sqlite3.Error:
+                logger.exception('Maintenance of %s failed',
+                                 self.engine.db_path)
@@ -0,0 +1,156 @@
+'''
+Created on 19.10.2026
+
+Provides the in-memory mode of the Engine
+
+The database file is copied with the sqlite3 backup API into a database held
+in memory by the ``memdb`` VFS of SQLite, which every connection of the
+process can open by name. Reads and writes never touch the disk, and the
+database is copied back to the file periodically and when the Engine is
+closed.
+
+:Example:
+
+>>> engine = Engine(in_memory=True, max_unsaved_seconds=5)
+>>> con = engine.connect()
+>>> engine.close()
+
+Writes committed since the last copy are lost if the process dies, so the
+mode trades durability for latency. The file must not be modified by other
+processes while the Engine is open.
+'''
+
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+
+from src.db import constants
+
+logger = logging.getLogger(__name__)
+
+_names = itertools.count(1)
+
+
+class MemoryStore(object):
+    '''
+    Database held in memory, loaded from and persisted to a database file.
+
+    :param str db_path: path of the database file.
+    :param float max_unsaved_seconds: Default None. Maximum seconds a
+        committed write stays in memory only: if not None, a background
+        thread persists the modified database with this period. If None, the
+        database is only persisted by :py:meth:`persist` and :py:meth:`close`.
+    '''
+
+    def __init__(self, db_path, max_unsaved_seconds=None):
+        super(MemoryStore, self).__init__()
+        self.db_path = db_path
+        self.max_unsaved_seconds = max_unsaved_seconds
+        self._lock = threading.Lock()
+        self._anchor = None
+        self._open()
+        self._stop = threading.Event()
+        self._thread = None
+        if max_unsaved_seconds is not None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='goalz-persist', daemon=True)
+            self._thread.start()
+
+    def connect(self, **options):
+        '''
+        :param options: keyword arguments of ``sqlite3.connect``.
+        :return: a new sqlite3 connection to the database in memory.
+        '''
+
+        return sqlite3.connect(self.uri, uri=True, **options)
+
+    def persist(self, force=False):
+        '''
+        Copy the database in memory to the database file, if it was modified
+        since the last copy. The copy is made in steps of
+        :py:data:`constants.PERSIST_BACKUP_PAGES` pages, so writers are only
+        blocked for one step at a time, and replaces the file atomically.
+
+        :param bool force: Default False. Copy the database even if it was not
+            modified.
+        :return: True if the database was copied.
+        '''
+
+        with self._lock:
+            if self._anchor is None:
+                return False
+            version = self._data_version()
+            if not force and version == self._persisted_version:
+                return False
+            disk = sqlite3.connect(self.db_path)
+            try:
+                self._anchor.backup(disk, pages=constants.PERSIST_BACKUP_PAGES)
+            finally:
+                disk.close()
+            self._persisted_version = version
+            return True
+
+    def reset(self):
+        '''
+        Replace the database in memory with an empty one. Connections opened
+        before keep using the previous database, so they should be closed.
+        '''
+
+        with self._lock:
+            self._anchor.close()
+            self._open(load=False)
+
+    def close(self):
+        '''
+        Stop the background thread, persist the database and release the
+        memory. Connections opened before should be closed.
+        '''
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.persist()
+        with self._lock:
+            if self._anchor is not None:
+                self._anchor.close()
+                self._anchor = None
+
+    # HELPERS
+    def _open(self, load=True):
+        '''
+        Create the database in memory, loading the database file if it exists.
+        The anchor connection keeps the database alive until it is closed.
+        '''
+
+        self.uri = 'file:/goalz-%d-%d?vfs=memdb' % (os.getpid(), next(_names))
+        self._anchor = sqlite3.connect(self.uri, uri=True,
+                                       check_same_thread=False)
+        if load and os.path.exists(self.db_path):
+            disk = sqlite3.connect(self.db_path)
+            try:
+                disk.backup(self._anchor)
+            finally:
+                disk.close()
+        self._persisted_version = self._data_version()
+
+    def _data_version(self):
+        '''
+        :return: a value changed by every commit of another connection.
+        '''
+
+        return self._anchor.execute('PRAGMA data_version').fetchone()[0]
+
+    def _run(self):
+        '''
+        Body of the background thread.
+        '''
+
+        while not self._stop.wait(self.max_unsaved_seconds):
+            try:
+                self.persist()
+            except sqlite3.Error:
+                logger.exception('Cannot persist the database to %s',
+                                 self.db_path)
@@ -0,0 +1,330 @@
+'''
+Created on 19.10.2026
+
+Provides the operational metrics of the db layer in the Prometheus text format
+
+Counters and histograms accumulate their values in a separate shard per
+thread, so recording a value never waits for a lock. Shards are merged when
+the metrics are collected.
+
+:Example:
+
+>>> engine = Engine(metrics=True)
+>>> text = engine.metrics.render()
+
+The function :py:func:`metrics_app` returns a WSGI application serving the
+metrics, which can be mounted on any WSGI server or framework.
+'''
+
+import bisect
+import os
+import threading
+
+from src.db import constants
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _ThreadShards(object):
+    '''
+    Per-thread storage of the values of a metric.
+
+    :param factory: function creating an empty shard.
+    '''
+
+    def __init__(self, factory):
+        super(_ThreadShards, self).__init__()
+        self._factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def get(self):
+        '''
+        :return: the shard of the current thread.
+        '''
+
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._factory()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def all(self):
+        '''
+        :return: a copy of every shard.
+        '''
+
+        with self._lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+
+class Counter(object):
+    '''
+    Monotonically increasing value, optionally split by labels.
+
+    :param str name: name of the metric.
+    :param str documentation: help text of the metric.
+    :param labelnames: Default empty. Names of the labels.
+    :type labelnames: tuple of str
+    '''
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super(Counter, self).__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards(dict)
+
+    def inc(self, labels=(), amount=1):
+        '''
+        Increase the counter.
+
+        :param tuple labels: values of the labels, in the order of
+            ``labelnames``.
+        :param amount: Default 1. Value added to the counter.
+        '''
+
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self):
+        '''
+        :return: dictionary with the value of the counter per labels.
+        '''
+
+        values = {}
+        for shard in self._shards.all():
+            for labels, value in shard.items():
+                values[labels] = values.get(labels, 0) + value
+        return values
+
+    def samples(self):
+        '''
+        :return: list of samples as tuples (suffix, labels, value).
+        '''
+
+        return [('', self._labels(labels), value)
+                for labels, value in sorted(self.collect().items())]
+
+    def _labels(self, labels):
+        return list(zip(self.labelnames, labels))
+
+
+class Histogram(Counter):
+    '''
+    Distribution of observed values in cumulative buckets.
+
+    :param str name: name of the metric.
+    :param str documentation: help text of the metric.
+    :param labelnames: Default empty. Names of the labels.
+    :type labelnames: tuple of str
+    :param buckets: upper bounds of the buckets, in increasing order.
+    :type buckets: tuple of float
+    '''
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=constants.METRICS_LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        '''
+        Add an observation.
+
+        :param tuple labels: values of the labels, in the order of
+            ``labelnames``.
+        :param float value: the observed value.
+        '''
+
+        shard = self._shards.get()
+        entry = shard.get(labels)
+        if entry is None:
+            # Counts per bucket (last one is +Inf), sum and count
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def collect(self):
+        '''
+        :return: dictionary with, per labels, a list with the counts per bucket
+            (not cumulative), the sum and the count of the observations.
+        '''
+
+        values = {}
+        for shard in self._shards.all():
+            for labels, entry in shard.items():
+                entry = list(entry)
+                total = values.get(labels)
+                if total is None:
+                    values[labels] = entry
+                else:
+                    values[labels] = [a + b for a, b in zip(total, entry)]
+        return values
+
+    def samples(self):
+        samples = []
+        for labels, entry in sorted(self.collect().items()):
+            names = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry):
+                cumulative += count
+                samples.append(('_bucket', names + [('le', _format(bound))],
+                                cumulative))
+            samples.append(('_sum', names, entry[-2]))
+            samples.append(('_count', names, entry[-1]))
+        return samples
+
+
+class Gauge(object):
+    '''
+    Value computed when the metrics are collected.
+
+    :param str name: name of the metric.
+    :param str documentation: help text of the metric.
+    :param function: function without arguments returning the value.
+    '''
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super(Gauge, self).__init__()
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        return [('', [], self.function())]
+
+
+class FunctionCounter(Gauge):
+    '''
+    Counter whose value is read from a function when collected.
+
+    :param str name: name of the metric.
+    :param str documentation: help text of the metric.
+    :param function: function without arguments returning the value.
+    '''
+
+    kind = 'counter'
+
+
+class MetricsRegistry(object):
+    '''
+    Set of metrics rendered together.
+
+    :param bool enabled: Default True. Whether the instrumented code records
+        values. Can be changed at runtime.
+    '''
+
+    def __init__(self, enabled=True):
+        super(MetricsRegistry, self).__init__()
+        self.enabled = enabled
+        self._metrics = []
+
+    def register(self, metric):
+        '''
+        Add a metric to the registry.
+
+        :return: the metric.
+        '''
+
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''
+        :return: all the metrics in the Prometheus text exposition format (str).
+        '''
+
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                if labels:
+                    lines.append('%s%s{%s} %s' % (
+                        metric.name, suffix,
+                        ','.join('%s="%s"' % (name, _escape(label))
+                                 for name, label in labels),
+                        _format(value)))
+                else:
+                    lines.append('%s%s %s' % (metric.name, suffix,
+                                              _format(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class EngineMetrics(MetricsRegistry):
+    '''
+    Metrics of an :py:class:`Engine` and its connections.
+
+    :param engine: the Engine.
+    :param bool enabled: Default True. Whether values are recorded.
+    '''
+
+    def __init__(self, engine, enabled=True):
+        super(EngineMetrics, self).__init__(enabled)
+        self.calls = self.register(Histogram(
+            'goalz_connection_call_seconds',
+            'Latency of the Connection methods in seconds.', ('method',)))
+        self.errors = self.register(Counter(
+            'goalz_connection_errors_total',
+            'Exceptions raised by the Connection methods.', ('method',)))
+        self.commits = self.register(Counter(
+            'goalz_commits_total', 'Transactions committed by the connections.'))
+        self.register(Gauge(
+            'goalz_open_connections', 'Connections currently open.',
+            lambda: engine.open_connections))
+        self.register(FunctionCounter(
+            'goalz_nickname_cache_hits_total',
+            'Nickname lookups answered by the nickname cache.',
+            lambda: _cache_count(engine.nickname_cache, 'hits')))
+        self.register(FunctionCounter(
+            'goalz_nickname_cache_misses_total',
+            'Nickname lookups not found in the nickname cache.',
+            lambda: _cache_count(engine.nickname_cache, 'misses')))
+        self.register(Gauge(
+            'goalz_database_size_bytes', 'Size of the database file.',
+            lambda: _file_size(engine.db_path)))
+        self.register(Gauge(
+            'goalz_wal_size_bytes', 'Size of the write-ahead log file.',
+            lambda: _file_size(engine.db_path + '-wal')))
+
+
+def metrics_app(engine):
+    '''
+    Create a WSGI application serving the metrics of an Engine.
+
+    :param engine: the :py:class:`Engine`.
+    :return: a WSGI application.
+    '''
+
+    def application(environ, start_response):
+        body = engine.metrics.render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+    return application
+
+
+# HELPERS
+def _cache_count(cache, name):
+    return getattr(cache, name) if cache is not None else 0
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+def _format(value):
+    return value if isinstance(value, str) else repr(value)
@@ -0,0 +1,509 @@
+'''
+Created on 19.10.2026
+
+Provides the versioned schema migrations of the Goalz database
+
+The version of a database is stored in ``PRAGMA user_version``. Databases
+created from *db/goalz_schema_dump.sql* have version 0, and every entry of
+:py:data:`MIGRATIONS` upgrades the schema to the next version.
+
+Schema changes MUST be added as a new migration at the end of
+:py:data:`MIGRATIONS`, instead of editing the schema dump, so existing
+databases can be upgraded without losing their data.
+'''
+
+import time
+
+from src.db import constants
+
+
+class Migration(object):
+    '''
+    Schema change identified by a version number.
+
+    All the statements are executed in a single transaction, together with the
+    update of the database version. The version is read again once the write
+    lock is held, so a migration already applied by another connection
+    meanwhile is skipped.
+
+    :param int version: version of the database after the migration.
+    :param str description: short description of the change.
+    :param statements: SQL statements to execute.
+    :type statements: list of str
+    '''
+
+    def __init__(self, version, description, statements=()):
+        super(Migration, self).__init__()
+        self.version = version
+        self.description = description
+        self.statements = list(statements)
+
+    def apply(self, migrator):
+        '''
+        Execute the migration.
+
+        :param migrator: the :py:class:`Migrator` running the migration.
+        :return: False if the migration was already applied, True otherwise.
+        '''
+
+        cur = migrator.con.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            if migrator.current_version() >= self.version:
+                cur.execute('ROLLBACK')
+                return False
+            for statement in self.statements:
+                cur.execute(statement)
+            migrator._set_version(cur, self.version)
+            cur.execute('COMMIT')
+        except Exception:
+            if migrator.con.in_transaction:
+                cur.execute('ROLLBACK')
+            raise
+        return True
+
+
+class BackfillMigration(Migration):
+    '''
+    Schema change followed by a backfill of existing rows, such as filling a
+    new column or a derived table.
+
+    The backfill statement is executed once per batch of rows of ``table``,
+    with the named parameters ``:start`` and ``:end`` delimiting a rowid range
+    (``rowid > :start AND rowid <= :end``). Every batch runs in its own short
+    transaction, and the progress is saved with it, so the migration can be
+    interrupted and resumed without holding the write lock for long. The
+    progress is read again in every transaction, so connections running the
+    migration at the same time share the batches instead of repeating them.
+
+    :param int version: version of the database after the migration.
+    :param str description: short description of the change.
+    :param statements: SQL statements executed before the backfill.
+    :type statements: list of str
+    :param str table: table whose rows are backfilled.
+    :param str backfill: SQL statement executed for every batch.
+    :param finalize: Default empty. SQL statements executed after the backfill,
+        such as the creation of indexes on the backfilled columns.
+    :type finalize: list of str
+    :param int batch_size: number of rowids included in each batch.
+    '''
+
+    def __init__(self, version, description, statements, table, backfill,
+                 finalize=(), batch_size=constants.MIGRATION_BATCH_SIZE):
+        super(BackfillMigration, self).__init__(version, description,
+                                                statements)
+        self.table = table
+        self.backfill = backfill
+        self.finalize = list(finalize)
+        self.batch_size = batch_size
+
+    def apply(self, migrator):
+        '''
+        Execute the migration, resuming the backfill if it was interrupted.
+
+        :param migrator: the :py:class:`Migrator` running the migration.
+        :return: False if the migration was already applied, True otherwise.
+        '''
+
+        cur = migrator.con.cursor()
+        cur.execute(constants.SQL_CREATE_MIGRATION_PROGRESS_TABLE)
+        # First run: change the schema and record the rows to backfill
+        progress = self._begin(migrator, cur)
+        if progress is None:
+            return False
+        if progress == ():
+            try:
+                for statement in self.statements:
+                    cur.execute(statement)
+                cur.execute('SELECT MAX(rowid) FROM %s' % self.table)
+                max_key = cur.fetchone()[0] or 0
+                cur.execute(constants.SQL_INSERT_MIGRATION_PROGRESS,
+                            (self.version, 0, max_key))
+                cur.execute('COMMIT')
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+        else:
+            cur.execute('COMMIT')
+
+        while True:
+            progress = self._begin(migrator, cur)
+            if progress is None:
+                return False
+            last_key, max_key = progress
+            if last_key >= max_key:
+                break
+            end = min(last_key + self.batch_size, max_key)
+            try:
+                cur.execute(self.backfill, {'start': last_key, 'end': end})
+                cur.execute(constants.SQL_UPDATE_MIGRATION_PROGRESS,
+                            (end, self.version))
+                cur.execute('COMMIT')
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+            migrator._report(self, end, max_key)
+            if migrator.pause:
+                time.sleep(migrator.pause)
+
+        try:
+            for statement in self.finalize:
+                cur.execute(statement)
+            cur.execute(constants.SQL_DELETE_MIGRATION_PROGRESS,
+                        (self.version,))
+            migrator._set_version(cur, self.version)
+            cur.execute('COMMIT')
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+        return True
+
+    def _begin(self, migrator, cur):
+        '''
+        Start a write transaction and read the progress of the backfill.
+
+        :return: the pair (last backfilled rowid, last rowid to backfill), an
+            empty tuple if the backfill has not started, or None if the
+            migration was already applied. In that case, the transaction is
+            rolled back.
+        '''
+
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            if migrator.current_version() >= self.version:
+                cur.execute('ROLLBACK')
+                return None
+            cur.execute(constants.SQL_SELECT_MIGRATION_PROGRESS,
+                        (self.version,))
+            row = cur.fetchone()
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+        return tuple(row) if row is not None else ()
+
+
+class Migrator(object):
+    '''
+    Applies the pending migrations to a database.
+
+    :Example:
+
+    >>> Migrator(con).migrate()
+
+    :param con: Connection to an SqlLite database
+    :type con: sqlite3.Connection
+    :param migrations: Default :py:data:`MIGRATIONS`. Migrations ordered by
+        version.
+    :type migrations: list of Migration
+    :param progress: Default None. Function called after every backfill batch
+        with the migration, the last backfilled rowid and the last rowid to
+        backfill.
+    :param float pause: Default 0. Seconds to wait between backfill batches,
+        leaving room for other writers.
+    '''
+
+    def __init__(self, con, migrations=None, progress=None, pause=0):
+        super(Migrator, self).__init__()
+        self.con = con
+        self.migrations = MIGRATIONS if migrations is None else migrations
+        self.progress = progress
+        self.pause = pause
+
+    def current_version(self):
+        '''
+        :return: the version of the database schema (int).
+        '''
+
+        cur = self.con.cursor()
+        cur.execute('PRAGMA user_version')
+        return cur.fetchone()[0]
+
+    def latest_version(self):
+        '''
+        :return: the version of the database after all the migrations (int).
+        '''
+
+        return self.migrations[-1].version if self.migrations else 0
+
+    def pending(self):
+        '''
+        :return: list of migrations not applied yet to the database.
+        '''
+
+        version = self.current_version()
+        return [migration for migration in self.migrations
+                if migration.version > version]
+
+    def migrate(self):
+        '''
+        Apply all the pending migrations in order.
+
+        :return: the list of versions applied by this call. The migrations
+            applied meanwhile by another connection are skipped.
+        :raises sqlite3.Error: if a migration fails. The database keeps the
+            version of the last migration successfully applied.
+        '''
+
+        isolation_level = self.con.isolation_level
+        self.con.isolation_level = None
+        applied = []
+        try:
+            for migration in self.pending():
+                if migration.apply(self):
+                    applied.append(migration.version)
+        finally:
+            self.con.isolation_level = isolation_level
+        return applied
+
+    # HELPERS
+    def _set_version(self, cur, version):
+        '''
+        Store the version of the database schema.
+        '''
+
+        cur.execute('PRAGMA user_version = %d' % version)
+
+    def _report(self, migration, last_key, max_key):
+        '''
+        Call the progress function, if any.
+        '''
+
+        if self.progress is not None:
+            self.progress(migration, last_key, max_key)
+
+
+# Contribution of a goal or a resource row (NEW or OLD) to user_stats
+_GOAL_STATS = {
+    'goals_not_started': 'IFNULL({row}.status, 0) <= 0',
+    'goals_in_progress': 'IFNULL({row}.status, 0) > 0 AND \
+                          IFNULL({row}.status, 0) < 1',
+    'goals_done': 'IFNULL({row}.status, 0) >= 1',
+}
+_RESOURCE_STATS = {
+    'resources': '1',
+    'rating_sum': 'IFNULL({row}.rating, 0)',
+    'rating_count': '{row}.rating IS NOT NULL',
+    'required_time': 'IFNULL({row}.required_time, 0)',
+}
+
+def _add_stats(stats):
+    '''
+    :return: statement adding the contribution of the NEW row to the
+        statistics of its user, creating them if needed.
+    '''
+
+    columns = sorted(stats)
+    return 'INSERT INTO user_stats (user_id, %s) SELECT NEW.user_id, %s \
+            WHERE NEW.user_id IS NOT NULL ON CONFLICT(user_id) DO UPDATE \
+            SET %s;' % (', '.join(columns),
+                        ', '.join('(%s)' % stats[column].format(row='NEW')
+                                  for column in columns),
+                        ', '.join('%s = %s + excluded.%s' % (column, column,
+                                                             column)
+                                  for column in columns))
+
+def _remove_stats(stats):
+    '''
+    :return: statement removing the contribution of the OLD row from the
+        statistics of its user.
+    '''
+
+    columns = sorted(stats)
+    return 'UPDATE user_stats SET %s WHERE user_id = OLD.user_id;' % \
+        ', '.join('%s = %s - (%s)' % (column, column,
+                                     stats[column].format(row='OLD'))
+                  for column in columns)
+
+def _stats_triggers(table, stats, columns):
+    '''
+    :return: statements creating the triggers maintaining user_stats when
+        rows of the table are inserted, deleted, or updated in the given
+        columns.
+    '''
+
+    return [
+        'CREATE TRIGGER IF NOT EXISTS user_stats_%s_insert AFTER INSERT ON %s \
+         BEGIN %s END' % (table, table, _add_stats(stats)),
+        'CREATE TRIGGER IF NOT EXISTS user_stats_%s_delete AFTER DELETE ON %s \
+         BEGIN %s END' % (table, table, _remove_stats(stats)),
+        'CREATE TRIGGER IF NOT EXISTS user_stats_%s_update \
+         AFTER UPDATE OF user_id, %s ON %s BEGIN %s %s END' % (
+             table, ', '.join(columns), table, _remove_stats(stats),
+             _add_stats(stats)),
+    ]
+
+def _record_change(table, key, row, operation):
+    '''
+    :return: the statement of a trigger recording in the table changes the
+        operation on the row ``OLD`` or ``NEW`` of the table.
+    '''
+
+    return constants.SQL_RECORD_CHANGE.format(
+        table=table, row_id='%s.%s' % (row, key), operation=operation)
+
+def _unreported_delete(table, key, row):
+    '''
+    :return: the condition of a trigger, true if the deletion of the row
+        ``OLD`` or ``NEW`` of the table has not been recorded yet.
+    '''
+
+    return constants.SQL_UNREPORTED_DELETE.format(
+        table=table, row_id='%s.%s' % (row, key))
+
+def _change_update_trigger(table, key, when=''):
+    '''
+    :return: the statement creating the trigger recording the rows of the
+        table updated, tombstoning a row being recorded as a deletion.
+    '''
+
+    return 'CREATE TRIGGER IF NOT EXISTS changes_%s_update AFTER UPDATE ON %s \
+         %s BEGIN %s END' % (table, table, when, _record_change(
+             table, key, 'NEW', "CASE WHEN OLD.deleted_at IS NULL AND \
+             NEW.deleted_at IS NOT NULL THEN 'delete' ELSE 'update' END"))
+
+def _change_delete_trigger(table, key, when=''):
+    '''
+    :return: the statement creating the trigger recording the rows of the
+        table deleted.
+    '''
+
+    return 'CREATE TRIGGER IF NOT EXISTS changes_%s_delete AFTER DELETE ON %s \
+         %s BEGIN %s END' % (table, table, when,
+                             _record_change(table, key, 'OLD', "'delete'"))
+
+def _change_triggers(table, key):
+    '''
+    :return: statements creating the triggers recording in the table changes
+        the rows of the table inserted, updated or deleted. Tombstoning a row
+        is recorded as a deletion.
+    '''
+
+    return [
+        'CREATE TRIGGER IF NOT EXISTS changes_%s_insert AFTER INSERT ON %s \
+         BEGIN %s END' % (table, table,
+                          _record_change(table, key, 'NEW', "'insert'")),
+        _change_update_trigger(table, key),
+        _change_delete_trigger(table, key),
+    ]
+
+def _version_triggers(table, key):
+    '''
+    :return: statements adding the column version to the table, and creating
+        the trigger incrementing it when a row is updated by a statement
+        which does not, such as the ``ON DELETE SET NULL`` cascades. Only the
+        updates incrementing the version are recorded in the table changes,
+        so every version is recorded once.
+    '''
+
+    return [
+        'ALTER TABLE %s ADD COLUMN version INTEGER NOT NULL DEFAULT 1' % table,
+        'CREATE TRIGGER IF NOT EXISTS versions_%s_update AFTER UPDATE ON %s \
+         WHEN NEW.version = OLD.version BEGIN \
+         UPDATE %s SET version = version + 1 WHERE %s = NEW.%s; END' % (
+             table, table, table, key, key),
+        'DROP TRIGGER IF EXISTS changes_%s_update' % table,
+        _change_update_trigger(table, key,
+                               'WHEN NEW.version <> OLD.version'),
+    ]
+
+def _deletion_triggers(table, key):
+    '''
+    :return: statements recreating the triggers recording the rows of the
+        table updated and deleted, so a row whose deletion has already been
+        recorded, such as a row hidden by a tombstone, is not recorded again
+        when a cascade updates it or when it is purged.
+    '''
+
+    return [
+        'DROP TRIGGER IF EXISTS changes_%s_update' % table,
+        _change_update_trigger(table, key, 'WHEN NEW.version <> OLD.version \
+            AND %s' % _unreported_delete(table, key, 'NEW')),
+        'DROP TRIGGER IF EXISTS changes_%s_delete' % table,
+        _change_delete_trigger(table, key, 'WHEN %s' %
+                               _unreported_delete(table, key, 'OLD')),
+    ]
+
+
+MIGRATIONS = [
+    Migration(1, 'Index the foreign key columns', [
+        'CREATE INDEX IF NOT EXISTS user_profile_user_id \
+         ON user_profile(user_id)',
+        'CREATE INDEX IF NOT EXISTS goals_user_id ON goals(user_id)',
+        'CREATE INDEX IF NOT EXISTS goals_parent_id ON goals(parent_id)',
+        'CREATE INDEX IF NOT EXISTS resources_goal_id ON resources(goal_id)',
+        'CREATE INDEX IF NOT EXISTS resources_user_id ON resources(user_id)',
+    ]),
+    Migration(2, 'Index the sort keys of the users list', [
+        'CREATE INDEX IF NOT EXISTS users_registration_date \
+         ON users(IFNULL(registration_date, 0))',
+        'CREATE INDEX IF NOT EXISTS user_profile_rating \
+         ON user_profile(IFNULL(rating, 0), user_id)',
+    ]),
+    Migration(3, 'Index the deadline of the goals not done', [
+        'CREATE INDEX IF NOT EXISTS goals_open_deadline \
+         ON goals(deadline) WHERE status < 1',
+    ]),
+    BackfillMigration(4, 'Maintain the statistics of the users in user_stats', [
+        constants.SQL_CREATE_USER_STATS_TABLE,
+        'CREATE TRIGGER IF NOT EXISTS user_stats_users_insert \
+         AFTER INSERT ON users BEGIN \
+         INSERT OR IGNORE INTO user_stats (user_id) VALUES (NEW.user_id); END',
+        'CREATE TRIGGER IF NOT EXISTS user_stats_users_delete \
+         AFTER DELETE ON users BEGIN \
+         DELETE FROM user_stats WHERE user_id = OLD.user_id; END',
+    ] + _stats_triggers('goals', _GOAL_STATS, ['status']) +
+      _stats_triggers('resources', _RESOURCE_STATS,
+                      ['rating', 'required_time']),
+        'users', constants.SQL_BACKFILL_USER_STATS),
+    Migration(5, 'Add the tombstones of the soft delete mode', [
+        'ALTER TABLE users ADD COLUMN deleted_at INTEGER',
+        'ALTER TABLE goals ADD COLUMN deleted_at INTEGER',
+        'ALTER TABLE resources ADD COLUMN deleted_at INTEGER',
+        'CREATE INDEX IF NOT EXISTS users_deleted ON users(deleted_at) \
+         WHERE deleted_at IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS goals_deleted ON goals(deleted_at) \
+         WHERE deleted_at IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS resources_deleted \
+         ON resources(deleted_at) WHERE deleted_at IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS goals_user_id_live ON goals(user_id) \
+         WHERE deleted_at IS NULL',
+        'CREATE INDEX IF NOT EXISTS resources_goal_id_live \
+         ON resources(goal_id) WHERE deleted_at IS NULL',
+        'CREATE INDEX IF NOT EXISTS resources_user_id_live \
+         ON resources(user_id) WHERE deleted_at IS NULL',
+        constants.SQL_CREATE_LIVE_USERS_VIEW,
+        constants.SQL_CREATE_LIVE_GOALS_VIEW,
+        constants.SQL_CREATE_LIVE_RESOURCES_VIEW,
+    ]),
+    Migration(6, 'Record the changes of the users, goals and resources', [
+        constants.SQL_CREATE_CHANGES_TABLE,
+        # The profile is part of the user
+        'CREATE TRIGGER IF NOT EXISTS changes_user_profile_update \
+         AFTER UPDATE ON user_profile BEGIN %s END' %
+        constants.SQL_RECORD_CHANGE.format(table='users',
+                                           row_id='NEW.user_id',
+                                           operation="'update'"),
+    ] + _change_triggers('users', 'user_id') +
+      _change_triggers('goals', 'goal_id') +
+      _change_triggers('resources', 'resource_id')),
+    Migration(7, 'Version the users, goals and resources', [
+        # The update of a profile is recorded as a new version of the user
+        'DROP TRIGGER IF EXISTS changes_user_profile_update',
+        'CREATE TRIGGER IF NOT EXISTS versions_user_profile_update \
+         AFTER UPDATE ON user_profile BEGIN \
+         UPDATE users SET version = version + 1 \
+         WHERE user_id = NEW.user_id; END',
+    ] + _version_triggers('users', 'user_id') +
+      _version_triggers('goals', 'goal_id') +
+      _version_triggers('resources', 'resource_id')),
+    Migration(8, 'Record the deletion of the users, goals and resources once', [
+        'CREATE INDEX IF NOT EXISTS changes_row ON changes(table_name, row_id)',
+    ] + _deletion_triggers('users', 'user_id') +
+      _deletion_triggers('goals', 'goal_id') +
+      _deletion_triggers('resources', 'resource_id')),
+    Migration(9, 'Version the users once per modification', [
+        # modify_user increments the version of the user in the same
+        # transaction as the update of its profile
+        'DROP TRIGGER IF EXISTS versions_user_profile_update',
+    ]),
+]
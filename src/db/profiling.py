@@ -0,0 +1,200 @@
+'''
+Created on 19.10.2026
+
+Provides the profiling of the calls to the database API
+
+While the profiling is enabled, the wall time of every :py:class:`Connection`
+method is split into phases:
+
+* ``pragma``: execution of PRAGMA statements
+* ``execute``: preparation and execution of the other statements
+* ``fetch``: fetching of the resulting rows
+* ``build``: construction of the returned objects from the rows
+* ``commit``: commit of the transactions
+* ``python``: the rest of the time, spent in the wrappers of the API
+
+Only the outermost call is profiled, so the methods called by another one
+(for instance ``set_foreign_keys_support``) are part of its phases. The number
+of SQLite virtual machine instructions of every call path is estimated through
+the progress handler of sqlite3.
+
+:Example:
+
+>>> engine = Engine(profile=True)
+>>> engine.profile_stats()['get_users']['fetch']
+>>> engine.dump_profile('goalz.folded')
+
+The dumped file uses the folded stacks format of flamegraph.pl and speedscope.
+'''
+
+import functools
+import sqlite3
+import threading
+from time import perf_counter
+
+from src.db import constants
+
+PHASES = ('pragma', 'execute', 'fetch', 'build', 'commit', 'python')
+
+
+class CallProfiler(object):
+    '''
+    Aggregated time per call path and phase.
+
+    :param bool enabled: Default False. Profile the calls.
+    '''
+
+    def __init__(self, enabled=False):
+        super(CallProfiler, self).__init__()
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._paths = {}
+
+    def begin(self, name, con):
+        '''
+        Start the profiling of a call.
+
+        :param str name: name of the called method.
+        :param con: the sqlite3 connection used by the call.
+        '''
+
+        stack = self._stack()
+        path = stack[-1][0] + (name,) if stack else (name,)
+        # [path, phases, seconds spent in nested calls, virtual machine ticks]
+        stack.append([path, dict.fromkeys(PHASES, 0.0), 0.0, 0])
+        if len(stack) == 1:
+            con.set_progress_handler(self._progress,
+                                     constants.PROFILER_PROGRESS_STEPS)
+
+    def end(self, elapsed, con, calls=1):
+        '''
+        Finish the profiling of the current call.
+
+        :param float elapsed: wall time of the call in seconds.
+        :param con: the sqlite3 connection used by the call.
+        :param int calls: Default 1. Number of calls added to the call path,
+            0 when resuming a call already counted, such as a generator.
+        '''
+
+        stack = self._stack()
+        path, phases, nested, ticks = stack.pop()
+        if stack:
+            stack[-1][2] += elapsed
+        else:
+            try:
+                con.set_progress_handler(None, 0)
+            except sqlite3.ProgrammingError:
+                # The call closed the connection
+                pass
+        phases['python'] = max(elapsed - nested - sum(phases.values()), 0.0)
+        with self._lock:
+            entry = self._paths.get(path)
+            if entry is None:
+                entry = self._paths[path] = [0, 0.0, dict.fromkeys(PHASES, 0.0),
+                                             0]
+            entry[0] += calls
+            entry[1] += elapsed
+            for phase, seconds in phases.items():
+                entry[2][phase] += seconds
+            entry[3] += ticks * constants.PROFILER_PROGRESS_STEPS
+
+    def add(self, phase, elapsed):
+        '''
+        Add time to a phase of the current call. Ignored outside of a call.
+
+        :param str phase: one of :py:data:`PHASES`.
+        :param float elapsed: seconds spent in the phase.
+        '''
+
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack[-1][1][phase] += elapsed
+
+    def snapshot(self):
+        '''
+        :return: dictionary with an entry per call path, whose key is the name
+            of the methods separated by ``;``. Each entry is a dictionary with
+            the keys ``calls`` (int), ``total`` (seconds, float),
+            ``vm_steps`` (estimated SQLite instructions, int) and the seconds
+            spent in each one of the :py:data:`PHASES` (float).
+        '''
+
+        with self._lock:
+            paths = [(path, calls, total, dict(phases), steps)
+                     for path, (calls, total, phases, steps)
+                     in self._paths.items()]
+        snapshot = {}
+        for path, calls, total, phases, steps in paths:
+            phases.update({'calls': calls, 'total': total, 'vm_steps': steps})
+            snapshot[';'.join(path)] = phases
+        return snapshot
+
+    def folded(self):
+        '''
+        :return: the profile in the folded stacks format, one line per call
+            path and phase with the time spent in microseconds (str).
+        '''
+
+        lines = []
+        for path, entry in sorted(self.snapshot().items()):
+            for phase in PHASES:
+                micros = int(round(entry[phase] * 1e6))
+                if micros:
+                    lines.append('%s;%s %d' % (path, phase, micros))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def dump(self, path):
+        '''
+        Write the profile in the folded stacks format.
+
+        :param str path: path of the file written.
+        '''
+
+        with open(path, 'w') as file:
+            file.write(self.folded())
+
+    def reset(self):
+        '''
+        Remove the profile recorded so far.
+        '''
+
+        with self._lock:
+            self._paths = {}
+
+    # HELPERS
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def _progress(self):
+        stack = self._local.stack
+        if stack:
+            stack[-1][3] += 1
+        return 0
+
+
+def profiled(phase):
+    '''
+    Decorator adding the time spent in a method of a repository to a phase of
+    the current call, when the profiling of the Engine is enabled.
+
+    :param str phase: one of :py:data:`PHASES`.
+    '''
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self.con, 'profiler', None)
+            if profiler is None or not profiler.enabled:
+                return method(self, *args, **kwargs)
+            start = perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                profiler.add(phase, perf_counter() - start)
+        return wrapper
+    return decorator
@@ -7,7 +7,10 @@ Reference: Code taken and modified from PWP2018 exercise
 '''
 
 import sqlite3
+import time
 from src.db import constants
+from src.db.profiling import profiled
+from src.db.softdelete import live_statement
 
 
 class ResourceRepo(object):
@@ -23,11 +26,14 @@ class ResourceRepo(object):
 
     :param con: Connection to an SqlLite database
     :type con: sqlite3.Connection
+    :param bool soft_delete: Default False. Tombstone the deleted resources
+        and hide them from the reads, see :py:mod:`src.db.softdelete`.
     '''
 
-    def __init__(self, con):
+    def __init__(self, con, soft_delete=False):
         super(ResourceRepo, self).__init__()
         self.con = con
+        self.soft_delete = soft_delete
 
     def get_resource(self, resource_id):
         '''
@@ -39,7 +45,7 @@ class ResourceRepo(object):
             id does not exist.
         '''
 
-        query = constants.SQL_SELECT_RESOURCE_BY_ID
+        query = self._read(constants.SQL_SELECT_RESOURCE_BY_ID)
         param_value = (resource_id,)
 
         self.con.row_factory = sqlite3.Row
@@ -51,6 +57,37 @@ class ResourceRepo(object):
             return None
         return self._create_resource_object(row)
 
+    def get_resource_if_changed(self, resource_id, known_version):
+        '''
+        Extracts a resource from the database only if its version is not
+        ``known_version``. The version is read first with a primary key
+        lookup, so an unmodified resource is neither fetched nor built.
+
+        :param int resource_id: Id of the resource to be retrieved
+        :param int known_version: the version of the resource known by the
+            caller, or None.
+        :return: None if the resource does not exist, else a tuple (version,
+            resource) where resource is None if the version is
+            ``known_version``, or a dictionary with the format provided in
+            :py:meth:`_create_resource_object`.
+        '''
+
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_SELECT_RESOURCE_VERSION),
+                    (resource_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if row[0] == known_version:
+            return row[0], None
+        cur.execute(self._read(constants.SQL_SELECT_RESOURCE_BY_ID),
+                    (resource_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return row['version'], self._create_resource_object(row)
+
     def get_resources(self, goal_id, user_id, number_of_resource, max_length):
         '''
         Return a list of all the resources in the database filtered by the
@@ -76,28 +113,11 @@ class ResourceRepo(object):
                  created by :py:meth:`_create_message_object`
         '''
 
-        query = constants.SQL_SELECT_RESOURCES
-
-        filters = []
-        parameters = []
-
-        if goal_id is not None:
-            if not isinstance(goal_id, int):
-                return None
-            filters.append(constants.SQL_SELECT_RESOURCE_GOAL_ID_FILTER)
-            parameters.append(str(goal_id))
-        if user_id is not None:
-            if not isinstance(user_id, int):
-                return None
-            filters.append(constants.SQL_SELECT_RESOURCE_USER_ID_FILTER)
-            parameters.append(str(user_id))
-        if max_length is not None:
-            if not isinstance(max_length, int):
-                return None
-            filters.append(constants.SQL_SELECT_RESOURCE_LENGTH_FILTER)
-            parameters.append(str(max_length))
-        if len(filters) != 0:
-            query += constants.SQL_WHERE_CLAUSE + constants.SLQ_AND_CLAUSE.join(filters)
+        filters = self._resources_filter(goal_id, user_id, max_length)
+        if filters is None:
+            return None
+        query, parameters = filters
+        query = self._read(constants.SQL_SELECT_RESOURCES) + query
 
         if number_of_resource is not None:
             if not isinstance(number_of_resource, int):
@@ -119,16 +139,48 @@ class ResourceRepo(object):
             resources.append(resource)
         return resources
 
+    def count_resources(self, goal_id, user_id, max_length):
+        '''
+        Count the resources in the database filtered by the conditions
+        provided in the parameters, without fetching them.
+
+        :param int goal_id: Count the resources of the goal with the given
+            goal_id. If None, resources of all the goals are counted.
+        :param int user_id: Count the resources of the user with the given
+            user_id. If None, resources of all the users are counted.
+        :param int max_length: Resources with a required time greater than
+            max_length are not counted. If None, this condition is not
+            applied.
+        :return: the number of resources (int) or None if a parameter is not
+            valid.
+        '''
+
+        filters = self._resources_filter(goal_id, user_id, max_length)
+        if filters is None:
+            return None
+        query, parameters = filters
+
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_COUNT_RESOURCES) + query,
+                    tuple(parameters))
+        return cur.fetchone()[0]
+
     def delete_resource(self, resource_id):
         '''
-        Delete the resource with id given as parameter.
+        Delete the resource with id given as parameter. In soft delete mode,
+        the resource is only tombstoned.
 
         :param int resource_id: Id of the resource to remove.
-        :return: True if the resource has been deleted, False otherwise
+        :return: True if the resource has been deleted, False otherwise (or if it
+            is already hidden, in soft delete mode)
         '''
 
-        query = constants.SQL_DELETE_RESOURCE
-        param_value = (resource_id,)
+        if self.soft_delete:
+            query = self._write(constants.SQL_SOFT_DELETE_RESOURCE)
+            param_value = (int(time.time()), resource_id)
+        else:
+            query = constants.SQL_DELETE_RESOURCE
+            param_value = (resource_id,)
 
         cur = self.con.cursor()
         cur.execute(query, param_value)
@@ -138,39 +190,47 @@ class ResourceRepo(object):
             return False
         return True
 
-    def modify_resource(self, resource_id, rating):
+    def modify_resource(self, resource_id, rating, expected_version=None):
         '''
         Modify the rating of the resource with id ``resource_id``
 
         :param int resource_id: The id of the resource to modify.
         :param rating: The resource's rating
         :type rating: float
+        :param int expected_version: Default None. Modify the resource only
+            if its version is still this one.
         :return: The id of the modified resource or None. None is returned
-                 if the resource was not found or if the rating parameter is
-                 not a float value.
+                 if the resource was not found (or is deleted, in soft delete
+                 mode) or if the rating parameter is not a float value.
+                 :py:data:`constants.CONFLICT` is returned
+                 if the version of the resource is not ``expected_version``.
         '''
 
-        cur = self.con.cursor();
+        if not isinstance(rating, float):
+            return None
 
-        # Part 1 - check if message exists
-        query = constants.SQL_SELECT_RESOURCE_BY_ID
-        param_value = (resource_id,)
+        # A single statement, the number of modified rows tells whether the
+        # resource exists
+        cur = self.con.cursor()
+        query = self._write(constants.SQL_UPDATE_RESOURCE)
+        param_value = (rating, resource_id)
+        if expected_version is not None:
+            query += constants.SQL_VERSION_FILTER
+            param_value += (expected_version,)
         cur.execute(query, param_value)
+        self.con.commit()
 
-        row = cur.fetchone()
-        if row is not None:
-            # Part 2 - execute update
-            if not isinstance(rating, float):
-                return None
-            query = constants.SQL_UPDATE_RESOURCE
-            param_value = (rating, resource_id)
-            cur.execute(query, param_value)
-            self.con.commit()
-
-            if cur.rowcount > 0:
-                return resource_id
+        if cur.rowcount > 0:
+            return resource_id
+        if expected_version is None:
+            return None
 
-        return None
+        # Not modified: the resource does not exist or has another version
+        cur.execute(self._read(constants.SQL_SELECT_RESOURCE_VERSION),
+                    (resource_id,))
+        if cur.fetchone() is None:
+            return None
+        return constants.CONFLICT
 
     def create_resource(self, goal_id, user_id, title,
                         link, topic, description, required_time):
@@ -196,36 +256,76 @@ class ResourceRepo(object):
         if required_time and not isinstance(required_time, int):
                 return None
 
-        # Check if referred goal exists
-        query = constants.SQL_SELECT_GOAL_BY_ID
-        param_value = (goal_id,)
-        cur = self.con.cursor()
-        cur.execute(query, param_value)
-        row = cur.fetchone()
-        if row is None:
-            return None
-
-        # Check if referred goal exists
-        query = constants.SQL_SELECT_USER_BY_ID
-        param_value = (user_id,)
-        cur = self.con.cursor()
-        cur.execute(query, param_value)
-        row = cur.fetchone()
-        if row is None:
-            return None
-
-        statement = constants.SQL_INSERT_RESOURCE
-        param_value = (goal_id, user_id, title, link, topic,
-                       description, required_time, 0)
+        # The resource is only inserted if the referred goal and user exist
+        statement = self._read(constants.SQL_INSERT_RESOURCE)
+        param_value = {'goal_id': goal_id, 'user_id': user_id, 'title': title,
+                       'link': link, 'topic': topic,
+                       'description': description,
+                       'required_time': required_time, 'rating': 0}
 
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
         cur.execute(statement, param_value)
         self.con.commit()
+        if cur.rowcount < 1:
+            return None
 
         return cur.lastrowid
 
+    # HELPERS FOR FILTERS
+    def _read(self, statement):
+        '''
+        :return: the statement, reading the live_* views in soft delete mode.
+        '''
+
+        if self.soft_delete:
+            return live_statement(statement)
+        return statement
+
+    def _write(self, statement):
+        '''
+        :return: the statement, only modifying the resources visible to the
+            reads in soft delete mode.
+        '''
+        if self.soft_delete:
+            return statement + constants.SQL_LIVE_RESOURCE_FILTER
+        return statement
+
+    def _resources_filter(self, goal_id, user_id, max_length):
+        '''
+        Build the WHERE clause shared by :py:meth:`get_resources` and
+        :py:meth:`count_resources`.
+
+        :return: tuple with the clause (str, empty if there are no filters)
+            and the list of its parameters, or None if a parameter is not
+            valid.
+        '''
+
+        filters = []
+        parameters = []
+
+        if goal_id is not None:
+            if not isinstance(goal_id, int):
+                return None
+            filters.append(constants.SQL_SELECT_RESOURCE_GOAL_ID_FILTER)
+            parameters.append(str(goal_id))
+        if user_id is not None:
+            if not isinstance(user_id, int):
+                return None
+            filters.append(constants.SQL_SELECT_RESOURCE_USER_ID_FILTER)
+            parameters.append(str(user_id))
+        if max_length is not None:
+            if not isinstance(max_length, int):
+                return None
+            filters.append(constants.SQL_SELECT_RESOURCE_LENGTH_FILTER)
+            parameters.append(str(max_length))
+        if len(filters) == 0:
+            return '', parameters
+        return (constants.SQL_WHERE_CLAUSE +
+                constants.SLQ_AND_CLAUSE.join(filters), parameters)
+
     # HELPERS FOR GOALS
+    @profiled('build')
     def _create_resource_object(self, row):
         '''
         It takes a :py:class:`sqlite3.Row` and transform it into a dictionary.
@@ -262,6 +362,7 @@ class ResourceRepo(object):
 
         return resource
 
+    @profiled('build')
     def _create_resource_list_object(self, row):
         '''
         Same as :py:meth:`_create_resource_object`. However, the resulting
@@ -0,0 +1,49 @@
+'''
+Created on 19.10.2026
+
+Provides the soft delete mode of the db layer
+
+When the Engine is created with ``soft_delete=True``, deleting a user, a goal
+or a resource only stores the time of the deletion in its ``deleted_at``
+column, the tombstone, with a row update. The reads of the
+repositories use the views ``live_users``, ``live_goals`` and
+``live_resources`` instead of the tables, which hide the tombstoned rows and
+the rows depending on them: the goals whose ancestor or user is tombstoned,
+and the resources of those goals.
+
+While no row is tombstoned, the views only add two lookups in the partial
+indexes of the tombstones to every statement. The partial indexes
+``goals_user_id_live``, ``resources_goal_id_live`` and
+``resources_user_id_live`` exclude the tombstoned rows.
+
+The tombstoned rows and their dependents are physically deleted later, in
+short transactions, by :py:meth:`BatchedDelete.purge`, run by the maintenance
+of the Engine or by :py:meth:`Engine.purge`.
+
+The rows hidden by a tombstone are recorded as deleted in the table
+``changes`` when it is created, so the consumers of the changes drop them
+immediately. Their purge, and the cascades updating them, are not recorded
+again.
+
+Until they are purged, tombstoned users keep their nickname, and the
+tombstoned rows are still counted in ``user_stats``: while there are
+tombstones, the statistics of the users are aggregated from the views.
+'''
+
+import functools
+import re
+
+_TABLE = re.compile(r'\b(FROM\s+)(users|goals|resources)\b', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def live_statement(statement):
+    '''
+    :param str statement: SQL statement reading the tables users, goals or
+        resources.
+    :return: the same statement reading the corresponding live_* views,
+        aliased with the name of the table, so qualified columns are still
+        valid.
+    '''
+
+    return _TABLE.sub(r'\1live_\2 AS \2', statement)
@@ -0,0 +1,174 @@
+'''
+Created on 19.10.2026
+
+Provides bulk import and export of table rows as CSV or JSON-lines files
+
+Rows are streamed in chunks, so tables of any size can be moved between
+databases without holding them in memory.
+'''
+
+import csv
+import gzip
+import json
+
+from src.db import constants
+
+FORMATS = ('csv', 'jsonl')
+
+
+class TableTransfer(object):
+    '''
+    Export and import the rows of a table of the Goalz database.
+
+    CSV files contain a header row with the column names. NULL values are
+    written as empty fields and empty fields are imported as NULL. JSON-lines
+    files contain a JSON object per row and keep the value types. The columns
+    missing from an object are imported with their default value.
+
+    Instances of this class should not be used directly. Use
+    :py:meth:`Engine.export` and :py:meth:`Engine.import_` instead.
+
+    :param con: Connection to an SqlLite database
+    :type con: sqlite3.Connection
+    :param int chunk_size: number of rows read or written at once.
+    '''
+
+    def __init__(self, con, chunk_size=constants.TRANSFER_CHUNK_SIZE):
+        super(TableTransfer, self).__init__()
+        self.con = con
+        self.chunk_size = chunk_size
+
+    def export(self, table, path, format='csv', compress=None):
+        '''
+        Write all the rows of a table to a file.
+
+        :param str table: name of the table. One of :py:data:`constants.TABLES`.
+        :param str path: path of the file to create.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: Default None. Compress the file with gzip. If None,
+            the file is compressed when ``path`` ends with ``.gz``.
+        :return: the number of rows exported.
+        :raises ValueError: if the table or the format are not valid.
+        '''
+
+        columns = self._columns(table, format)
+        query = 'SELECT %s FROM %s ORDER BY rowid' % (', '.join(columns), table)
+        cur = self.con.cursor()
+        cur.execute(query)
+        count = 0
+        with self._open(path, 'w', compress) as file:
+            if format == 'csv':
+                writer = csv.writer(file)
+                writer.writerow(columns)
+            while True:
+                rows = cur.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                if format == 'csv':
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        file.write(json.dumps(dict(zip(columns, row))))
+                        file.write('\n')
+                count += len(rows)
+        return count
+
+    def import_(self, table, path, format='csv', compress=None):
+        '''
+        Insert into a table the rows contained in a file.
+
+        The import runs in a single transaction and foreign keys are checked
+        when it is committed, so rows referencing other rows of the same table
+        can appear in any order. The tables referenced by ``table`` must be
+        imported first.
+
+        :param str table: name of the table. One of :py:data:`constants.TABLES`.
+        :param str path: path of the file to read.
+        :param str format: ``'csv'`` or ``'jsonl'``.
+        :param bool compress: Default None. The file is compressed with gzip.
+            If None, the file is considered compressed when ``path`` ends with
+            ``.gz``.
+        :return: the number of rows imported.
+        :raises ValueError: if the table or the format are not valid or if the
+            file contains unknown columns.
+        :raises sqlite3.Error: if the rows cannot be inserted. Nothing is
+            imported in that case.
+        '''
+
+        table_columns = self._columns(table, format)
+        count = 0
+        with self._open(path, 'r', compress) as file:
+            if format == 'csv':
+                reader = csv.reader(file)
+                header = next(reader, None)
+                if header is None:
+                    return 0
+                header = tuple(header)
+                self._insert_statement(table, header, table_columns)
+                rows = ((header, tuple(value if value != '' else None
+                                       for value in row))
+                        for row in reader)
+            else:
+                lines = (json.loads(line) for line in file if line.strip())
+                rows = ((tuple(item), tuple(item.values())) for item in lines)
+            cur = self.con.cursor()
+            with self.con:
+                cur.execute(constants.SQL_DEFER_FOREIGN_KEYS)
+                columns = None
+                chunk = []
+                for row_columns, row in rows:
+                    # JSON objects may have different keys: the rows are
+                    # inserted in chunks sharing the same columns
+                    if row_columns != columns or len(chunk) >= self.chunk_size:
+                        if chunk:
+                            cur.executemany(statement, chunk)
+                            count += len(chunk)
+                            chunk = []
+                        if row_columns != columns:
+                            columns = row_columns
+                            statement = self._insert_statement(
+                                table, columns, table_columns)
+                    chunk.append(row)
+                if chunk:
+                    cur.executemany(statement, chunk)
+                    count += len(chunk)
+        return count
+
+    # HELPERS
+    def _columns(self, table, format):
+        '''
+        Validate the parameters and return the columns of the table.
+        '''
+
+        if table not in constants.TABLES:
+            raise ValueError("Unknown table %s" % table)
+        if format not in FORMATS:
+            raise ValueError("Unknown format %s" % format)
+        cur = self.con.cursor()
+        cur.execute('PRAGMA table_info(%s)' % table)
+        return [row[1] for row in cur.fetchall()]
+
+    def _open(self, path, mode, compress):
+        '''
+        Open a text file, compressed with gzip if requested.
+        '''
+
+        if compress is None:
+            compress = path.endswith('.gz')
+        if compress:
+            return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+        return open(path, mode, encoding='utf-8', newline='')
+
+    def _insert_statement(self, table, columns, table_columns):
+        '''
+        Create the statement inserting ``columns`` into a table.
+
+        :raises ValueError: if ``columns`` are not columns of the table.
+        '''
+
+        unknown = set(columns) - set(table_columns)
+        if unknown:
+            raise ValueError("Unknown columns for table %s: %s" %
+                             (table, ', '.join(sorted(unknown))))
+        return 'INSERT INTO %s (%s) VALUES (%s)' % (
+            table, ', '.join(columns), ', '.join('?' * len(columns)))
@@ -6,9 +6,26 @@ Provides method to access and manipulate data from the "user" table
 
 Reference: Code adapted and modified from PWP2018 exercise
 '''
+import base64
 from datetime import datetime
+import functools
+import json
 import src.db.constants as constants
 import time, sqlite3
+from src.db.batching import BatchedDelete
+from src.db.profiling import profiled
+from src.db.softdelete import live_statement
+
+class UsersPage(list):
+    '''
+    List of users returned by :py:meth:`UserRepo.get_users`.
+
+    The attribute :py:attr:`cursor` is the opaque keyset cursor of its last
+    user, passed as ``after`` to read the next page, or None if the page is
+    empty.
+    '''
+    cursor = None
+
 
 class UserRepo(object):
     '''
@@ -23,54 +40,40 @@ class UserRepo(object):
 
     :param con: Connection to an SqlLite database
     :type con: sqlite3.Connection
+    :param nickname_cache: Default None. Cache of the user_id of the
+        nicknames, shared by the connections of the Engine.
+    :type nickname_cache: NicknameCache
+    :param bool soft_delete: Default False. Tombstone the deleted users and
+        hide them from the reads, see :py:mod:`src.db.softdelete`.
     '''
-    def __init__(self, con):
+    def __init__(self, con, nickname_cache=None, soft_delete=False):
         super(UserRepo, self).__init__()
         self.con = con
+        self.nickname_cache = nickname_cache
+        self.soft_delete = soft_delete
 
-    def get_user_public(self, user_id, nickname):
+    def get_user_public(self, user_id, nickname, with_stats=False):
         '''
         Extracts public information of a user by the user_id or nickname
         
         :param int user_id: The unique ID of the user, default None.
         :param str nickname: The nickname of the user to search for, default None.
+        :param bool with_stats: Default False. Add the statistics of the user
+            under the key ``stats``, read from the table ``user_stats`` with
+            a primary key lookup.
         :return: Dictionary with the format provided in the method:
             :py:meth:`_create_user_list_object`. None is returned if the database
             has no users with given nickname.
 
         '''
-        #Cursor and row initialization
-        self.con.row_factory = sqlite3.Row
-        cur = self.con.cursor()
-        if nickname is not None:
-            #Fetch and return user if it exists else return None
-            #SQL Statement for retrieving the user given a nickname
-            query1 = constants.SQL_SELECT_USER_BY_NICKNAME
-            #Execute SQL Statement to retrieve the id given a nickname
-            pvalue = (nickname,)
-            cur.execute(query1, pvalue)
-            #Extract the user id
-            row = cur.fetchone()
-            if row is None:
-                return None
-            user_id = row["user_id"]
-        elif user_id is None:
-            return None
-        #Create the SQL Statements
-        #SQL Statement for retrieving the user given a user_id
-        query = constants.SQL_SELET_USER_AND_PROFILE_BY_ID
-        # Execute the SQL Statement to retrieve the user information.
-        # Create first the valuse
-        pvalue = (user_id, )
-        #execute the statement
-        cur.execute(query, pvalue)
-        #Process the response. Only one posible row is expected.
-        row = cur.fetchone()
+        row = self._select_user(user_id, nickname)
         if row is None:
             return None
         #return user dictionary
-        return self._create_user_list_object(row)
-
+        user = self._create_user_list_object(row)
+        if with_stats:
+            user['stats'] = self._user_stats(row['user_id'])
+        return user
 
     def get_user(self, user_id, nickname):
         '''
@@ -83,71 +86,174 @@ class UserRepo(object):
             has no users with given user_id.
 
         '''
-        #Cursor and row initialization
-        self.con.row_factory = sqlite3.Row
-        cur = self.con.cursor()
-        if nickname is not None:
-            #Fetch and return user if it exists else return None
-            #SQL Statement for retrieving the user given a nickname
-            query1 = constants.SQL_SELECT_USER_BY_NICKNAME
-            #Execute SQL Statement to retrieve the id given a nickname
-            pvalue = (nickname,)
-            cur.execute(query1, pvalue)
-            #Extract the user id
-            row = cur.fetchone()
-            if row is None:
-                return None
-            user_id = row["user_id"]
-        elif user_id is None:
-            return None
-        #Create the SQL Statements
-        #SQL Statement for retrieving the user given a user_id
-        query = constants.SQL_SELET_USER_AND_PROFILE_BY_ID
-        # Execute the SQL Statement to retrieve the user information.
-        # Create first the valuse
-        pvalue = (user_id, )
-        #execute the statement
-        cur.execute(query, pvalue)
-        #Process the response. Only one posible row is expected.
-        row = cur.fetchone()
+        row = self._select_user(user_id, nickname)
         if row is None:
             return None
         #return user dictionary
         return self._create_user_object(row)
 
-    def get_users(self):
+    def get_user_if_changed(self, user_id, known_version):
+        '''
+        Extracts all the information of a user only if its version is not
+        ``known_version``. The version is read first with a primary key
+        lookup, so an unmodified user is neither fetched nor built. Modifying
+        the profile of a user creates a new version of the user.
+
+        :param int user_id: The unique id of the user.
+        :param int known_version: the version of the user known by the
+            caller, or None.
+        :return: None if the user does not exist, else a tuple (version,
+            user) where user is None if the version is ``known_version``, or
+            a dictionary with the format provided in the method
+            :py:meth:`_create_user_object`.
         '''
-        Extracts all users in the database.
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_SELECT_USER_VERSION), (user_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if row[0] == known_version:
+            return row[0], None
+        row = self._select_user(user_id, None)
+        if row is None:
+            return None
+        return row['version'], self._create_user_object(row)
 
-        :return: List of Users of the database. Each user is a dictionary
+    def get_users(self, number_of_users=None, sort_by=None, descending=False,
+                  after=None):
+        '''
+        Extracts the users in the database, one page at a time.
+
+        Pages are selected with a keyset cursor, which holds the value of the
+        sort key and the user_id of the last user of the previous page. Only
+        the public columns are read, and every sort order is backed by an
+        index, so the cost of a page depends on its size and not on the
+        number of users.
+
+        :param int number_of_users: Default None. Maximum number of users
+            returned. If None, there is no limit.
+        :param str sort_by: Default None. ``'nickname'``,
+            ``'registration_date'`` or ``'rating'``. If None, users are
+            sorted by user_id. Ties are sorted by user_id, and users without
+            a nickname, registration date or rating are sorted first.
+        :param bool descending: Default False. Sort in descending order.
+        :param str after: Default None. The attribute ``cursor`` of the
+            previous page, read with the same ``sort_by``. Only the users
+            sorted after its last user are returned, even if that user has
+            been deleted or modified since.
+        :return: :py:class:`UsersPage` of the users. Each user is a dictionary
             with the format provided in the method:
             :py:meth:`_create_user_list_object`.
-            None is returned if the database has no users.
+        :raises ValueError: if ``sort_by`` is not a valid sort key or
+            ``after`` is not a cursor of this sort key.
 
         '''
-        #Create the SQL Statements
-          #SQL Statement for retrieving the users
-        query = constants.SQL_SELECT_USER_AND_PROFILE
-        #Create the cursor
+        if sort_by not in constants.USERS_SORT_KEYS:
+            raise ValueError("Invalid `sort_by` key")
+        key, tie, nullable = constants.USERS_SORT_KEYS[sort_by]
+        #Create the SQL Statement
+        query = self._read(constants.SQL_SELECT_USERS_PUBLIC % key)
+        pvalue = []
+        if after is not None:
+            #Keyset cursor: value of the sort key and user_id of the last user
+            #of the previous page
+            value, user_id = _decode_users_cursor(sort_by, after)
+            if value is None and not nullable:
+                raise ValueError("Invalid `after` cursor")
+            compare = '<' if descending else '>'
+            if tie is None:
+                query += ' AND %s %s ?' % (key, compare)
+                pvalue.append(value)
+            elif value is None:
+                #NULL values are sorted first, so they are followed by the
+                #other values in ascending order only
+                if descending:
+                    query += ' AND %s IS NULL AND %s < ?' % (key, tie)
+                else:
+                    query += ' AND (%s IS NOT NULL OR %s > ?)' % (key, tie)
+                pvalue.append(user_id)
+            else:
+                #Written so that the index on the sort key is used for the
+                #range, which a row value comparison would not do
+                query += ' AND (%s %s= ? AND (%s %s ? OR %s %s ?)' % (
+                    key, compare, key, compare, tie, compare)
+                if nullable and descending:
+                    query += ' OR %s IS NULL' % key
+                query += ')'
+                pvalue.extend((value, value, user_id))
+        order = ' DESC' if descending else ''
+        query += ' ORDER BY ' + key + order
+        if tie is not None:
+            query += ', ' + tie + order
+        if number_of_users is not None:
+            query += constants.SQL_LIMIT_CLAUSE
+            pvalue.append(number_of_users)
+        #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
         #Execute main SQL Statement
-        cur.execute(query)
+        cur.execute(query, pvalue)
         #Process the results
         rows = cur.fetchall()
-        if rows is None:
-            return None
         #Process the response.
-        users = []
+        users = UsersPage()
         for row in rows:
             users.append(self._create_user_list_object(row))
+        if rows:
+            last = rows[-1]
+            users.cursor = _encode_users_cursor(sort_by, last['sort_key'],
+                                                last['user_id'])
         return users
 
 
+    def get_user_summary(self, user_id):
+        '''
+        Aggregate the goals and the resources of a user with a single query,
+        without fetching them.
+
+        :param int user_id: The unique ID of the user.
+        :return: None if the user does not exist, otherwise a dictionary with
+            the following format:
+
+            .. code-block:: javascript
+
+                {'goals': {'total':, 'not_started':, 'in_progress':,
+                           'done':},
+                 'resources':, 'average_rating':, 'required_time':}
+
+            where:
+
+            * ``total``: number of goals of the user (int).
+            * ``not_started``: goals with status 0 (int).
+            * ``in_progress``: goals with status between 0 and 1 (int).
+            * ``done``: goals with status 1 (int).
+            * ``resources``: number of resources posted by the user (int).
+            * ``average_rating``: average rating of those resources, None if
+              there are no resources (float).
+            * ``required_time``: total required time of those resources (int).
+
+        '''
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cur.execute(self._read(constants.SQL_SELECT_USER_SUMMARY),
+                    {'user_id': user_id})
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return {'goals': {'total': row['goals'],
+                          'not_started': row['not_started'],
+                          'in_progress': row['in_progress'],
+                          'done': row['done']},
+                'resources': row['resources'],
+                'average_rating': row['average_rating'],
+                'required_time': row['required_time']}
+
     def delete_user(self, user_id):
         '''
         Remove all information of the user with the user_id passed in as
-        argument.
+        argument. In soft delete mode, the user is only tombstoned, which hides
+        its goals and their resources too.
 
         :param int user_id: The unique ID of the user to remove.
         :return: True if the user is deleted, False otherwise.
@@ -155,14 +261,23 @@ class UserRepo(object):
         '''
         #Create the SQL Statements
         #SQL Statement for deleting the user information
-        query = constants.SQL_DELETE_USER
+        if self.soft_delete:
+            query = constants.SQL_SOFT_DELETE_USER
+            pvalue = (int(time.time()), user_id)
+        else:
+            query = constants.SQL_DELETE_USER
+            pvalue = (user_id,)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
+        if self.soft_delete:
+            #The goals and resources hidden with the user are deleted too
+            cur.execute(constants.SQL_RECORD_HIDDEN_BY_USER, (user_id,))
         #Execute the statement to delete
-        pvalue = (user_id,)
         cur.execute(query, pvalue)
         self.con.commit()
+        if self.nickname_cache is not None:
+            self.nickname_cache.discard_user(user_id)
         #Check that it has been deleted
         if cur.rowcount < 1:
             return False
@@ -170,13 +285,38 @@ class UserRepo(object):
             return True
 
 
+    def delete_users(self, user_ids, progress=None):
+        '''
+        Remove the users passed in as argument, with their profiles, goals and
+        the resources of their goals, in short transactions. See
+        :py:class:`BatchedDelete`. In soft delete mode, the users are only
+        tombstoned, which hides their goals and resources too.
+
+        :param list user_ids: The unique IDs of the users to remove.
+        :param progress: Default None. Function called after every transaction
+            with the statistics of :py:class:`BatchedDelete`.
+        :return: the number of users deleted.
+
+        '''
+        user_ids = list(user_ids)
+        batches = BatchedDelete(self.con, progress)
+        if self.soft_delete:
+            deleted = batches.tombstone_users(user_ids, int(time.time()))
+        else:
+            deleted = batches.delete_users(user_ids)
+        if self.nickname_cache is not None:
+            for user_id in user_ids:
+                self.nickname_cache.discard_user(user_id)
+        return deleted
+
     def modify_user(self, user_id, r_profile):
         '''
         Modify the information of a user.
 
         :param int user_id: The unique ID of the user to modify
         :param dict r_profile: a dictionary with the restricted informtion + website(public)
-                to be modified. The dictionary has the following structure:
+                to be modified. Only the keys present in the dictionary are
+                modified. The dictionary has the following structure:
 
                 .. code-block:: javascript
 
@@ -194,50 +334,43 @@ class UserRepo(object):
                 * ``website``: new user's personal web URL (string).
 
         :return: The user_id of the modified user or None if the
-            ``user_id`` passed is not in the database.
-
-        '''
-        #Create the SQL Statements to check if the users exist
-        query1 = constants.SQL_SELECT_USER_BY_ID
-        #Create the SQL Statements for updating users data
-        query2 = constants.SQL_UPDATE_USER_PASSWORD
-        #Create the SQL Statements for updating users_profile data
-        query3 = constants.SQL_UPDATE_USER_PROFILE
-        #temporal variables
-        _password = None if not r_profile else r_profile.get('password', None)
-        _firstname = None if not r_profile else r_profile.get('firstname', None)
-        _lastname = None if not r_profile else r_profile.get('lastname', None)
-        _email = None if not r_profile else r_profile.get('email', None)
-        _age = None if not r_profile else r_profile.get('age', None)
-        _gender = None if not r_profile else r_profile.get('gender', None)
-        _website = None if not r_profile else r_profile.get('website', None)
+            ``user_id`` passed is not in the database (or is deleted, in
+            soft delete mode).
+
+        '''
+        r_profile = r_profile or {}
+        #Only the provided fields are modified. A password set to None is
+        #considered as not provided
+        _password = r_profile.get('password', None)
+        columns = tuple(column for column in constants.USER_PROFILE_COLUMNS
+                        if column in r_profile)
 
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
-        #execute the first statement
-        pvalue = (user_id, )
-        cur.execute(query1, pvalue)
-        rows = cur.fetchall()
-        if rows is None:
-            return None
-        else:
-            #execute the second statement
+        #All the statements run in the same transaction
+        modified = False
+        if columns:
+            pvalue = [r_profile[column] for column in columns] + [user_id]
+            cur.execute(self._write(_update_profile_statement(columns),
+                                    constants.SQL_LIVE_PROFILE_FILTER), pvalue)
+            modified = cur.rowcount > 0
+        if _password is not None or modified:
+            #A single update of the user sets the password and the version
             pvalue = (_password, user_id)
-            cur.execute(query2, pvalue)
-            row1 = cur.rowcount
-            #execute the third statement
-            pvalue = (_firstname, _lastname, _email, _age, _gender,
-                     _website, user_id)
-
-            cur.execute(query3, pvalue)
-            self.con.commit()
-            row2 = cur.rowcount
-            #Check that the password or the user profile have been successfully modified
-            if row1 < 1 and row2 < 1:
+            cur.execute(self._write(constants.SQL_UPDATE_USER), pvalue)
+            if cur.rowcount < 1:
+                self.con.commit()
                 return None
-            else:
-                return user_id
+            modified = True
+        self.con.commit()
+        if not modified:
+            #Nothing was modified, check that the user exists
+            cur.execute(self._read(constants.SQL_SELECT_USER_BY_ID),
+                        (user_id,))
+            if cur.fetchone() is None:
+                return None
+        return user_id
 
 
     def create_user(self, nickname, new_user):
@@ -270,6 +403,7 @@ class UserRepo(object):
         '''
         #Create the SQL Statements
         #SQL Statement for extracting the userid given a nickname
+        #Tombstoned users keep their nickname until they are purged
         query1 = constants.SQL_SELECT_USER_BY_NICKNAME
         #SQL Statement to create the row in  users table
         query2 = constants.SQL_INSERT_USER
@@ -309,6 +443,8 @@ class UserRepo(object):
                       _gender, _rating, _website)
             cur.execute(query3, pvalue)
             self.con.commit()
+            if self.nickname_cache is not None:
+                self.nickname_cache.discard(nickname)
             #return the nickname
             return nickname
         else:
@@ -324,7 +460,12 @@ class UserRepo(object):
             not exist in the database.
 
         '''
-        query = constants.SQL_SELECT_USER_BY_NICKNAME
+        cache = self.nickname_cache
+        if cache is not None:
+            user_id = cache.get(nickname)
+            if user_id is not None:
+                return user_id
+        query = self._read(constants.SQL_SELECT_USER_BY_NICKNAME)
         #Cursor and row initialization
         self.con.row_factory = sqlite3.Row
         cur = self.con.cursor()
@@ -337,8 +478,9 @@ class UserRepo(object):
         if row is None:
             return None
         #Build the return object
-        else:
-            return row[0]
+        if cache is not None:
+            cache.put(nickname, row[0])
+        return row[0]
 
     def contains_user(self, nickname):
         '''
@@ -350,6 +492,69 @@ class UserRepo(object):
         return self.get_user_id(nickname) is not None
 
     #Helpers for users
+    def _read(self, statement):
+        '''
+        :return: the statement, reading the live_* views in soft delete mode.
+        '''
+        if self.soft_delete:
+            return live_statement(statement)
+        return statement
+
+    def _write(self, statement, live_filter=constants.SQL_LIVE_USER_FILTER):
+        '''
+        :return: the statement, only modifying the users visible to the reads
+            in soft delete mode.
+        '''
+        if self.soft_delete:
+            return statement + live_filter
+        return statement
+
+    def _user_stats(self, user_id):
+        '''
+        Read the statistics of a user from the table ``user_stats``. It still
+        counts the rows tombstoned in soft delete mode until they are purged,
+        so while there are tombstones the statistics are aggregated from the
+        live_* views by :py:meth:`get_user_summary` instead.
+
+        :return: dictionary with the format returned by
+            :py:meth:`get_user_summary`.
+        '''
+        cur = self.con.cursor()
+        if self.soft_delete:
+            cur.execute(constants.SQL_SELECT_ANY_TOMBSTONE)
+            if cur.fetchone()[0]:
+                return self.get_user_summary(user_id)
+        cur.execute(constants.SQL_SELECT_USER_STATS, (user_id,))
+        return self._create_user_stats_object(cur.fetchone())
+
+    def _select_user(self, user_id, nickname):
+        '''
+        Fetch the row of a user joined with its profile, by nickname if given
+        or else by user_id. A nickname is resolved with a single query, or
+        through the nickname cache when available.
+
+        :return: the row (sqlite3.Row) or None if the user does not exist.
+        '''
+        self.con.row_factory = sqlite3.Row
+        cur = self.con.cursor()
+        cache = self.nickname_cache
+        if nickname is not None:
+            user_id = cache.get(nickname) if cache is not None else None
+            if user_id is None:
+                cur.execute(self._read(
+                    constants.SQL_SELECT_USER_AND_PROFILE_BY_NICKNAME),
+                    (nickname,))
+                row = cur.fetchone()
+                if row is not None and cache is not None:
+                    cache.put(nickname, row['user_id'])
+                return row
+        elif user_id is None:
+            return None
+        cur.execute(self._read(constants.SQL_SELET_USER_AND_PROFILE_BY_ID),
+                    (user_id,))
+        return cur.fetchone()
+
+    @profiled('build')
     def _create_user_object(self, row):
         '''
         It takes a database Row and transform it into a python dictionary.
@@ -396,6 +601,7 @@ class UserRepo(object):
         return user_object
 
     #Helpers for users
+    @profiled('build')
     def _create_user_list_object(self, row):
         '''
         Same as :py:meth:`_create_user_object`. but, the resulting
@@ -420,3 +626,76 @@ class UserRepo(object):
         user_list_object = {'registration_date': row['registration_date'], 'nickname': row['nickname'],
                             'rating': row['rating'], 'website': row['website']}
         return user_list_object
+
+
+    @profiled('build')
+    def _create_user_stats_object(self, row):
+        '''
+        It takes a row of the table user_stats and transform it into a python
+        dictionary.
+
+        :param row: The row obtained from the database, or None.
+        :type row: sqlite3.Row
+        :return: None if row is None, otherwise a dictionary with the format
+            returned by :py:meth:`get_user_summary`.
+
+        '''
+        if row is None:
+            return None
+        not_started = row['goals_not_started']
+        in_progress = row['goals_in_progress']
+        done = row['goals_done']
+        rating_count = row['rating_count']
+        return {'goals': {'total': not_started + in_progress + done,
+                          'not_started': not_started,
+                          'in_progress': in_progress,
+                          'done': done},
+                'resources': row['resources'],
+                'average_rating': row['rating_sum'] / rating_count
+                                  if rating_count else None,
+                'required_time': row['required_time']}
+
+
+@functools.lru_cache(maxsize=2 ** len(constants.USER_PROFILE_COLUMNS))
+def _update_profile_statement(columns):
+    '''
+    :param tuple columns: the modified columns, in the order of
+        :py:data:`constants.USER_PROFILE_COLUMNS`.
+    :return: the statement updating the given columns of a user profile.
+    '''
+    return constants.SQL_UPDATE_USER_PROFILE % ', '.join(
+        '%s = ?' % column for column in columns)
+
+
+def _encode_users_cursor(sort_by, value, user_id):
+    '''
+    :return: the keyset cursor of :py:meth:`UserRepo.get_users` holding the
+        value of the sort key and the user_id of a user (str).
+    '''
+    data = json.dumps([sort_by, value, user_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _decode_users_cursor(sort_by, cursor):
+    '''
+    :return: the value of the sort key and the user_id stored in a keyset
+        cursor created by :py:func:`_encode_users_cursor`.
+    :raises ValueError: if ``cursor`` is not a cursor of ``sort_by``.
+    '''
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        cursor_sort_by, value, user_id = data
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Invalid `after` cursor")
+    if cursor_sort_by != sort_by or not _is_cursor_value(user_id, int) or \
+            not (value is None or _is_cursor_value(value, (str, int, float))):
+        raise ValueError("Invalid `after` cursor")
+    return value, user_id
+
+
+def _is_cursor_value(value, types):
+    '''
+    :return: True if ``value``, decoded from a JSON cursor, is one of the
+        ``types``. JSON booleans are not numbers.
+    '''
+    return isinstance(value, types) and not isinstance(value, bool)
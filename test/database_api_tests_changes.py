@@ -0,0 +1,258 @@
+'''
+Created on 19.10.2026
+Database interface testing for the change data capture methods.
+
+A Change object is a dictionary which contains the following keys:
+      - seq: sequence number of the change (int)
+      - table: 'users', 'goals' or 'resources'
+      - id: id of the row changed (int)
+      - operation: 'insert', 'update', 'delete' or 'truncate'
+      - changed_at: UNIX timestamp of the change (int)
+'''
+
+import os, unittest
+from src.db import engine, constants
+
+#Path to the database file, different from the deployment db
+DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                         constants.DEFAULT_TEST_DB_PATH)
+ENGINE = engine.Engine(DB_PATH)
+
+#Changes recorded while loading goalz_data_dump.sql: 6 users, 9 goals and
+#5 resources inserted
+INITIAL_CHANGES = 20
+
+
+class ChangeDBAPITestCase(unittest.TestCase):
+    '''
+    Test cases for the Changes related methods.
+    '''
+    #INITIATION AND TEARDOWN METHODS
+    @classmethod
+    def setUpClass(cls):
+        ''' Creates the database structure. Removes first any preexisting
+            database file
+        '''
+        print("Testing ", cls.__name__)
+        ENGINE.remove_database()
+        ENGINE.create_template()
+
+    @classmethod
+    def tearDownClass(cls):
+        '''Remove the testing database'''
+        print("Testing ENDED for ", cls.__name__)
+        ENGINE.drop_template()
+        ENGINE.remove_database()
+
+    def setUp(self):
+        '''
+        Populates the database
+        '''
+        try:
+          #The database is removed first, so the sequence numbers of the
+          #changes start at 1 in every test
+          ENGINE.remove_database()
+          #This method restores the initial values from goalz_data_dump.sql
+          ENGINE.reset_database()
+          #Creates a Connection instance to use the API
+          self.connection = ENGINE.connect()
+        except Exception as e:
+        #For instance if there is an error while populating the tables
+          ENGINE.clear()
+
+    def tearDown(self):
+        '''
+        Close underlying connection
+        '''
+        self.connection.close()
+
+    def _operations(self, changes):
+        return [(change['table'], change['id'], change['operation'])
+                for change in changes]
+
+    def test_read_changes(self):
+        '''
+        Test that the writes of the API are read in order after a sequence
+        number, page by page
+        '''
+        print('('+self.test_read_changes.__name__+')', \
+              self.test_read_changes.__doc__)
+        changes = self.connection.read_changes()
+        self.assertEqual(len(changes), INITIAL_CHANGES)
+        self.assertEqual(self._operations(changes[:2]),
+                         [('users', 1, 'insert'), ('users', 2, 'insert')])
+        since_seq = changes[-1]['seq']
+        goal_id = self.connection.create_goal(1, 'Title', 'sports',
+                                              'Description')
+        self.connection.modify_goal(goal_id, status=0.5)
+        self.connection.modify_user(2, {'website': 'https://goalz.org'})
+        self.connection.delete_resource(1)
+        changes = self.connection.read_changes(since_seq)
+        self.assertEqual(self._operations(changes),
+                         [('goals', goal_id, 'insert'),
+                          ('goals', goal_id, 'update'),
+                          ('users', 2, 'update'),
+                          ('resources', 1, 'delete')])
+        self.assertEqual([change['seq'] for change in changes],
+                         list(range(since_seq + 1, since_seq + 5)))
+        self.assertIsInstance(changes[0]['changed_at'], int)
+        #Pages
+        page = self.connection.read_changes(since_seq, limit=3)
+        self.assertEqual(page, changes[:3])
+        self.assertEqual(self.connection.read_changes(page[-1]['seq']),
+                         changes[3:])
+        self.assertEqual(self.connection.read_changes(changes[-1]['seq']), [])
+
+    def test_read_changes_cascade(self):
+        '''
+        Test that the rows modified by the cascades are recorded too
+        '''
+        print('('+self.test_read_changes_cascade.__name__+')', \
+              self.test_read_changes_cascade.__doc__)
+        self.connection.delete_user(4)
+        changes = self.connection.read_changes(INITIAL_CHANGES)
+        #The resources of the user are unlinked, then deleted with its goal
+        self.assertEqual(sorted(self._operations(changes)),
+                         [('goals', 5, 'delete'), ('resources', 4, 'delete'),
+                          ('resources', 4, 'update'),
+                          ('resources', 5, 'delete'),
+                          ('resources', 5, 'update'), ('users', 4, 'delete')])
+
+    def test_read_changes_soft_delete(self):
+        '''
+        Test that in soft delete mode the rows hidden by a tombstone are
+        recorded as deleted once, when it is created
+        '''
+        print('('+self.test_read_changes_soft_delete.__name__+')', \
+              self.test_read_changes_soft_delete.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_goal(2))
+            self.assertFalse(connection.delete_goal(3))
+            self.assertEqual(connection.delete_users([4]), 1)
+            changes = connection.read_changes(INITIAL_CHANGES)
+            #Goal 3 is a sub-goal of goal 2, with resource 1. Goal 5 is the
+            #goal of user 4, with resources 4 and 5
+            self.assertEqual(sorted(self._operations(changes)),
+                             [('goals', 2, 'delete'), ('goals', 3, 'delete'),
+                              ('goals', 5, 'delete'),
+                              ('resources', 1, 'delete'),
+                              ('resources', 4, 'delete'),
+                              ('resources', 5, 'delete'),
+                              ('users', 4, 'delete')])
+            connection.close()
+            soft.purge()
+            connection = soft.connect()
+            self.assertEqual(connection.read_changes(changes[-1]['seq']), [])
+        finally:
+            connection.close()
+            soft.close()
+
+    def test_read_changes_invalid(self):
+        '''
+        Test read_changes and compact_changes with invalid arguments
+        '''
+        print('('+self.test_read_changes_invalid.__name__+')', \
+              self.test_read_changes_invalid.__doc__)
+        with self.assertRaises(ValueError):
+            self.connection.read_changes(-1)
+        with self.assertRaises(ValueError):
+            self.connection.read_changes(0, limit=0)
+        with self.assertRaises(ValueError):
+            self.connection.compact_changes('1')
+
+    def test_read_changes_after_clear(self):
+        '''
+        Test that the sequence numbers are not reused after a clear, and
+        that the tables cleared at once are recorded as truncated
+        '''
+        print('('+self.test_read_changes_after_clear.__name__+')', \
+              self.test_read_changes_after_clear.__doc__)
+        truncations = [(table, 0, 'truncate')
+                       for table in constants.CHANGE_TABLES]
+        for fast in (False, True):
+            since_seq = self.connection.read_changes()[-1]['seq']
+            self.connection.close()
+            ENGINE.clear(fast=fast)
+            ENGINE.populate_tables()
+            self.connection = ENGINE.connect()
+            changes = self.connection.read_changes(since_seq)
+            self.assertEqual(changes[0]['seq'], since_seq + 1)
+            self.assertEqual(self._operations(changes[-INITIAL_CHANGES:][:1]),
+                             [('users', 1, 'insert')])
+            if fast:
+                self.assertEqual(self._operations(changes[:3]), truncations)
+                self.assertEqual(len(changes), 3 + INITIAL_CHANGES)
+                #The previous changes are removed
+                self.assertEqual(self.connection.read_changes()[0]['seq'],
+                                 since_seq + 1)
+            else:
+                #The rows deleted one by one are recorded
+                self.assertEqual(len(changes), 2 * INITIAL_CHANGES)
+
+    def test_read_changes_after_reset(self):
+        '''
+        Test that the sequence numbers continue after the database is
+        recreated or restored
+        '''
+        print('('+self.test_read_changes_after_reset.__name__+')', \
+              self.test_read_changes_after_reset.__doc__)
+        truncations = [(table, 0, 'truncate')
+                       for table in constants.CHANGE_TABLES]
+        self.connection.delete_resource(1)
+        since_seq = self.connection.read_changes()[-1]['seq']
+        self.connection.close()
+        ENGINE.clear(recreate=True)
+        self.connection = ENGINE.connect()
+        changes = self.connection.read_changes()
+        self.assertEqual([change['seq'] for change in changes],
+                         [since_seq + 1, since_seq + 2, since_seq + 3])
+        self.assertEqual(self._operations(changes), truncations)
+        self.connection.close()
+        ENGINE.reset_database()
+        self.connection = ENGINE.connect()
+        changes = self.connection.read_changes(since_seq + 3)
+        self.assertEqual(len(changes), 3 + INITIAL_CHANGES)
+        self.assertEqual([change['seq'] for change in changes],
+                         list(range(since_seq + 4,
+                                    since_seq + 7 + INITIAL_CHANGES)))
+        self.assertEqual(self._operations(changes[:4]),
+                         truncations + [('users', 1, 'insert')])
+        #New changes keep increasing the sequence numbers
+        self.connection.delete_resource(1)
+        self.assertEqual(
+            self._operations(self.connection.read_changes(changes[-1]['seq'])),
+            [('resources', 1, 'delete')])
+        self.assertEqual(self.connection.read_changes()[-1]['seq'],
+                         changes[-1]['seq'] + 1)
+
+    def test_compact_changes(self):
+        '''
+        Test that the compaction keeps the last change of every row only
+        '''
+        print('('+self.test_compact_changes.__name__+')', \
+              self.test_compact_changes.__doc__)
+        for status in (0.2, 0.4, 0.6):
+            self.connection.modify_goal(1, status=status)
+        self.connection.delete_goal(2)
+        last_seq = self.connection.read_changes(INITIAL_CHANGES)[-1]['seq']
+        #Goal 1 inserted and updated three times, goals 2 and 3 inserted and
+        #deleted, resource 1 inserted and deleted
+        self.assertEqual(self.connection.compact_changes(last_seq), 6)
+        changes = self.connection.read_changes()
+        self.assertEqual(len(changes), INITIAL_CHANGES)
+        operations = self._operations(changes)
+        self.assertIn(('goals', 1, 'update'), operations)
+        self.assertNotIn(('goals', 1, 'insert'), operations)
+        self.assertIn(('goals', 3, 'delete'), operations)
+        self.assertEqual(changes[-1]['seq'], last_seq)
+        self.assertEqual(self.connection.compact_changes(last_seq), 0)
+        #New changes keep increasing the sequence numbers
+        self.connection.modify_goal(1, status=0.8)
+        self.assertEqual(self.connection.read_changes(last_seq)[0]['seq'],
+                         last_seq + 1)
+
+if __name__ == '__main__':
+    print('Start running database tests')
+    unittest.main()
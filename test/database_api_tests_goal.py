@@ -19,11 +19,12 @@ A goals' list has the following format:
 Reference: Code adapted and modified from PWP2018 exercise
 '''
 
-import sqlite3, unittest
-from src.db import engine
+import os, sqlite3, unittest
+from src.db import engine, constants
 
 #Path to the database file, different from the deployment db
-DB_PATH = 'db/goalz_test.db'
+DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                         constants.DEFAULT_TEST_DB_PATH)
 ENGINE = engine.Engine(DB_PATH)
 
 
@@ -80,12 +81,13 @@ class GoalDBAPITestCase(unittest.TestCase):
         '''
         print("Testing ", cls.__name__)
         ENGINE.remove_database()
-        ENGINE.create_tables()
+        ENGINE.create_template()
 
     @classmethod
     def tearDownClass(cls):
         '''Remove the testing database'''
         print("Testing ENDED for ", cls.__name__)
+        ENGINE.drop_template()
         ENGINE.remove_database()
 
     def setUp(self):
@@ -93,8 +95,8 @@ class GoalDBAPITestCase(unittest.TestCase):
         Populates the database
         '''
         try:
-          #This method load the initial values from goalz_data_dump.sql
-          ENGINE.populate_tables()
+          #This method restores the initial values from goalz_data_dump.sql
+          ENGINE.reset_database()
           #Creates a Connection instance to use the API
           self.connection = ENGINE.connect()
         except Exception as e:
@@ -103,10 +105,9 @@ class GoalDBAPITestCase(unittest.TestCase):
 
     def tearDown(self):
         '''
-        Close underlying connection and remove all records from database
+        Close underlying connection
         '''
         self.connection.close()
-        ENGINE.clear()
 
     def test_create_goal_object(self):
         '''
@@ -146,6 +147,26 @@ class GoalDBAPITestCase(unittest.TestCase):
         goal = self.connection.get_goal(GOAL2_ID)
         self.assertDictContainsSubset(goal, GOAL2)
 
+    def test_get_goal_if_changed(self):
+        '''
+        Test that get_goal_if_changed returns the goal only when its version
+        is not the known one
+        '''
+        print('('+self.test_get_goal_if_changed.__name__+')', \
+              self.test_get_goal_if_changed.__doc__)
+        version, goal = self.connection.get_goal_if_changed(GOAL1_ID)
+        self.assertEqual(version, 1)
+        self.assertDictContainsSubset(goal, GOAL1)
+        #Not modified
+        self.assertEqual(self.connection.get_goal_if_changed(GOAL1_ID, version),
+                         (version, None))
+        #Every write creates a new version
+        self.connection.modify_goal(GOAL1_ID, status=0.98)
+        version, goal = self.connection.get_goal_if_changed(GOAL1_ID, version)
+        self.assertEqual(version, 2)
+        self.assertDictContainsSubset(goal, GOAL1_STATUS_UPDATED)
+        self.assertIsNone(self.connection.get_goal_if_changed(WRONG_GOAL_ID, 1))
+
 
     def test_get_goal_non_existing_id(self):
         '''
@@ -175,6 +196,38 @@ class GoalDBAPITestCase(unittest.TestCase):
                 self.assertEqual(len(goal), 4)
                 self.assertDictContainsSubset(goal, GOAL2)
 
+    def test_get_due_goals(self):
+        '''
+        Test that get_due_goals streams the goals not done by deadline
+        '''
+        print('('+self.test_get_due_goals.__name__+')',\
+              self.test_get_due_goals.__doc__)
+        #Goals 2 and 5 have the same deadline and are read in two batches
+        goals = self.connection.get_due_goals(batch_size=2)
+        self.assertEqual([goal['goal_id'] for goal in goals],
+                         [1, 9, 8, 3, 7, 2, 5, 6])
+        goals = self.connection.get_due_goals(1530000000, 1616199840)
+        self.assertEqual([goal['goal_id'] for goal in goals], [8, 3, 7])
+        goals = self.connection.get_due_goals(status_in=(1,))
+        self.assertEqual([goal['goal_id'] for goal in goals], [4])
+        with self.assertRaises(ValueError):
+            self.connection.get_due_goals(window_end='tomorrow')
+
+    def test_count_goals(self):
+        '''
+        Test that count_goals counts the goals returned by get_goals
+        '''
+        print('('+self.test_count_goals.__name__+')',\
+              self.test_count_goals.__doc__)
+        self.assertEqual(self.connection.count_goals(), INITIAL_SIZE)
+        for user_id in (1, 2, 5, WRONG_USER_ID):
+            self.assertEqual(self.connection.count_goals(user_id=user_id),
+                             len(self.connection.get_goals(user_id=user_id)))
+        self.assertEqual(self.connection.count_goals(after=1550707200),
+                         len(self.connection.get_goals(after=1550707200)))
+        with self.assertRaises(ValueError):
+            self.connection.count_goals(before=-1)
+
     def test_get_goals_malformed_before(self):
         '''
         Test that providing an invalid `before` argument  raises an error
@@ -236,6 +289,24 @@ class GoalDBAPITestCase(unittest.TestCase):
         self.assertIsNone(resp2)
 
 
+    def test_delete_goal_tree(self):
+        '''
+        Test that delete_goal_tree deletes the goal 6 and its sub-goals 8 and 9
+        '''
+        print('('+self.test_delete_goal_tree.__name__+')', \
+              self.test_delete_goal_tree.__doc__)
+        progress = []
+        self.assertEqual(self.connection.delete_goal_tree(6, progress.append),
+                         3)
+        for goal_id in (6, 8, 9):
+            self.assertIsNone(self.connection.get_goal(goal_id))
+        self.assertEqual(len(self.connection.get_goals()), INITIAL_SIZE - 3)
+        self.assertEqual(progress[-1]['goals'], 3)
+        # The resources of the goals are deleted too
+        self.assertEqual(self.connection.delete_goal_tree(2), 2)
+        self.assertIsNone(self.connection.get_resource(1))
+        self.assertEqual(self.connection.delete_goal_tree(WRONG_GOAL_ID), 0)
+
     def test_delete_goal_non_existing_id(self):
         '''
         Test delete_goal with  300 (no-existing)
@@ -272,6 +343,104 @@ class GoalDBAPITestCase(unittest.TestCase):
         resp2 = self.connection.get_goal(GOAL1_ID)
         self.assertDictContainsSubset(resp2, GOAL1_STATUS_UPDATED)
 
+    def test_modify_goal_quoted_values(self):
+        '''
+        Test that the values of modify_goal are bound as parameters, not
+        interpreted as SQL
+        '''
+        print('('+self.test_modify_goal_quoted_values.__name__+')', \
+              self.test_modify_goal_quoted_values.__doc__)
+        title = "it's done', status = 0 --"
+        resp = self.connection.modify_goal(GOAL1_ID, title=title,
+                                           description='"quoted"')
+        self.assertEqual(resp, GOAL1_ID)
+        goal = self.connection.get_goal(GOAL1_ID)
+        self.assertEqual(goal['title'], title)
+        self.assertEqual(goal['description'], '"quoted"')
+        self.assertEqual(goal['status'], GOAL1['status'])
+        self.assertIsNone(self.connection.modify_goal('1 OR 1 = 1',
+                                                      status=0.5))
+        self.assertEqual(self.connection.get_goal(GOAL2_ID)['status'],
+                         GOAL2['status'])
+
+    def test_modify_goal_expected_version(self):
+        '''
+        Test that a goal modified by another connection since it was read is
+        not overwritten
+        '''
+        print('('+self.test_modify_goal_expected_version.__name__+')', \
+              self.test_modify_goal_expected_version.__doc__)
+        other = ENGINE.connect()
+        try:
+            version = self.connection.get_goal_if_changed(GOAL1_ID)[0]
+            self.assertEqual(other.get_goal_if_changed(GOAL1_ID)[0], version)
+            #Both connections modify the version they read
+            resp = other.modify_goal(GOAL1_ID, status=0.98,
+                                     expected_version=version)
+            self.assertEqual(resp, GOAL1_ID)
+            resp = self.connection.modify_goal(GOAL1_ID, status=0.5,
+                                               expected_version=version)
+            self.assertEqual(resp, constants.CONFLICT)
+        finally:
+            other.close()
+        goal = self.connection.get_goal(GOAL1_ID)
+        self.assertDictContainsSubset(goal, GOAL1_STATUS_UPDATED)
+        #Retry with the new version
+        resp = self.connection.modify_goal(GOAL1_ID, status=0.98,
+                                           expected_version=version + 1)
+        self.assertEqual(resp, GOAL1_ID)
+        self.assertIsNone(self.connection.modify_goal(WRONG_GOAL_ID,
+                                                      status=0.5,
+                                                      expected_version=1))
+
+    def test_modify_goal_soft_deleted(self):
+        '''
+        Test that in soft delete mode the deleted goals and their sub-goals
+        are not modified
+        '''
+        print('('+self.test_modify_goal_soft_deleted.__name__+')', \
+              self.test_modify_goal_soft_deleted.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_goal(GOAL2_ID))
+            #Goal 3 is a sub-goal of goal 2
+            for goal_id in (GOAL2_ID, 3):
+                self.assertIsNone(connection.modify_goal(goal_id, 'Done'))
+                self.assertIsNone(connection.modify_goal(
+                    goal_id, status=1.0, expected_version=2))
+            self.assertEqual(connection.modify_goal(GOAL1_ID, status=0.98),
+                             GOAL1_ID)
+        finally:
+            connection.close()
+            soft.close()
+        cur = self.connection.con.cursor()
+        cur.execute('SELECT title FROM goals WHERE goal_id IN (2, 3)')
+        self.assertEqual(cur.fetchall(), [('Cross country ski',),
+                                          ('Learn Skating',)])
+
+    def test_delete_goal_soft_deleted(self):
+        '''
+        Test that in soft delete mode the sub-goals of a deleted goal are
+        not deleted again
+        '''
+        print('('+self.test_delete_goal_soft_deleted.__name__+')', \
+              self.test_delete_goal_soft_deleted.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_goal(GOAL2_ID))
+            self.assertFalse(connection.delete_goal(GOAL2_ID))
+            #Goal 3 is a sub-goal of goal 2
+            self.assertIsNone(connection.get_goal(3))
+            self.assertFalse(connection.delete_goal(3))
+        finally:
+            connection.close()
+            soft.close()
+        cur = self.connection.con.cursor()
+        cur.execute('SELECT deleted_at FROM goals WHERE goal_id = 3')
+        self.assertEqual(cur.fetchone(), (None,))
+
     def test_modify_goal_non_existing_id(self):
         '''
         Test modify_goal with  300 (no-existing)
@@ -330,6 +499,7 @@ class GoalDBAPITestCase(unittest.TestCase):
                 "new topic", "This is described as a new goal", WRONG_GOAL_ID)
         #Check that the goal has not been created
         self.assertIsNone(goal_id)
+        self.assertEqual(len(self.connection.get_goals()), INITIAL_SIZE)
 
     def test_create_goal_non_existing_user_id(self):
         '''
@@ -0,0 +1,196 @@
+'''
+Created on 19.10.2026
+Database interface tests for the versioned schema migrations.
+'''
+
+import os, sqlite3, unittest
+
+from src.db import engine, constants
+from src.db.loader import DumpLoader
+from src.db.migrations import Migrator, Migration, BackfillMigration, MIGRATIONS
+
+#Path to the database file, different from the deployment db
+DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                         constants.DEFAULT_TEST_DB_PATH)
+ENGINE = engine.Engine(DB_PATH)
+
+INITIAL_GOALS_SIZE = 9
+
+#Migrations used to test backfills: a new column filled in batches of 2 goals
+TITLE_LENGTH_MIGRATIONS = [
+    Migration(1, 'Empty migration'),
+    BackfillMigration(2, 'Title length of the goals',
+        ['ALTER TABLE goals ADD COLUMN title_length INTEGER'], 'goals',
+        'UPDATE goals SET title_length = LENGTH(title) \
+         WHERE rowid > :start AND rowid <= :end',
+        ['CREATE INDEX goals_title_length ON goals(title_length)'],
+        batch_size=2),
+]
+
+class MigrationsTestCase(unittest.TestCase):
+    '''
+    Test cases for the schema migrations.
+    '''
+    #INITIATION AND TEARDOWN METHODS
+    @classmethod
+    def setUpClass(cls):
+        '''
+        Removes first any preexisting database file.
+        '''
+        print("Testing ", cls.__name__)
+        ENGINE.remove_database()
+
+    def setUp(self):
+        '''
+        Creates a database with the schema version 0 and the default data
+        '''
+        self.con = sqlite3.connect(DB_PATH)
+        DumpLoader(self.con).load(constants.DEFAULT_SCHEMA)
+        DumpLoader(self.con).load(constants.DEFAULT_DATA_DUMP)
+
+    def tearDown(self):
+        '''
+        Close the connection and remove the database
+        '''
+        self.con.close()
+        ENGINE.remove_database()
+
+    def test_create_tables_latest_version(self):
+        '''
+        Checks that create_tables creates a database with the latest version.
+        '''
+        print('(' + self.test_create_tables_latest_version.__name__ + ')', \
+              self.test_create_tables_latest_version.__doc__)
+        self.con.close()
+        ENGINE.remove_database()
+        ENGINE.create_tables()
+        self.con = sqlite3.connect(DB_PATH)
+        self.assertEqual(ENGINE.schema_version(), MIGRATIONS[-1].version)
+        self.assertEqual(Migrator(self.con).pending(), [])
+
+    def test_migrate(self):
+        '''
+        Checks that Engine.migrate upgrades an existing database keeping its data.
+        '''
+        print('(' + self.test_migrate.__name__ + ')', \
+              self.test_migrate.__doc__)
+        self.assertEqual(ENGINE.schema_version(), 0)
+        applied = ENGINE.migrate()
+        self.assertEqual(applied, [m.version for m in MIGRATIONS])
+        self.assertEqual(ENGINE.schema_version(), MIGRATIONS[-1].version)
+        self.assertEqual(ENGINE.migrate(), [])
+        cur = self.con.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        indexes = [row[0] for row in cur.fetchall()]
+        self.assertIn('goals_parent_id', indexes)
+        cur.execute('SELECT COUNT(*) FROM goals')
+        self.assertEqual(cur.fetchone()[0], INITIAL_GOALS_SIZE)
+
+    def test_migrate_on_creation(self):
+        '''
+        Checks that an Engine upgrades an existing database when it is created.
+        '''
+        print('(' + self.test_migrate_on_creation.__name__ + ')', \
+              self.test_migrate_on_creation.__doc__)
+        engine.Engine(DB_PATH, migrate=False).close()
+        self.assertEqual(ENGINE.schema_version(), 0)
+        engine.Engine(DB_PATH).close()
+        self.assertEqual(ENGINE.schema_version(), MIGRATIONS[-1].version)
+        #Database files without tables are not migrated
+        self.con.close()
+        ENGINE.remove_database()
+        self.con = sqlite3.connect(DB_PATH)
+        engine.Engine(DB_PATH).close()
+        self.assertEqual(ENGINE.schema_version(), 0)
+
+    def test_backfill_migration(self):
+        '''
+        Checks that a backfill migration runs in batches and fills every row.
+        '''
+        print('(' + self.test_backfill_migration.__name__ + ')', \
+              self.test_backfill_migration.__doc__)
+        batches = []
+        migrator = Migrator(self.con, TITLE_LENGTH_MIGRATIONS,
+                            progress=lambda m, last, end: batches.append(last))
+        self.assertEqual(migrator.migrate(), [1, 2])
+        self.assertEqual(batches, [2, 4, 6, 8, 9])
+        self.assertEqual(migrator.current_version(), 2)
+        cur = self.con.cursor()
+        cur.execute('SELECT COUNT(*) FROM goals \
+                     WHERE title_length IS NULL OR title_length != LENGTH(title)')
+        self.assertEqual(cur.fetchone()[0], 0)
+        cur.execute('SELECT COUNT(*) FROM migration_progress')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+    def test_backfill_migration_resume(self):
+        '''
+        Checks that an interrupted backfill is resumed where it stopped.
+        '''
+        print('(' + self.test_backfill_migration_resume.__name__ + ')', \
+              self.test_backfill_migration_resume.__doc__)
+        def interrupt(migration, last_key, max_key):
+            if last_key == 4:
+                raise KeyboardInterrupt()
+        migrator = Migrator(self.con, TITLE_LENGTH_MIGRATIONS, progress=interrupt)
+        with self.assertRaises(KeyboardInterrupt):
+            migrator.migrate()
+        self.assertEqual(migrator.current_version(), 1)
+        cur = self.con.cursor()
+        cur.execute('SELECT COUNT(*) FROM goals WHERE title_length IS NOT NULL')
+        self.assertEqual(cur.fetchone()[0], 4)
+        #Resume the migration
+        batches = []
+        migrator = Migrator(self.con, TITLE_LENGTH_MIGRATIONS,
+                            progress=lambda m, last, end: batches.append(last))
+        self.assertEqual(migrator.migrate(), [2])
+        self.assertEqual(batches, [6, 8, 9])
+        cur.execute('SELECT COUNT(*) FROM goals WHERE title_length IS NULL')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+    def test_migrate_concurrently(self):
+        '''
+        Checks that the migrations applied by another connection meanwhile
+        are skipped, and that a backfill is shared between connections.
+        '''
+        print('(' + self.test_migrate_concurrently.__name__ + ')', \
+              self.test_migrate_concurrently.__doc__)
+        other = sqlite3.connect(DB_PATH)
+        try:
+            #The pending migrations are read before the other connection
+            #applies them
+            migrator = Migrator(self.con)
+            pending = migrator.pending()
+            self.assertEqual(Migrator(other).migrate(),
+                             [m.version for m in MIGRATIONS])
+            migrator.pending = lambda: pending
+            self.assertEqual(migrator.migrate(), [])
+            #The other connection completes the backfill started here
+            self.con.close()
+            ENGINE.remove_database()
+            self.con = sqlite3.connect(DB_PATH)
+            DumpLoader(self.con).load(constants.DEFAULT_SCHEMA)
+            DumpLoader(self.con).load(constants.DEFAULT_DATA_DUMP)
+            other.close()
+            other = sqlite3.connect(DB_PATH)
+            batches, other_batches = [], []
+            def interrupt(migration, last_key, max_key):
+                batches.append(last_key)
+                if last_key == 4:
+                    Migrator(other, TITLE_LENGTH_MIGRATIONS,
+                             progress=lambda m, last, end:
+                             other_batches.append(last)).migrate()
+            migrator = Migrator(self.con, TITLE_LENGTH_MIGRATIONS,
+                                progress=interrupt)
+            self.assertEqual(migrator.migrate(), [1])
+            self.assertEqual(batches, [2, 4])
+            self.assertEqual(other_batches, [6, 8, 9])
+            self.assertEqual(migrator.current_version(), 2)
+        finally:
+            other.close()
+        cur = self.con.cursor()
+        cur.execute('SELECT COUNT(*) FROM goals WHERE title_length IS NULL')
+        self.assertEqual(cur.fetchone()[0], 0)
+
+if __name__ == '__main__':
+    print('Start running migrations tests')
+    unittest.main()
@@ -20,11 +20,14 @@ A resources' list has the following format:
 Reference: Code taken and modified from PWP2018 exercise
 '''
 
+import os
 import sqlite3
 import unittest
 
 from src.db.engine import Engine
 from src.db.connection import Connection
+from src.db import constants
+from src.db.instrumentation import statement_shape
 
 # CONSTANTS DEFINING DIFFERENT RESOURCES AND RESOURCES' PROPERTIES
 RESOURCE1 = {'resource_id': 1, 'goal_id': 2,
@@ -87,7 +90,8 @@ VALID_RESOURCES_FOR_TEST_MAX_TIME = (RESOURCE2, RESOURCE3)
 NUM_FIELDS_IN_LIST_ITEM = 3
 
 # Path to the database file, different from the deployment db
-TEST_DB_PATH = 'db/goalz_test.db'
+TEST_DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                              constants.DEFAULT_TEST_DB_PATH)
 ENGINE = Engine(TEST_DB_PATH)
 
 
@@ -102,29 +106,29 @@ class ResourceDBAPITestCase(unittest.TestCase):
 
         print("Testing ", cls.__name__)
         ENGINE.remove_database()
-        ENGINE.create_tables()
+        ENGINE.create_template()
 
     @classmethod
     def tearDownClass(cls):
         '''Remove the testing database'''
 
         print("Testing ENDED for ", cls.__name__)
+        ENGINE.drop_template()
         ENGINE.remove_database()
 
     def setUp(self):
         '''Populates the database'''
 
         try:
-            ENGINE.populate_tables()
+            ENGINE.reset_database()
             self.connection = ENGINE.connect()
         except Exception as e:
             ENGINE.clear()
 
     def tearDown(self):
-        '''Close underlying connection and remove all records from database'''
+        '''Close underlying connection'''
 
         self.connection.close()
-        ENGINE.clear()
 
     def test_get_resource(self):
         '''
@@ -139,6 +143,35 @@ class ResourceDBAPITestCase(unittest.TestCase):
         resource = self.connection.get_resource(VALID_RESOURCE_IDS[3])
         self.assertDictContainsSubset(resource, VALID_RESOURCES[3])
 
+    def test_get_resource_if_changed(self):
+        '''
+        Test that get_resource_if_changed returns the resource only when its
+        version is not the known one
+        '''
+
+        print('(' + self.test_get_resource_if_changed.__name__ + ')',
+              self.test_get_resource_if_changed.__doc__)
+
+        version, resource = self.connection.get_resource_if_changed(
+            RESOURCE1['resource_id'])
+        self.assertEqual(version, 1)
+        self.assertDictContainsSubset(resource, RESOURCE1)
+        self.assertEqual(self.connection.get_resource_if_changed(
+            RESOURCE1['resource_id'], version), (version, None))
+        self.connection.modify_resource(RESOURCE1['resource_id'], 0.5)
+        version, resource = self.connection.get_resource_if_changed(
+            RESOURCE1['resource_id'], version)
+        self.assertEqual(version, 2)
+        self.assertEqual(resource['rating'], 0.5)
+        # Unlinked by the deletion of its user, through ON DELETE SET NULL
+        self.connection.delete_user(RESOURCE1['user_id'])
+        version, resource = self.connection.get_resource_if_changed(
+            RESOURCE1['resource_id'], version)
+        self.assertEqual(version, 3)
+        self.assertIsNone(resource['user_id'])
+        self.assertIsNone(self.connection.get_resource_if_changed(
+            NON_EXISTING_ID, 1))
+
     def test_get_resource_malformed_id(self):
         '''
         Test get_resource with id 'one' (malformed)
@@ -396,6 +429,21 @@ class ResourceDBAPITestCase(unittest.TestCase):
         response = self.connection.delete_resource(NON_EXISTING_ID)
         self.assertFalse(response)
 
+    def test_count_resources(self):
+        '''
+        Test that count_resources counts the resources returned by
+        get_resources
+        '''
+
+        print('(' + self.test_count_resources.__name__ + ')',
+              self.test_count_resources.__doc__)
+
+        for filters in ({}, {'goal_id': 1}, {'user_id': 4},
+                        {'max_length': 50}, {'user_id': 4, 'max_length': 50}):
+            self.assertEqual(self.connection.count_resources(**filters),
+                             len(self.connection.get_resources(**filters)))
+        self.assertIsNone(self.connection.count_resources(goal_id=MALFORMED_ID))
+
     def test_modify_resource(self):
         '''
         Test that the resource is modified
@@ -404,8 +452,19 @@ class ResourceDBAPITestCase(unittest.TestCase):
         print('(' + self.test_modify_resource.__name__ + ')',
               self.test_modify_resource.__doc__)
 
-        response = self.connection.modify_resource(RESOURCE1['resource_id'], 0.5)
+        ENGINE.set_instrumentation(True)
+        try:
+            response = self.connection.modify_resource(RESOURCE1['resource_id'],
+                                                       0.5)
+            stats = ENGINE.stats()
+        finally:
+            ENGINE.set_instrumentation(False)
+            ENGINE.reset_stats()
         self.assertEqual(response, RESOURCE1['resource_id'])
+        # A single statement besides the foreign keys pragmas
+        self.assertEqual([statement for statement in stats
+                          if not statement.startswith('PRAGMA')],
+                         [statement_shape(constants.SQL_UPDATE_RESOURCE)])
 
         response = self.connection.get_resource(RESOURCE1['resource_id'])
         self.assertEqual(response, RESOURCE1_MODIFIED)
@@ -432,6 +491,83 @@ class ResourceDBAPITestCase(unittest.TestCase):
         response = self.connection.modify_resource(NON_EXISTING_ID, 0.5)
         self.assertIsNone(response)
 
+    def test_modify_resource_expected_version(self):
+        '''
+        Test that the resource is only modified at the expected version
+        '''
+
+        print('(' + self.test_modify_resource_expected_version.__name__ + ')',
+              self.test_modify_resource_expected_version.__doc__)
+
+        resource_id = RESOURCE1['resource_id']
+        version = self.connection.get_resource_if_changed(resource_id)[0]
+        response = self.connection.modify_resource(resource_id, 0.5,
+                                                   expected_version=version)
+        self.assertEqual(response, resource_id)
+        # The version read before the modification is outdated
+        response = self.connection.modify_resource(resource_id, 0.8,
+                                                   expected_version=version)
+        self.assertEqual(response, constants.CONFLICT)
+        response = self.connection.get_resource(resource_id)
+        self.assertEqual(response['rating'], 0.5)
+        response = self.connection.modify_resource(NON_EXISTING_ID, 0.8,
+                                                   expected_version=version)
+        self.assertIsNone(response)
+
+    def test_modify_resource_soft_deleted(self):
+        '''
+        Test that in soft delete mode the deleted resources and the resources
+        of the deleted goals are not modified
+        '''
+
+        print('(' + self.test_modify_resource_soft_deleted.__name__ + ')',
+              self.test_modify_resource_soft_deleted.__doc__)
+
+        soft = Engine(TEST_DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_resource(RESOURCE1['resource_id']))
+            self.assertTrue(connection.delete_goal(TEST_GOAL_ID))
+            for resource_id in (RESOURCE1['resource_id'],) + \
+                    VALID_RESOURCE_IDS_FOR_TEST_GOAL:
+                self.assertIsNone(connection.modify_resource(resource_id, 0.1))
+            self.assertEqual(connection.modify_resource(
+                RESOURCE2['resource_id'], 0.1), RESOURCE2['resource_id'])
+        finally:
+            connection.close()
+            soft.close()
+        cur = self.connection.con.cursor()
+        cur.execute('SELECT COUNT(*) FROM resources WHERE rating = 0.1')
+        self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_delete_resource_soft_deleted(self):
+        '''
+        Test that in soft delete mode the resources of the deleted goals are
+        not deleted again
+        '''
+
+        print('(' + self.test_delete_resource_soft_deleted.__name__ + ')',
+              self.test_delete_resource_soft_deleted.__doc__)
+
+        soft = Engine(TEST_DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_goal(TEST_GOAL_ID))
+            for resource_id in VALID_RESOURCE_IDS_FOR_TEST_GOAL:
+                self.assertIsNone(connection.get_resource(resource_id))
+                self.assertFalse(connection.delete_resource(resource_id))
+            self.assertTrue(connection.delete_resource(
+                RESOURCE2['resource_id']))
+            self.assertFalse(connection.delete_resource(
+                RESOURCE2['resource_id']))
+        finally:
+            connection.close()
+            soft.close()
+        cur = self.connection.con.cursor()
+        cur.execute('SELECT COUNT(*) FROM resources \
+            WHERE deleted_at IS NOT NULL')
+        self.assertEqual(cur.fetchone()[0], 1)
+
     def test_modify_resource_malformed_rating(self):
         '''
         Test that trying to modify resource with rating ='ten' (bad type) fails
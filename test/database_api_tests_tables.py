@@ -6,12 +6,15 @@ correctness of the tables' schemas and correctness of tables' creation
 Reference: Code taken and modified from PWP2018 exercise
 '''
 
-import sqlite3, unittest
+import io, json, os, shutil, sqlite3, tempfile, unittest
 
 from src.db import engine, connection, constants
+from src.db.loader import DumpLoader
+from src.db.profiling import PHASES
 
 #Path to the database file, different from the deployment db
-DB_PATH = 'db/goalz_test.db'
+DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                         constants.DEFAULT_TEST_DB_PATH)
 ENGINE = engine.Engine(DB_PATH)
 
 INITIAL_USERS_SIZE = 6
@@ -30,12 +33,13 @@ class CreatedTablesTestCase(unittest.TestCase):
         '''
         print("Testing ", cls.__name__)
         ENGINE.remove_database()
-        ENGINE.create_tables()
+        ENGINE.create_template()
 
     @classmethod
     def tearDownClass(cls):
         '''Remove the testing database'''
         print("Testing ENDED for ", cls.__name__)
+        ENGINE.drop_template()
         ENGINE.remove_database()
 
     def setUp(self):
@@ -43,8 +47,8 @@ class CreatedTablesTestCase(unittest.TestCase):
         Populates the database
         '''
         try:
-          #This method loads the initial values from goalz_data_dump.sql
-          ENGINE.populate_tables()
+          #This method restores the initial values from goalz_data_dump.sql
+          ENGINE.reset_database()
           #Creates a Connection instance to use the API
           self.connection = ENGINE.connect()
         except Exception as e: 
@@ -53,10 +57,9 @@ class CreatedTablesTestCase(unittest.TestCase):
 
     def tearDown(self):
         '''
-        Close underlying connection and remove all records from database
+        Close underlying connection
         '''
         self.connection.close()
-        ENGINE.clear()
 
     def test_users_table_schema(self):
         '''
@@ -78,8 +81,8 @@ class CreatedTablesTestCase(unittest.TestCase):
             result = c.fetchall()
             names = [tup[1] for tup in result]
             types = [tup[2] for tup in result]
-            real_names=['user_id','nickname','registration_date','password']
-            real_types=['INTEGER','TEXT','INTEGER','TEXT']
+            real_names=['user_id','nickname','registration_date','password','deleted_at','version']
+            real_types=['INTEGER','TEXT','INTEGER','TEXT','INTEGER','INTEGER']
             # Check that names and types are correct
             self.assertEqual(names, real_names)    
             self.assertEqual(types, real_types)
@@ -184,8 +187,8 @@ class CreatedTablesTestCase(unittest.TestCase):
             result = c.fetchall()
             names = [tup[1] for tup in result]
             types = [tup[2] for tup in result]
-            real_names = ['goal_id', 'parent_id', 'user_id', 'title', 'topic', 'description', 'deadline', 'status']
-            real_types = ['INTEGER', 'INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'TEXT', 'INTEGER', 'INTEGER']
+            real_names = ['goal_id', 'parent_id', 'user_id', 'title', 'topic', 'description', 'deadline', 'status', 'deleted_at', 'version']
+            real_types = ['INTEGER', 'INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'TEXT', 'INTEGER', 'INTEGER', 'INTEGER', 'INTEGER']
             # Check that names and types are correct
             self.assertEqual(names, real_names)
             self.assertEqual(types, real_types)
@@ -242,8 +245,8 @@ class CreatedTablesTestCase(unittest.TestCase):
             result = c.fetchall()
             names = [tup[1] for tup in result]
             types = [tup[2] for tup in result]
-            real_names = ['resource_id', 'goal_id', 'user_id', 'title', 'link', 'topic', 'description', 'required_time', 'rating']
-            real_types = ['INTEGER', 'INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'TEXT', 'TEXT', 'INTEGER', 'REAL']
+            real_names = ['resource_id', 'goal_id', 'user_id', 'title', 'link', 'topic', 'description', 'required_time', 'rating', 'deleted_at', 'version']
+            real_types = ['INTEGER', 'INTEGER', 'INTEGER', 'TEXT', 'TEXT', 'TEXT', 'TEXT', 'INTEGER', 'REAL', 'INTEGER', 'INTEGER']
             # Check that names and types are correct
             self.assertEqual(names, real_names)
             self.assertEqual(types, real_types)
@@ -298,6 +301,507 @@ class CreatedTablesTestCase(unittest.TestCase):
             fk_status = self.connection.check_foreign_keys_status()
             self.assertFalse(fk_status)
 
+    def test_reset_database(self):
+        '''
+        Checks that reset_database restores the initial content of the database.
+        '''
+        print('(' + self.test_reset_database.__name__ + ')', \
+              self.test_reset_database.__doc__)
+        # Remove some rows and close the connection before resetting
+        self.connection.delete_user(1)
+        self.connection.close()
+        ENGINE.reset_database()
+        self.connection = ENGINE.connect()
+        con = self.connection.con
+        with con:
+            cur = con.cursor()
+            cur.execute('SELECT COUNT(*) FROM users')
+            self.assertEqual(cur.fetchone()[0], INITIAL_USERS_SIZE)
+            cur.execute('SELECT COUNT(*) FROM goals')
+            self.assertEqual(cur.fetchone()[0], INITIAL_GOALS_SIZE)
+            cur.execute('SELECT COUNT(*) FROM resources')
+            self.assertEqual(cur.fetchone()[0], INITIAL_RESOURCES_SIZE)
+
+    def test_create_and_populate_tables(self):
+        '''
+        Checks that create_tables and populate_tables build the same database
+        as the template used by reset_database.
+        '''
+        print('(' + self.test_create_and_populate_tables.__name__ + ')', \
+              self.test_create_and_populate_tables.__doc__)
+        other = engine.Engine(DB_PATH + '.populated')
+        other.remove_database()
+        try:
+            other.create_tables()
+            other.populate_tables()
+            con = sqlite3.connect(other.db_path)
+            try:
+                cur = con.cursor()
+                cur.execute('SELECT COUNT(*) FROM users')
+                self.assertEqual(cur.fetchone()[0], INITIAL_USERS_SIZE)
+                cur.execute('SELECT COUNT(*) FROM goals')
+                self.assertEqual(cur.fetchone()[0], INITIAL_GOALS_SIZE)
+                cur.execute('SELECT COUNT(*) FROM resources')
+                self.assertEqual(cur.fetchone()[0], INITIAL_RESOURCES_SIZE)
+            finally:
+                con.close()
+        finally:
+            other.remove_database()
+
+    def test_dump_loader_statements(self):
+        '''
+        Checks that the dump loader splits statements correctly when they contain
+        quoted semicolons, comments and trigger bodies.
+        '''
+        print('(' + self.test_dump_loader_statements.__name__ + ')', \
+              self.test_dump_loader_statements.__doc__)
+        dump = io.StringIO(
+            "/* header; comment */\n"
+            "INSERT INTO t VALUES('a;b', \"c;d\"); -- trailing; comment\n"
+            "INSERT INTO t\n VALUES('it''s;');\n"
+            "CREATE TRIGGER tr AFTER INSERT ON t BEGIN\n"
+            "  DELETE FROM t WHERE x = ';';\n"
+            "END;\n"
+            "SELECT 1")
+        loader = DumpLoader(self.connection.con)
+        statements = list(loader.statements(dump))
+        self.assertEqual(len(statements), 4)
+        self.assertTrue(statements[0].endswith("VALUES('a;b', \"c;d\");"))
+        self.assertTrue(statements[1].endswith("INSERT INTO t\n VALUES('it''s;');"))
+        self.assertTrue(statements[2].startswith('CREATE TRIGGER'))
+        self.assertTrue(statements[2].endswith('END;'))
+        self.assertEqual(statements[3], 'SELECT 1')
+
+    def test_populate_tables_statistics(self):
+        '''
+        Checks that populate_tables reports loading statistics in small batches.
+        '''
+        print('(' + self.test_populate_tables_statistics.__name__ + ')', \
+              self.test_populate_tables_statistics.__doc__)
+        self.connection.close()
+        ENGINE.clear()
+        reports = []
+        con = sqlite3.connect(DB_PATH)
+        try:
+            stats = DumpLoader(con, batch_size=5, progress=reports.append).load(
+                constants.DEFAULT_DATA_DUMP)
+        finally:
+            con.close()
+        self.connection = ENGINE.connect()
+        total = INITIAL_USERS_SIZE * 2 + INITIAL_GOALS_SIZE + \
+            INITIAL_RESOURCES_SIZE
+        self.assertEqual(stats['rows'], total)
+        self.assertEqual(stats['bytes'], stats['total_bytes'])
+        self.assertGreater(len(reports), 1)
+        self.assertEqual(reports[-1]['rows'], total)
+
+    def test_dump_loader_bytes(self):
+        '''
+        Checks that the loader counts the bytes read from a non-ASCII dump.
+        '''
+        print('(' + self.test_dump_loader_bytes.__name__ + ')', \
+              self.test_dump_loader_bytes.__doc__)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'dump.sql')
+        try:
+            with open(path, 'wb') as file:
+                file.write("CREATE TABLE t(x TEXT);\r\n"
+                           "INSERT INTO t VALUES('Jyväskylä');\r\n"
+                           "INSERT INTO t VALUES('目標');\r\n".encode('utf-8'))
+            con = sqlite3.connect(':memory:')
+            try:
+                stats = DumpLoader(con).load(path)
+            finally:
+                con.close()
+            size = os.path.getsize(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(stats['rows'], 2)
+        self.assertEqual(stats['total_bytes'], size)
+        self.assertEqual(stats['bytes'], size)
+
+    def test_export_import_tables(self):
+        '''
+        Checks that all the tables can be exported and imported back as CSV files.
+        '''
+        print('(' + self.test_export_import_tables.__name__ + ')', \
+              self.test_export_import_tables.__doc__)
+        directory = tempfile.mkdtemp()
+        try:
+            counts = ENGINE.export_tables(directory)
+            self.assertEqual(counts, {'users': INITIAL_USERS_SIZE,
+                                      'user_profile': INITIAL_USERS_SIZE,
+                                      'goals': INITIAL_GOALS_SIZE,
+                                      'resources': INITIAL_RESOURCES_SIZE})
+            self.connection.close()
+            ENGINE.clear()
+            self.assertEqual(ENGINE.import_tables(directory), counts)
+            self.connection = ENGINE.connect()
+            self.assertEqual(len(self.connection.get_goals()), INITIAL_GOALS_SIZE)
+            goal = self.connection.get_goal(9)
+            self.assertEqual(goal['parent_id'], 8)
+            self.assertIsNone(self.connection.get_goal(1)['parent_id'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_export_import_jsonl_compressed(self):
+        '''
+        Checks that a table exported as compressed JSON lines keeps its values.
+        '''
+        print('(' + self.test_export_import_jsonl_compressed.__name__ + ')', \
+              self.test_export_import_jsonl_compressed.__doc__)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'resources.jsonl.gz')
+            resource = self.connection.get_resource(1)
+            count = ENGINE.export('resources', path, format='jsonl')
+            self.assertEqual(count, INITIAL_RESOURCES_SIZE)
+            self.connection.delete_resource(1)
+            with self.assertRaises(sqlite3.IntegrityError):
+                ENGINE.import_('resources', path, format='jsonl')
+            self.assertIsNone(self.connection.get_resource(1))
+            self.connection.con.execute('DELETE FROM resources')
+            self.connection.con.commit()
+            ENGINE.import_('resources', path, format='jsonl')
+            self.assertEqual(self.connection.get_resource(1), resource)
+            with self.assertRaises(ValueError):
+                ENGINE.export('sqlite_master', path)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_import_jsonl_keys(self):
+        '''
+        Checks that the import of JSON lines uses the keys of every line.
+        '''
+        print('(' + self.test_import_jsonl_keys.__name__ + ')', \
+              self.test_import_jsonl_keys.__doc__)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'resources.jsonl')
+            resource = self.connection.get_resource(2)
+            ENGINE.export('resources', path, format='jsonl')
+            with open(path) as file:
+                items = [json.loads(line) for line in file]
+            # Only the lines after the first one have a rating
+            del items[0]['rating']
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(item) + '\n' for item in items)
+            self.connection.con.execute('DELETE FROM resources')
+            self.connection.con.commit()
+            count = ENGINE.import_('resources', path, format='jsonl')
+            self.assertEqual(count, INITIAL_RESOURCES_SIZE)
+            self.assertIsNone(self.connection.get_resource(1)['rating'])
+            self.assertEqual(self.connection.get_resource(2), resource)
+            self.connection.con.execute('DELETE FROM resources')
+            self.connection.con.commit()
+            items[-1]['score'] = 5
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(item) + '\n' for item in items)
+            with self.assertRaises(ValueError):
+                ENGINE.import_('resources', path, format='jsonl')
+            self.assertIsNone(self.connection.get_resource(2))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_clear_fast(self):
+        '''
+        Checks that the fast mode of clear removes all the records.
+        '''
+        print('(' + self.test_clear_fast.__name__ + ')', \
+              self.test_clear_fast.__doc__)
+        self.connection.close()
+        ENGINE.clear(fast=True, vacuum=True)
+        self.connection = ENGINE.connect()
+        con = self.connection.con
+        cur = con.cursor()
+        for table in constants.TABLES:
+            cur.execute('SELECT COUNT(*) FROM %s' % table)
+            self.assertEqual(cur.fetchone()[0], 0)
+        # The tables can be populated again
+        self.connection.close()
+        ENGINE.populate_tables()
+        self.connection = ENGINE.connect()
+        self.assertEqual(len(self.connection.get_users()), INITIAL_USERS_SIZE)
+
+    def test_query_stats(self):
+        '''
+        Checks that the instrumentation records the statements only when enabled.
+        '''
+        print('(' + self.test_query_stats.__name__ + ')', \
+              self.test_query_stats.__doc__)
+        ENGINE.reset_stats()
+        self.connection.get_goal(1)
+        self.assertEqual(ENGINE.stats(), {})
+        ENGINE.set_instrumentation(True)
+        try:
+            self.connection.get_goal(1)
+            self.connection.get_goal(2)
+            self.connection.get_goals(user_id=2)
+            stats = ENGINE.stats()
+        finally:
+            ENGINE.set_instrumentation(False)
+            ENGINE.reset_stats()
+        goal = stats[constants.SQL_SELECT_GOAL_BY_ID]
+        self.assertEqual(goal['count'], 2)
+        self.assertEqual(goal['rows'], 2)
+        self.assertGreaterEqual(goal['max'], goal['mean'])
+        # Literal values are replaced in the statement shape
+        goals = stats['SELECT * FROM goals WHERE user_id = ? ORDER BY deadline DESC']
+        self.assertEqual(goals['count'], 1)
+        self.assertEqual(goals['rows'], 2)
+
+    def test_slow_query_log(self):
+        '''
+        Checks that slow statements are logged with their query plan.
+        '''
+        print('(' + self.test_slow_query_log.__name__ + ')', \
+              self.test_slow_query_log.__doc__)
+        ENGINE.set_instrumentation(True, slow_query_threshold=0)
+        try:
+            with self.assertLogs('src.db.instrumentation', 'WARNING') as logs:
+                self.connection.get_goal(1)
+        finally:
+            ENGINE.set_instrumentation(False)
+            ENGINE.reset_stats()
+        self.assertIn(constants.SQL_SELECT_GOAL_BY_ID, logs.output[-1])
+        self.assertIn('SEARCH goals', logs.output[-1])
+
+    def test_metrics(self):
+        '''
+        Checks that the metrics are rendered in the Prometheus text format.
+        '''
+        print('(' + self.test_metrics.__name__ + ')', \
+              self.test_metrics.__doc__)
+        ENGINE.metrics.enabled = True
+        try:
+            self.connection.get_goal(1)
+            self.connection.create_goal(1, 'Title', 'sports', 'Description')
+            with self.assertRaises(ValueError):
+                self.connection.get_goals(before='tomorrow')
+            self.connection.set_foreign_keys_support()
+            self.connection.contains_resource(1)
+            text = ENGINE.render_metrics()
+        finally:
+            ENGINE.metrics.enabled = False
+        self.assertIn('# TYPE goalz_connection_call_seconds histogram', text)
+        self.assertIn('goalz_connection_call_seconds_count{method="get_goal"} 1',
+                      text)
+        self.assertIn('goalz_connection_errors_total{method="get_goals"} 1', text)
+        # Only the outermost calls are recorded
+        self.assertIn('goalz_connection_call_seconds_count'
+                      '{method="set_foreign_keys_support"} 1', text)
+        self.assertIn('goalz_connection_call_seconds_count'
+                      '{method="contains_resource"} 1', text)
+        self.assertNotIn('method="get_resource"', text)
+        self.assertIn('goalz_open_connections 1', text)
+        self.assertRegex(text, r'goalz_commits_total \d+')
+        self.assertRegex(text, r'goalz_database_size_bytes [1-9]\d*')
+
+    def test_profile(self):
+        '''
+        Checks that the profiling splits the time of the calls into phases.
+        '''
+        print('(' + self.test_profile.__name__ + ')', \
+              self.test_profile.__doc__)
+        ENGINE.set_profiling(True)
+        try:
+            self.connection.get_users()
+            self.connection.get_users()
+            self.connection.create_goal(1, 'Title', 'sports', 'Description')
+            stats = ENGINE.profile_stats()
+            folded = ENGINE.profiler.folded()
+        finally:
+            ENGINE.set_profiling(False)
+            ENGINE.reset_profile()
+        users = stats['get_users']
+        self.assertEqual(users['calls'], 2)
+        self.assertGreater(users['execute'], 0)
+        self.assertGreater(users['fetch'], 0)
+        self.assertGreater(users['build'], 0)
+        self.assertLessEqual(sum(users[phase] for phase in PHASES),
+                             users['total'])
+        # The helpers called by the methods are part of their phases
+        self.assertGreater(users['pragma'], 0)
+        self.assertEqual(set(stats), {'get_users', 'create_goal'})
+        self.assertGreater(stats['create_goal']['commit'], 0)
+        self.assertRegex(folded, r'get_users;fetch \d+')
+
+    def test_observe_generator(self):
+        '''
+        Checks that the metrics and the profile of a method returning a
+        generator include the time spent producing its items.
+        '''
+        print('(' + self.test_observe_generator.__name__ + ')', \
+              self.test_observe_generator.__doc__)
+        ENGINE.metrics.enabled = True
+        ENGINE.set_profiling(True)
+        try:
+            goals = self.connection.get_due_goals(batch_size=2)
+            stats = ENGINE.profile_stats()
+            self.assertNotIn('get_due_goals', ENGINE.render_metrics())
+            self.assertEqual(stats['get_due_goals']['build'], 0)
+            self.assertEqual(len(list(goals)), 8)
+            stats = ENGINE.profile_stats()
+            text = ENGINE.render_metrics()
+            # A generator closed before its end is recorded too
+            goals = self.connection.get_due_goals(batch_size=2)
+            next(goals)
+            goals.close()
+            closed_text = ENGINE.render_metrics()
+        finally:
+            ENGINE.metrics.enabled = False
+            ENGINE.set_profiling(False)
+            ENGINE.reset_profile()
+        due_goals = stats['get_due_goals']
+        self.assertEqual(due_goals['calls'], 1)
+        self.assertGreater(due_goals['execute'], 0)
+        self.assertGreater(due_goals['fetch'], 0)
+        self.assertGreater(due_goals['build'], 0)
+        self.assertIn(
+            'goalz_connection_call_seconds_count{method="get_due_goals"} 1',
+            text)
+        self.assertIn(
+            'goalz_connection_call_seconds_count{method="get_due_goals"} 2',
+            closed_text)
+
+    def test_in_memory(self):
+        '''
+        Checks that the in-memory mode only writes the database file when it
+        is persisted.
+        '''
+        print('(' + self.test_in_memory.__name__ + ')', \
+              self.test_in_memory.__doc__)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'memory.db')
+        try:
+            self.connection.close()
+            shutil.copyfile(DB_PATH, path)
+            memory_engine = engine.Engine(path, in_memory=True)
+            con = memory_engine.connect()
+            goal_id = con.create_goal(1, 'Title', 'sports', 'Description')
+            self.assertEqual(con.get_goal(goal_id)['title'], 'Title')
+            con.close()
+            disk = engine.Engine(path).connect()
+            self.assertIsNone(disk.get_goal(goal_id))
+            disk.close()
+            self.assertTrue(memory_engine.persist())
+            self.assertFalse(memory_engine.persist())
+            disk = engine.Engine(path).connect()
+            self.assertEqual(disk.get_goal(goal_id)['title'], 'Title')
+            disk.close()
+            con = memory_engine.connect()
+            con.delete_goal(goal_id)
+            con.close()
+            memory_engine.close()
+            disk = engine.Engine(path).connect()
+            self.assertIsNone(disk.get_goal(goal_id))
+            disk.close()
+        finally:
+            shutil.rmtree(directory)
+            self.connection = ENGINE.connect()
+
+    def test_performance_profile(self):
+        '''
+        Checks that the performance profiles configure the connections and the
+        page size of the database.
+        '''
+        print('(' + self.test_performance_profile.__name__ + ')', \
+              self.test_performance_profile.__doc__)
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'profile.db')
+        try:
+            profile_engine = engine.Engine(path,
+                                           performance_profile='read_heavy')
+            profile_engine.create_tables()
+            con = profile_engine.connect()
+            pragmas = [con.con.execute('PRAGMA %s' % pragma).fetchone()[0]
+                       for pragma in ('page_size', 'cache_size', 'mmap_size',
+                                      'temp_store')]
+            con.close()
+            self.assertEqual(pragmas, [8192, -65536, 268435456, 2])
+            profile_engine.set_performance_profile('low_memory', rebuild=True)
+            con = profile_engine.connect()
+            self.assertEqual(con.con.execute('PRAGMA page_size').fetchone()[0],
+                             4096)
+            self.assertEqual(con.con.execute('PRAGMA cache_size').fetchone()[0],
+                             -512)
+            con.close()
+            with self.assertRaises(ValueError):
+                profile_engine.set_performance_profile('fastest')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_maintain(self):
+        '''
+        Checks that the maintenance analyzes the database and returns the
+        pages freed by deletions to the filesystem.
+        '''
+        print('(' + self.test_maintain.__name__ + ')', \
+              self.test_maintain.__doc__)
+        con = self.connection.con
+        con.executemany('INSERT INTO goals (user_id, title, description) \
+                         VALUES (1, ?, ?)',
+                        (('Goal', 'x' * 2000) for _ in range(200)))
+        con.commit()
+        self.connection.delete_user(1)
+        size = os.path.getsize(DB_PATH)
+        self.assertEqual(ENGINE.maintain(), ['optimize', 'analyze', 'vacuum'])
+        self.assertLess(os.path.getsize(DB_PATH), size)
+        self.assertEqual(con.execute('PRAGMA freelist_count').fetchone()[0], 0)
+        self.assertIsNotNone(con.execute(constants.SQL_SELECT_STAT1_TABLE)
+                             .fetchone())
+        # Writes of other connections postpone the next tick
+        self.connection.create_goal(2, 'Title', 'sports', 'Description')
+        self.assertEqual(ENGINE.maintenance.tick(), [])
+        self.assertEqual(ENGINE.maintenance.tick(), ['optimize'])
+        ENGINE.maintenance.disconnect()
+
+    def test_soft_delete(self):
+        '''
+        Checks that in soft delete mode the deleted rows and their dependents
+        are hidden until the maintenance purges them.
+        '''
+        print('(' + self.test_soft_delete.__name__ + ')', \
+              self.test_soft_delete.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_goal(6))
+            self.assertFalse(connection.delete_goal(6))
+            self.assertTrue(connection.delete_user(4))
+            self.assertTrue(connection.delete_resource(1))
+            #Goals 8 and 9 are sub-goals of 6, resources 4 and 5 are posted
+            #on the goal of the user 4
+            for goal_id in (6, 8, 9, 5):
+                self.assertIsNone(connection.get_goal(goal_id))
+            for resource_id in (1, 4, 5):
+                self.assertIsNone(connection.get_resource(resource_id))
+            self.assertEqual(connection.get_goals(user_id=5), [])
+            self.assertEqual(connection.count_goals(), INITIAL_GOALS_SIZE - 4)
+            self.assertEqual(connection.count_resources(),
+                             INITIAL_RESOURCES_SIZE - 3)
+            self.assertIsNone(connection.get_user_public(nickname='Alfitra'))
+            self.assertIsNone(connection.get_user_id('Alfitra'))
+            self.assertIsNone(connection.create_goal(5, 'Title', 'physics',
+                                                     'Description', 8))
+            self.assertIsNone(connection.create_user('Alfitra', {}))
+            #The rows are only tombstoned
+            con = self.connection.con
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM goals')
+                             .fetchone()[0], INITIAL_GOALS_SIZE)
+            self.assertEqual(soft.maintain()[0], 'purge')
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM goals')
+                             .fetchone()[0], INITIAL_GOALS_SIZE - 4)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM resources')
+                             .fetchone()[0], INITIAL_RESOURCES_SIZE - 3)
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM user_profile \
+                             WHERE user_id = 4').fetchone()[0], 0)
+            self.assertEqual(soft.purge(), 0)
+            self.assertEqual(connection.count_goals(), INITIAL_GOALS_SIZE - 4)
+        finally:
+            connection.close()
+            soft.close()
+
 if __name__ == '__main__':
     print('Start running database tests')
     unittest.main()
@@ -45,10 +45,12 @@ List of users and users public data has the data dictionary contains:
 
 Reference: Code adapted and modified from PWP2018 exercise
 '''
-import sqlite3, unittest
-from src.db import engine
+import base64, json, os, sqlite3, unittest
+from src.db import engine, constants
+from src.db.instrumentation import statement_shape
 #Path to the database file, different from the deployment db
-DB_PATH = 'db/goalz_test.db'
+DB_PATH = os.environ.get(constants.TEST_DB_PATH_ENV,
+                         constants.DEFAULT_TEST_DB_PATH)
 ENGINE = engine.Engine(DB_PATH)
 
 #CONSTANTS DEFINING DIFFERENT USERS AND USER PROPERTIES
@@ -122,12 +124,13 @@ class UserDBAPITestCase(unittest.TestCase):
         '''
         print("Testing ", cls.__name__)
         ENGINE.remove_database()
-        ENGINE.create_tables()
+        ENGINE.create_template()
 
     @classmethod
     def tearDownClass(cls):
         '''Remove the testing database'''
         print("Testing ENDED for ", cls.__name__)
+        ENGINE.drop_template()
         ENGINE.remove_database()
 
     def setUp(self):
@@ -135,17 +138,16 @@ class UserDBAPITestCase(unittest.TestCase):
         Populates the database
         '''
         try:
-            ENGINE.populate_tables()
+            ENGINE.reset_database()
             self.connection = ENGINE.connect()
         except Exception as e:
             ENGINE.clear()
 
     def tearDown(self):
         '''
-        Close underlying connection and remove all records from database
+        Close underlying connection
         '''
         self.connection.close()
-        ENGINE.clear()
 
     def test_create_user_object(self):
         '''
@@ -188,6 +190,30 @@ class UserDBAPITestCase(unittest.TestCase):
         user = self.connection.get_user(USER2_ID)
         self.assertDictContainsSubset(user, USER2)
 
+    def test_get_user_if_changed(self):
+        '''
+        Test that get_user_if_changed returns the user only when its version
+        is not the known one, the profile being part of the user
+        '''
+        print('('+self.test_get_user_if_changed.__name__+')', \
+              self.test_get_user_if_changed.__doc__)
+        version, user = self.connection.get_user_if_changed(USER1_ID)
+        self.assertEqual(version, 1)
+        self.assertDictContainsSubset(user, USER1)
+        self.assertEqual(self.connection.get_user_if_changed(USER1_ID, version),
+                         (version, None))
+        #The password and the profile are modified: a single new version
+        self.connection.modify_user(USER1_ID, MODIFIED_USER1)
+        version, user = self.connection.get_user_if_changed(USER1_ID, version)
+        self.assertEqual(version, 2)
+        self.assertEqual(user['public_profile']['website'],
+                         MODIFIED_USER1['website'])
+        self.connection.modify_user(USER1_ID, {'age': 30})
+        self.assertEqual(self.connection.get_user_if_changed(USER1_ID,
+                                                             version)[0], 3)
+        self.assertIsNone(self.connection.get_user_if_changed(USER_WRONG_ID,
+                                                              1))
+
     def test_get_user_by_nickname(self):
         '''
         Test get_user with nickname (Chouaib and Daniel)
@@ -289,6 +315,179 @@ class UserDBAPITestCase(unittest.TestCase):
             elif user['nickname'] == USER2_NICKNAME:
                 self.assertDictContainsSubset(user, USER2['public_profile'])
 
+    def test_get_users_pages(self):
+        '''
+        Test that get_users returns the sorted users page by page
+        '''
+        print('('+self.test_get_users_pages.__name__+')', \
+              self.test_get_users_pages.__doc__)
+        for sort_by, key in (('nickname', 'nickname'),
+                             ('registration_date', 'registration_date'),
+                             ('rating', 'rating')):
+            for descending in (False, True):
+                users = self.connection.get_users(sort_by=sort_by,
+                                                  descending=descending)
+                self.assertEqual(len(users), INITIAL_SIZE)
+                values = [user[key] or 0 for user in users]
+                self.assertEqual(values, sorted(values, reverse=descending))
+                #Read the same users in pages of 2
+                pages = []
+                after = None
+                while True:
+                    page = self.connection.get_users(2, sort_by, descending,
+                                                     after)
+                    if not page:
+                        break
+                    self.assertLessEqual(len(page), 2)
+                    pages.extend(page)
+                    after = page.cursor
+                self.assertEqual(pages, users)
+                self.assertIsNone(page.cursor)
+        with self.assertRaises(ValueError):
+            self.connection.get_users(after=USER_WRONG_NICKNAME)
+        with self.assertRaises(ValueError):
+            self.connection.get_users(sort_by='nickname',
+                                      after=self.connection.get_users(1).cursor)
+        with self.assertRaises(ValueError):
+            self.connection.get_users(sort_by='password')
+
+    def test_get_users_pages_deleted_user(self):
+        '''
+        Test that the pagination of get_users continues after the last user
+        of a page is deleted
+        '''
+        print('('+self.test_get_users_pages_deleted_user.__name__+')', \
+              self.test_get_users_pages_deleted_user.__doc__)
+        for sort_by in (None, 'nickname', 'registration_date', 'rating'):
+            self.connection.close()
+            ENGINE.reset_database()
+            self.connection = ENGINE.connect()
+            users = self.connection.get_users(sort_by=sort_by)
+            page = self.connection.get_users(2, sort_by)
+            user_id = self.connection.get_user_id(page[-1]['nickname'])
+            self.assertTrue(self.connection.delete_user(user_id))
+            self.assertEqual(self.connection.get_users(sort_by=sort_by,
+                                                       after=page.cursor),
+                             users[2:])
+
+    def test_get_users_pages_null_nicknames(self):
+        '''
+        Test that get_users returns every user with a NULL nickname when
+        paginating by nickname
+        '''
+        print('('+self.test_get_users_pages_null_nicknames.__name__+')', \
+              self.test_get_users_pages_null_nicknames.__doc__)
+        with self.connection.con:
+            self.connection.con.execute('UPDATE users SET nickname = NULL \
+                                         WHERE user_id > 3')
+        for descending in (False, True):
+            users = self.connection.get_users(sort_by='nickname',
+                                              descending=descending)
+            self.assertEqual(len(users), INITIAL_SIZE)
+            pages = []
+            after = None
+            while True:
+                page = self.connection.get_users(1, 'nickname', descending,
+                                                 after)
+                if not page:
+                    break
+                pages.extend(page)
+                after = page.cursor
+            self.assertEqual(pages, users)
+
+    def test_get_users_tampered_cursor(self):
+        '''
+        Test that get_users rejects a cursor whose values are not sort values
+        '''
+        print('('+self.test_get_users_tampered_cursor.__name__+')', \
+              self.test_get_users_tampered_cursor.__doc__)
+        for sort_by, value, user_id in (('nickname', [1], 1),
+                                        ('nickname', {'a': 1}, 1),
+                                        ('nickname', True, 1),
+                                        ('nickname', 'a', '1'),
+                                        ('rating', None, 1),
+                                        (None, None, 1)):
+            data = json.dumps([sort_by, value, user_id]).encode('utf-8')
+            after = base64.urlsafe_b64encode(data).decode('ascii')
+            with self.assertRaises(ValueError):
+                self.connection.get_users(sort_by=sort_by, after=after)
+
+    def test_get_user_summary(self):
+        '''
+        Test that get_user_summary aggregates the goals and resources of a user
+        '''
+        print('('+self.test_get_user_summary.__name__+')', \
+              self.test_get_user_summary.__doc__)
+        summary = self.connection.get_user_summary(4)
+        self.assertEqual(summary['goals'], {'total': 1, 'not_started': 0,
+                                            'in_progress': 1, 'done': 0})
+        self.assertEqual(summary['resources'], 2)
+        self.assertAlmostEqual(summary['average_rating'], 0.775)
+        self.assertEqual(summary['required_time'], 90)
+        summary = self.connection.get_user_summary(5)
+        self.assertEqual(summary['goals'], {'total': 3, 'not_started': 1,
+                                            'in_progress': 2, 'done': 0})
+        self.assertEqual(summary['resources'], 0)
+        self.assertIsNone(summary['average_rating'])
+        self.assertIsNone(self.connection.get_user_summary(USER_WRONG_ID))
+
+    def test_get_user_public_with_stats(self):
+        '''
+        Test that the statistics maintained by the triggers match the summary
+        computed from the goals and resources, after they are modified
+        '''
+        print('('+self.test_get_user_public_with_stats.__name__+')', \
+              self.test_get_user_public_with_stats.__doc__)
+        user = self.connection.get_user_public(4, with_stats=True)
+        self.assertEqual(user['nickname'], 'Alfitra')
+        self.assertEqual(user['stats']['goals'], {'total': 1, 'not_started': 0,
+                                                  'in_progress': 1, 'done': 0})
+        self.assertAlmostEqual(user['stats']['average_rating'], 0.775)
+        self.assertNotIn('stats', self.connection.get_user_public(4))
+        goal_id = self.connection.create_goal(4, 'title', 'topic', 'text')
+        resource_id = self.connection.create_resource(goal_id, 4, 'title',
+                                                      'link', 'topic',
+                                                      required_time=10)
+        self.connection.modify_resource(resource_id, 0.5)
+        self.connection.modify_goal(goal_id, status=1)
+        # Deleting a user cascades to its goals and resources
+        self.connection.delete_user(5)
+        self.connection.delete_goal(2)
+        for user_id in range(1, 7):
+            user = self.connection.get_user_public(user_id, with_stats=True)
+            if user is None:
+                continue
+            summary = self.connection.get_user_summary(user_id)
+            stats = user['stats']
+            self.assertEqual(stats['goals'], summary['goals'])
+            self.assertEqual(stats['resources'], summary['resources'])
+            self.assertEqual(stats['required_time'], summary['required_time'])
+            if summary['average_rating'] is None:
+                self.assertIsNone(stats['average_rating'])
+            else:
+                self.assertAlmostEqual(stats['average_rating'],
+                                       summary['average_rating'])
+        self.assertEqual(ENGINE.check_user_stats(), [])
+
+    def test_rebuild_user_stats(self):
+        '''
+        Test that check_user_stats reports corrupted statistics and
+        rebuild_user_stats repairs them
+        '''
+        print('('+self.test_rebuild_user_stats.__name__+')', \
+              self.test_rebuild_user_stats.__doc__)
+        self.assertEqual(ENGINE.check_user_stats(), [])
+        self.connection.con.execute('UPDATE user_stats SET goals_done = 7 \
+                                     WHERE user_id = 2')
+        self.connection.con.execute('INSERT INTO user_stats (user_id) \
+                                     VALUES (?)', (USER_WRONG_ID,))
+        self.connection.con.commit()
+        self.assertEqual(ENGINE.check_user_stats(), [2, int(USER_WRONG_ID)])
+        ENGINE.rebuild_user_stats()
+        self.assertEqual(ENGINE.check_user_stats(), [])
+        user = self.connection.get_user_public(2, with_stats=True)
+        self.assertEqual(user['stats']['goals']['done'], 0)
+
     def test_delete_user(self):
         '''
         Test that the user Chouaib is deleted by id 
@@ -301,6 +500,61 @@ class UserDBAPITestCase(unittest.TestCase):
         resp2 = self.connection.get_user(USER1_ID)
         self.assertIsNone(resp2)
 
+    def test_delete_users(self):
+        '''
+        Test that delete_users deletes the users, their goals and the resources
+        of their goals, and keeps their other resources without user
+        '''
+        print('('+self.test_delete_users.__name__+')', \
+              self.test_delete_users.__doc__)
+        self.assertEqual(self.connection.delete_users([USER1_ID, USER2_ID,
+                                                       USER_WRONG_ID]), 2)
+        self.assertIsNone(self.connection.get_user(USER1_ID))
+        self.assertIsNone(self.connection.get_user(USER2_ID))
+        con = self.connection.con
+        goals = con.execute('SELECT goal_id FROM goals \
+                             WHERE goal_id IN (1, 2, 3)').fetchall()
+        self.assertEqual(goals, [])
+        resources = con.execute('SELECT resource_id, user_id FROM resources \
+                                 WHERE resource_id IN (1, 2, 3)').fetchall()
+        self.assertEqual([tuple(row) for row in resources], [(2, None)])
+        self.assertEqual(ENGINE.check_user_stats(), [])
+        # As a background job
+        self.assertEqual(ENGINE.submit('delete_users', [5]).result(), 1)
+        self.assertIsNone(self.connection.get_user_public(5))
+
+    def test_delete_users_soft_deleted(self):
+        '''
+        Test that in soft delete mode delete_users only tombstones the users,
+        and that the statistics do not count the hidden goals and resources
+        '''
+        print('('+self.test_delete_users_soft_deleted.__name__+')', \
+              self.test_delete_users_soft_deleted.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertEqual(connection.delete_users([USER1_ID, USER2_ID,
+                                                      USER_WRONG_ID]), 2)
+            self.assertIsNone(connection.get_user(USER1_ID))
+            self.assertIsNone(connection.get_user_public(USER2_ID))
+            con = self.connection.con
+            self.assertEqual(con.execute('SELECT COUNT(*) FROM users')
+                             .fetchone()[0], INITIAL_SIZE)
+            #The resource of the user 3 is posted on a goal of the user 1
+            stats = connection.get_user_public(3, with_stats=True)['stats']
+            self.assertEqual(stats['resources'], 0)
+            for user_id in range(3, 7):
+                stats = connection.get_user_public(user_id,
+                                                   with_stats=True)['stats']
+                self.assertEqual(stats, connection.get_user_summary(user_id))
+            soft.purge()
+            stats = connection.get_user_public(3, with_stats=True)['stats']
+            self.assertEqual(stats['resources'], 0)
+            self.assertEqual(soft.check_user_stats(), [])
+        finally:
+            connection.close()
+            soft.close()
+
     def test_delete_user_non_existing_id(self):
         '''
         Test delete_user with  USER_WRONG_ID (non-existing)
@@ -333,6 +587,47 @@ class UserDBAPITestCase(unittest.TestCase):
         self.assertEqual(profile['email'], resp_r_profile['email'])
         self.assertEqual(profile['age'], resp_r_profile['age'])
 
+    def test_modify_user_soft_deleted(self):
+        '''
+        Test that in soft delete mode a deleted user is not modified
+        '''
+        print('('+self.test_modify_user_soft_deleted.__name__+')', \
+              self.test_modify_user_soft_deleted.__doc__)
+        soft = engine.Engine(DB_PATH, soft_delete=True)
+        connection = soft.connect()
+        try:
+            self.assertTrue(connection.delete_user(USER1_ID))
+            self.assertIsNone(connection.modify_user(USER1_ID,
+                                                     MODIFIED_USER1))
+            self.assertIsNone(connection.modify_user(USER1_ID, {'age': 30}))
+        finally:
+            connection.close()
+            soft.close()
+        cur = self.connection.con.cursor()
+        cur.execute('SELECT users.password, user_profile.age \
+                     FROM users, user_profile WHERE users.user_id = 1 \
+                     AND user_profile.user_id = 1')
+        self.assertEqual(cur.fetchone(),
+                         (USER1['restricted_profile']['password'],
+                          USER1['restricted_profile']['age']))
+
+    def test_modify_user_partial(self):
+        '''
+        Test that modify_user only modifies the provided fields of Chouaib
+        '''
+        print('('+self.test_modify_user_partial.__name__+')', \
+              self.test_modify_user_partial.__doc__)
+        resp = self.connection.modify_user(USER1_ID, {'email': 'ch@h.com',
+                                                      'website': None})
+        self.assertEqual(resp, USER1_ID)
+        resp2 = self.connection.get_user(USER1_ID)
+        profile = dict(USER1['restricted_profile'], email='ch@h.com')
+        self.assertEqual(resp2['restricted_profile'], profile)
+        self.assertIsNone(resp2['public_profile']['website'])
+        #Nothing to modify
+        self.assertEqual(self.connection.modify_user(USER1_ID, {}), USER1_ID)
+        self.assertIsNone(self.connection.modify_user(USER_WRONG_ID, {}))
+
     def test_modify_user_non_existing_nickname(self):
         '''
         Test modify_user with  user Angelia (no-existing)
@@ -396,6 +691,36 @@ class UserDBAPITestCase(unittest.TestCase):
         id = self.connection.get_user_id(USER_WRONG_NICKNAME)
         self.assertIsNone(id)
 
+    def test_nickname_cache(self):
+        '''
+        Test that nicknames are resolved from the cache until the user is
+        deleted
+        '''
+        print('('+self.test_nickname_cache.__name__+')', \
+              self.test_nickname_cache.__doc__)
+        cached_engine = engine.Engine(DB_PATH, instrument=True,
+                                      nickname_cache_size=1)
+        connection = cached_engine.connect()
+        try:
+            user = connection.get_user(nickname=USER1_NICKNAME)
+            self.assertEqual(user, USER1)
+            self.assertEqual(connection.get_user_id(USER1_NICKNAME), USER1_ID)
+            self.assertTrue(connection.contains_user(USER1_NICKNAME))
+            stats = cached_engine.stats()
+            #A single query resolved the nickname
+            query = statement_shape(
+                constants.SQL_SELECT_USER_AND_PROFILE_BY_NICKNAME)
+            self.assertEqual(stats[query]['count'], 1)
+            self.assertNotIn(constants.SQL_SELECT_USER_BY_NICKNAME, stats)
+            self.assertEqual(cached_engine.nickname_cache.hits, 2)
+            #The least recently used nickname is evicted
+            self.assertEqual(connection.get_user_id(USER2_NICKNAME), USER2_ID)
+            self.assertEqual(len(cached_engine.nickname_cache), 1)
+            self.assertTrue(connection.delete_user(USER2_ID))
+            self.assertIsNone(connection.get_user_id(USER2_NICKNAME))
+        finally:
+            connection.close()
+
     def test_not_contains_user(self):
         '''
         Check if the database does not contain users with id Angelia